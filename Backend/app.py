@@ -1,172 +1,427 @@
-# app.py
-
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-from config import Config
-from database import db
-from models import User, CampReview
-from recommendation import recommend_campsites
-from services.maps_service import get_location_details, get_nearby_places, get_hiking_trails
-from werkzeug.security import generate_password_hash, check_password_hash
-
-def create_app():
-    app = Flask(__name__)
-    app.config.from_object(Config)
-    db.init_app(app)
-    CORS(app)
-    return app
-
-app = create_app()
-
-@app.before_first_request
-def create_tables():
-    db.create_all()
-
-@app.route("/")
-def index():
-    return jsonify({"message": "Welcome to Karaván! Where will the roads take you next?"})
-
-# User sign-up
-@app.route("/api/signup", methods=["POST"])
-def signup():
-    data = request.json
-    email = data.get("email")
-    password = data.get("password")
-
-    if User.query.filter_by(email=email).first():
-        return jsonify({"error": "Email already registered"}), 400
-
-    hashed_pw = generate_password_hash(password)
-    user = User(email=email, password_hash=hashed_pw)
-    db.session.add(user)
-    db.session.commit()
-
-    return jsonify({"message": "User created successfully", "user": user.to_dict()})
-
-# User login
-@app.route("/api/login", methods=["POST"])
-def login():
-    data = request.json
-    email = data.get("email")
-    password = data.get("password")
-
-    user = User.query.filter_by(email=email).first()
-    if not user or not check_password_hash(user.password_hash, password):
-        return jsonify({"error": "Invalid credentials"}), 401
-
-    return jsonify({"message": "Login successful", "user": user.to_dict()})
-
-# Update user preferences
-@app.route("/api/preferences", methods=["POST"])
-def update_preferences():
-    data = request.json
-    user_id = data.get("user_id")
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-
-    # Just a small example. Extend as needed:
-    user.prefers_fishing = data.get("prefers_fishing", False)
-    user.prefers_hiking = data.get("prefers_hiking", False)
-    user.prefers_solitude = data.get("prefers_solitude", False)
-
-    db.session.commit()
-    return jsonify({"message": "Preferences updated", "user": user.to_dict()})
-
-# Get location details from address
-@app.route("/api/location", methods=["GET"])
-def get_location():
-    address = request.args.get("address")
-    if not address:
-        return jsonify({"error": "Address is required"}), 400
-
-    location = get_location_details(address)
-    if not location:
-        return jsonify({"error": "Location not found"}), 404
-
-    return jsonify(location)
-
-# Get nearby places
-@app.route("/api/places", methods=["GET"])
-def get_places():
-    lat = request.args.get("lat", type=float)
-    lon = request.args.get("lon", type=float)
-    radius = request.args.get("radius", type=int, default=50000)
-    place_type = request.args.get("type", default="campground")
-
-    if not lat or not lon:
-        return jsonify({"error": "Latitude and longitude are required"}), 400
-
-    places = get_nearby_places(lat, lon, radius, place_type)
-    return jsonify(places)
-
-# Get hiking trails
-@app.route("/api/trails", methods=["GET"])
-def get_trails():
-    lat = request.args.get("lat", type=float)
-    lon = request.args.get("lon", type=float)
-    radius = request.args.get("radius", type=int, default=50000)
-
-    if not lat or not lon:
-        return jsonify({"error": "Latitude and longitude are required"}), 400
-
-    trails = get_hiking_trails(lat, lon, radius)
-    return jsonify(trails)
-
-# Get recommendations
-@app.route("/api/recommendations", methods=["POST"])
-def get_recommendations():
-    data = request.json
-    user_lat = data.get("lat")
-    user_lon = data.get("lon")
-    user_id = data.get("user_id")
-
-    if not (user_lat and user_lon):
-        return jsonify({"error": "Latitude and longitude are required"}), 400
-
-    user = User.query.get(user_id) if user_id else None
-    user_prefs = {}
-    if user:
-        # Build user preferences from DB
-        user_prefs["prefers_fishing"] = user.prefers_fishing
-        user_prefs["prefers_hiking"] = user.prefers_hiking
-        user_prefs["prefers_solitude"] = user.prefers_solitude
-    
-    # Merge in any additional preferences from the request
-    user_prefs.update(data.get("preferences", {}))
-
-    recommendations = recommend_campsites(user_lat, user_lon, user_prefs)
-    return jsonify(recommendations)
-
-# Post a review
-@app.route("/api/review", methods=["POST"])
-def post_review():
-    data = request.json
-    user_id = data.get("user_id")
-    campsite_name = data.get("campsite_name")
-    rating = data.get("rating", 5)
-    review_text = data.get("review_text", "")
-
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-
-    review = CampReview(
-        user_id=user_id,
-        campsite_name=campsite_name,
-        rating=rating,
-        review_text=review_text
-    )
-    db.session.add(review)
-    db.session.commit()
-
-    return jsonify({"message": "Review posted", "review": review.to_dict()})
-
-# Get reviews for a campsite
-@app.route("/api/reviews/<campsite_name>", methods=["GET"])
-def get_reviews(campsite_name):
-    reviews = CampReview.query.filter_by(campsite_name=campsite_name).all()
-    return jsonify([r.to_dict() for r in reviews])
-
-if __name__ == "__main__":
-    app.run(debug=True)
+# app.py
+
+import json
+import click
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from flask_cors import CORS
+from config import Config
+from database import db
+from models import User
+from cache import get_cache
+from records import Record, Packed, json_default
+from instrumentation import init_app as init_instrumentation, render_metrics
+from responses import shape, shape_options, compact_directions, is_true, first_page, next_page, ndjson, wants_ndjson
+from reviews import add_review, page_reviews, community_ratings, rebuild_aggregates
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Recommendation, catalog and upstream service modules (and googlemaps,
+# numpy, requests behind them) are imported by the handlers that use them,
+# so a worker boots without loading them.
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """Writes records (places, weather, ...) in their JSON shape as responses are serialized"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (Record, Packed)):
+            return json_default(o)
+        return DefaultJSONProvider.default(o)
+
+def create_app():
+    app = Flask(__name__)
+    app.json = RecordJSONProvider(app)
+    app.config.from_object(Config)
+    db.init_app(app)
+    CORS(app)
+    init_instrumentation(app)
+    if app.config["CATALOG_SYNC_ENABLED"]:
+        from catalog import start_catalog_sync
+        start_catalog_sync(app)
+    if app.config["PREWARM_ENABLED"]:
+        from prewarm import start_prewarm
+        start_prewarm(app)
+    return app
+
+app = create_app()
+
+@app.route("/")
+def index():
+    return jsonify({"message": "Welcome to Karaván! Where will the roads take you next?"})
+
+# User sign-up
+@app.route("/api/signup", methods=["POST"])
+def signup():
+    data = request.json
+    email = data.get("email")
+    password = data.get("password")
+
+    if User.query.filter_by(email=email).first():
+        return jsonify({"error": "Email already registered"}), 400
+
+    hashed_pw = generate_password_hash(password)
+    user = User(email=email, password_hash=hashed_pw)
+    db.session.add(user)
+    db.session.commit()
+
+    return jsonify({"message": "User created successfully", "user": user.to_dict()})
+
+# User login
+@app.route("/api/login", methods=["POST"])
+def login():
+    data = request.json
+    email = data.get("email")
+    password = data.get("password")
+
+    user = User.query.filter_by(email=email).first()
+    if not user or not check_password_hash(user.password_hash, password):
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    return jsonify({"message": "Login successful", "user": user.to_dict()})
+
+# Update user preferences
+@app.route("/api/preferences", methods=["POST"])
+def update_preferences():
+    data = request.json
+    user_id = data.get("user_id")
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    # Just a small example. Extend as needed:
+    user.prefers_fishing = data.get("prefers_fishing", False)
+    user.prefers_hiking = data.get("prefers_hiking", False)
+    user.prefers_solitude = data.get("prefers_solitude", False)
+
+    db.session.commit()
+    return jsonify({"message": "Preferences updated", "user": user.to_dict()})
+
+# Get location details from address
+@app.route("/api/location", methods=["GET"])
+def get_location():
+    from services.geocode_service import get_location_details
+    address = request.args.get("address")
+    if not address:
+        return jsonify({"error": "Address is required"}), 400
+
+    location = get_location_details(address)
+    if not location:
+        return jsonify({"error": "Location not found"}), 404
+
+    return jsonify(location)
+
+# Place name suggestions from the bundled gazetteer, for type-ahead
+@app.route("/api/location/suggest", methods=["GET"])
+def suggest_locations():
+    from services.geocode_service import get_gazetteer
+    prefix = request.args.get("q", "")
+    limit = min(request.args.get("limit", 10, type=int), 50)
+    gazetteer = get_gazetteer()
+    if not prefix or gazetteer is None:
+        return jsonify([])
+    return jsonify(gazetteer.complete(prefix, limit))
+
+def places_response(places):
+    """Place list shaped by fields=/compact=, as JSON or (format=ndjson) streamed"""
+    fields, compact = shape_options(request.args)
+    count = len(places)
+    places = shape(places, fields, compact)
+    if wants_ndjson(request, request.args):
+        return Response(ndjson({"count": count}, places), mimetype="application/x-ndjson")
+    return jsonify(list(places))
+
+# Get nearby places
+@app.route("/api/places", methods=["GET"])
+def get_places():
+    from services.maps_service import get_nearby_places
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius = request.args.get("radius", type=int, default=50000)
+    place_type = request.args.get("type", default="campground")
+
+    if not lat or not lon:
+        return jsonify({"error": "Latitude and longitude are required"}), 400
+
+    return places_response(get_nearby_places(lat, lon, radius, place_type))
+
+# Get hiking trails
+@app.route("/api/trails", methods=["GET"])
+def get_trails():
+    from services.maps_service import get_hiking_trails
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius = request.args.get("radius", type=int, default=50000)
+
+    if not lat or not lon:
+        return jsonify({"error": "Latitude and longitude are required"}), 400
+
+    return places_response(get_hiking_trails(lat, lon, radius))
+
+# Turn-by-turn driving directions to the place a user picks
+@app.route("/api/directions", methods=["GET"])
+def get_place_directions():
+    from services.maps_service import get_directions
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    place_id = request.args.get("place_id")
+
+    if not lat or not lon or not place_id:
+        return jsonify({"error": "Latitude, longitude and place_id are required"}), 400
+
+    directions = get_directions(lat, lon, place_id)
+    if not directions:
+        return jsonify({"error": "No route found"}), 404
+
+    if is_true(request.args.get("compact")):
+        directions = compact_directions(directions)
+    return jsonify(directions)
+
+# Get recommendations
+def _user_preferences(data):
+    """Stored preferences of the request's user, overridden by the request's own"""
+    user_id = data.get("user_id")
+    user = User.query.get(user_id) if user_id else None
+    user_prefs = {}
+    if user:
+        # Build user preferences from DB
+        user_prefs["prefers_fishing"] = user.prefers_fishing
+        user_prefs["prefers_hiking"] = user.prefers_hiking
+        user_prefs["prefers_solitude"] = user.prefers_solitude
+    
+    # Merge in any additional preferences from the request
+    user_prefs.update(data.get("preferences", {}))
+    return user_prefs
+
+@app.route("/api/recommendations", methods=["POST"])
+def get_recommendations():
+    from recommendation import recommend_campsites
+    data = request.json
+    user_lat = data.get("lat")
+    user_lon = data.get("lon")
+
+    if not (user_lat and user_lon):
+        return jsonify({"error": "Latitude and longitude are required"}), 400
+
+    user_prefs = _user_preferences(data)
+
+    # The AI summary is generated in the background unless asked for inline
+    async_summary = data.get("summary", "async") != "inline"
+    recommendations = recommend_campsites(user_lat, user_lon, user_prefs, async_summary=async_summary)
+    return first_page_response(recommendations, data)
+
+# Rescore the candidates of an earlier /api/recommendations response (its
+# candidate_set) for new preferences or a nearby origin; no upstream calls
+@app.route("/api/recommendations/rerank", methods=["POST"])
+def rerank_recommendations():
+    from recommendation import rerank
+    data = request.json
+    candidate_set = data.get("candidate_set")
+    if not candidate_set:
+        return jsonify({"error": "candidate_set is required"}), 400
+
+    user_lat, user_lon = data.get("lat"), data.get("lon")
+    if not (user_lat and user_lon):
+        user_lat = user_lon = None
+    try:
+        recommendations = rerank(candidate_set, _user_preferences(data), user_lat, user_lon)
+    except ValueError as e:
+        return jsonify({"error": f"{str(e)}; request recommendations again"}), 400
+    if recommendations is None:
+        return jsonify({"error": "Candidates expired; request recommendations again"}), 410
+    return first_page_response(recommendations, data)
+
+# Further pages of a paged recommendations response
+@app.route("/api/recommendations/results", methods=["GET"])
+def get_recommendation_results():
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return jsonify({"error": "Cursor required"}), 400
+    try:
+        results, next_cursor = next_page(cursor, _results_limit(request.args.get("limit")))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    if results is None:
+        return jsonify({"error": "Results expired; request recommendations again"}), 410
+    return recommendations_response({"next_cursor": next_cursor}, results, None, request.args)
+
+def _results_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = app.config["RESULTS_PAGE_SIZE"]
+    return max(1, min(limit, app.config["RESULTS_MAX_PAGE_SIZE"]))
+
+def first_page_response(recommendations, data):
+    """Optional paging (limit), projection (fields, compact) and streaming (format=ndjson)"""
+    results = recommendations.pop("results")
+    trails = recommendations.pop("hiking_trails")
+    if data.get("limit"):
+        results, recommendations["next_cursor"] = first_page(results, _results_limit(data.get("limit")))
+    return recommendations_response(recommendations, results, trails, data)
+
+def recommendations_response(meta, results, trails, source):
+    """Shape results (and trails) per the request and send them as JSON or NDJSON"""
+    fields, compact = shape_options(source)
+    results = shape(results, fields, compact)
+    if trails is not None:
+        trails = shape(trails, None, compact)
+    if wants_ndjson(request, source):
+        return Response(ndjson(meta, results, trails or ()), mimetype="application/x-ndjson")
+    payload = {**meta, "results": list(results)}
+    if trails is not None:
+        payload["hiking_trails"] = list(trails)
+    return jsonify(payload)
+
+# Recommendations for several origins (e.g. the stops of a trip) in one request.
+# Streams one JSON line per origin, in completion order, tagged with its index.
+@app.route("/api/recommendations/batch", methods=["POST"])
+def get_batch_recommendations():
+    from recommendation import recommend_batch
+    data = request.json
+    origins = data.get("origins")
+
+    if not isinstance(origins, list) or not origins:
+        return jsonify({"error": "A list of origins is required"}), 400
+    if len(origins) > app.config["BATCH_MAX_ORIGINS"]:
+        return jsonify({"error": f"At most {app.config['BATCH_MAX_ORIGINS']} origins per batch"}), 400
+    if not all(isinstance(o, dict) and o.get("lat") and o.get("lon") for o in origins):
+        return jsonify({"error": "Latitude and longitude are required for every origin"}), 400
+
+    shared_prefs = _user_preferences(data)
+    origins = [
+        {"lat": o["lat"], "lon": o["lon"], "preferences": {**shared_prefs, **o.get("preferences", {})}}
+        for o in origins
+    ]
+    async_summary = data.get("summary", "async") != "inline"
+    fields, compact = shape_options(data)
+
+    def stream():
+        for index, recommendation in recommend_batch(origins, async_summary=async_summary):
+            if "results" in recommendation:
+                recommendation["results"] = list(shape(recommendation["results"], fields, compact))
+                recommendation["hiking_trails"] = list(shape(recommendation["hiking_trails"], None, compact))
+            yield json.dumps({"index": index, **recommendation}, default=json_default) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype="application/x-ndjson")
+
+# Fetch (long-poll) or stream (Server-Sent Events) an AI summary job
+@app.route("/api/recommendations/summary/<job_id>", methods=["GET"])
+def get_recommendation_summary(job_id):
+    from summary_jobs import get_summary
+    if request.accept_mimetypes.best == "text/event-stream":
+        return Response(stream_with_context(stream_summary(job_id)), mimetype="text/event-stream")
+
+    wait = min(request.args.get("wait", type=float, default=0), app.config["SUMMARY_MAX_WAIT"])
+    state = get_summary(job_id, wait=wait)
+    if state is None:
+        return jsonify({"error": "Summary job not found"}), 404
+    return jsonify(state)
+
+def stream_summary(job_id):
+    """Yield SSE keep-alives while the job is pending, then its final state"""
+    from summary_jobs import get_summary
+    stream_timeout = app.config["SUMMARY_STREAM_TIMEOUT"]
+    for _ in range(max(1, int(stream_timeout // app.config["SUMMARY_MAX_WAIT"]))):
+        state = get_summary(job_id, wait=app.config["SUMMARY_MAX_WAIT"])
+        if state is None:
+            yield "event: error\ndata: {\"error\": \"Summary job not found\"}\n\n"
+            return
+        if state["status"] != "pending":
+            yield f"event: summary\ndata: {json.dumps(state)}\n\n"
+            return
+        yield ": pending\n\n"
+    yield "event: timeout\ndata: {}\n\n"
+
+# Post a review
+@app.route("/api/review", methods=["POST"])
+def post_review():
+    data = request.json
+    user_id = data.get("user_id")
+    campsite_name = data.get("campsite_name")
+    rating = data.get("rating", 5)
+    review_text = data.get("review_text", "")
+
+    if not isinstance(rating, int) or not 1 <= rating <= 5:
+        return jsonify({"error": "Rating must be a whole number from 1 to 5"}), 400
+
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    review = add_review(user_id, campsite_name, rating, review_text)
+
+    return jsonify({"message": "Review posted", "review": review.to_dict()})
+
+def _page_args():
+    """Validated (limit, after) from the query string"""
+    limit = request.args.get("limit", type=int)
+    after = request.args.get("after", type=int)
+    if limit is not None:
+        limit = max(1, min(limit, app.config["REVIEWS_MAX_PAGE_SIZE"]))
+    return limit, after
+
+# Get reviews for a campsite
+@app.route("/api/reviews/<campsite_name>", methods=["GET"])
+def get_reviews(campsite_name):
+    limit, after = _page_args()
+    reviews = page_reviews(campsite_name, limit, after)
+    return jsonify([r.to_dict() for r in reviews])
+
+# Page through a campsite's reviews, with its rating summary
+@app.route("/api/reviews", methods=["GET"])
+def list_reviews():
+    campsite_name = request.args.get("campsite")
+    if not campsite_name:
+        return jsonify({"error": "Campsite name required"}), 400
+
+    limit, after = _page_args()
+    limit = limit or app.config["REVIEWS_PAGE_SIZE"]
+    reviews = page_reviews(campsite_name, limit + 1, after)
+    has_more = len(reviews) > limit
+    reviews = reviews[:limit]
+    return jsonify({
+        "reviews": [r.to_dict() for r in reviews],
+        "next_cursor": reviews[-1].id if has_more else None,
+        "summary": community_ratings([campsite_name]).get(campsite_name)
+    })
+
+# Create any missing tables; run once per deploy, before workers start.
+# Adds new tables only: existing tables are not altered.
+@app.cli.command("init-db")
+def init_db():
+    db.create_all()
+    click.echo(f"Database ready: {', '.join(sorted(db.metadata.tables))}")
+
+# Recompute review aggregates, e.g. after importing reviews directly
+@app.cli.command("rebuild-review-aggregates")
+def rebuild_review_aggregates():
+    click.echo(f"Rebuilt aggregates for {rebuild_aggregates()} campsites")
+
+# Cache hit/miss/eviction counters
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(get_cache().stats())
+
+# Prometheus scrape endpoint: request, stage and upstream latency histograms
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# Refresh the campsite catalog: one region with --lat/--lon, else the stalest regions
+@app.cli.command("sync-catalog")
+@click.option("--lat", type=float)
+@click.option("--lon", type=float)
+@click.option("--radius", type=int, default=50000)
+def sync_catalog(lat, lon, radius):
+    from catalog import sync_region, sync_stale_regions
+    if lat is not None and lon is not None:
+        count = sync_region(lat, lon, radius)
+        click.echo(f"Synced {count} places around {lat},{lon}")
+    else:
+        click.echo(f"Refreshed {sync_stale_regions()} regions")
+
+if __name__ == "__main__":
+    # The development server sets up its own tables
+    with app.app_context():
+        db.create_all()
+    app.run(debug=True)
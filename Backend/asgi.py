@@ -0,0 +1,152 @@
+# asgi.py
+"""
+ASGI entry point for the async serving mode:
+
+    flask --app app init-db   # once per deploy, creates missing tables
+    hypercorn asgi:app
+
+The upstream-bound endpoints (recommendations, places, trails) are served
+by async handlers that await every upstream call on one event loop, so a
+worker holds many slow requests without a thread each. Every other route
+is the regular Flask app, run through an ASGI-to-WSGI adapter.
+"""
+
+import time
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, Response, g, request, jsonify
+from werkzeug.exceptions import HTTPException
+from app import app as flask_app, RecordJSONProvider, _user_preferences, _results_limit
+from async_recommendation import recommend_campsites, run_blocking
+from responses import shape, shape_options, first_page, ndjson, wants_ndjson
+from services.async_upstreams import AsyncUpstreams
+from instrumentation import REQUEST_SECONDS, begin_trace, end_trace, current_trace
+
+def create_async_app(wsgi_app):
+    async_app = Quart(__name__, static_folder=None)
+    async_app.json = RecordJSONProvider(async_app)
+    async_app.upstreams = None
+
+    @async_app.before_serving
+    async def open_upstreams():
+        async_app.upstreams = AsyncUpstreams(wsgi_app.config)
+
+    @async_app.after_serving
+    async def close_upstreams():
+        await async_app.upstreams.close()
+
+    @async_app.before_request
+    async def start_trace():
+        # Handlers use the Flask app's config, cache and database
+        g.flask_context = wsgi_app.app_context()
+        g.flask_context.push()
+        g.trace_token = begin_trace()
+
+    @async_app.after_request
+    async def finish_trace(response):
+        trace = current_trace()
+        REQUEST_SECONDS.observe(request.endpoint or "unknown", time.perf_counter() - trace.started)
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        if request.args.get("debug") == "timing" and response.mimetype == "application/json":
+            payload = await response.get_json()
+            if isinstance(payload, dict):
+                payload["debug"] = {"timing": trace.to_dict()}
+                response.set_data(async_app.json.dumps(payload))
+        return response
+
+    @async_app.teardown_request
+    async def clear_trace(exc):
+        end_trace(g.pop("trace_token"))
+        g.pop("flask_context").pop(exc)
+
+    def places_response(places):
+        fields, compact = shape_options(request.args)
+        count = len(places)
+        places = shape(places, fields, compact)
+        if wants_ndjson(request, request.args):
+            return Response(ndjson({"count": count}, places), mimetype="application/x-ndjson")
+        return jsonify(list(places))
+
+    @async_app.route("/api/places", methods=["GET"])
+    async def get_places():
+        lat = request.args.get("lat", type=float)
+        lon = request.args.get("lon", type=float)
+        radius = request.args.get("radius", type=int, default=50000)
+        place_type = request.args.get("type", default="campground")
+
+        if not lat or not lon:
+            return jsonify({"error": "Latitude and longitude are required"}), 400
+
+        places = await async_app.upstreams.find_places(lat, lon, radius, place_type)
+        return places_response(await async_app.upstreams.attach_drive_times(places, lat, lon))
+
+    @async_app.route("/api/trails", methods=["GET"])
+    async def get_trails():
+        lat = request.args.get("lat", type=float)
+        lon = request.args.get("lon", type=float)
+        radius = request.args.get("radius", type=int, default=50000)
+
+        if not lat or not lon:
+            return jsonify({"error": "Latitude and longitude are required"}), 400
+
+        trails = await async_app.upstreams.find_trails(lat, lon, radius)
+        return places_response(await async_app.upstreams.attach_drive_times(trails, lat, lon))
+
+    @async_app.route("/api/recommendations", methods=["POST"])
+    async def get_recommendations():
+        data = await request.get_json()
+        user_lat = data.get("lat")
+        user_lon = data.get("lon")
+
+        if not (user_lat and user_lon):
+            return jsonify({"error": "Latitude and longitude are required"}), 400
+
+        user_prefs = await run_blocking(_user_preferences, data)
+        async_summary = data.get("summary", "async") != "inline"
+        recommendations = await recommend_campsites(async_app.upstreams, user_lat, user_lon,
+                                                    user_prefs, async_summary=async_summary)
+
+        # Optional paging (limit), projection (fields, compact) and streaming (format=ndjson)
+        results = recommendations.pop("results")
+        trails = recommendations.pop("hiking_trails")
+        if data.get("limit"):
+            results, recommendations["next_cursor"] = await run_blocking(
+                first_page, results, _results_limit(data.get("limit")), pool="cache")
+        fields, compact = shape_options(data)
+        results = shape(results, fields, compact)
+        trails = shape(trails, None, compact)
+        if wants_ndjson(request, data):
+            return Response(ndjson(recommendations, results, trails), mimetype="application/x-ndjson")
+        return jsonify({**recommendations, "results": list(results), "hiking_trails": list(trails)})
+
+    return async_app
+
+class Dispatcher:
+    """
+    Sends requests for routes the async app defines to it and everything
+    else to the WSGI app. CORS preflights stay with the WSGI app, whose
+    CORS extension answers them.
+    """
+
+    def __init__(self, async_app, wsgi_app):
+        self.async_app = async_app
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.routes = async_app.url_map.bind("")
+
+    def is_async(self, scope):
+        if scope["method"] == "OPTIONS":
+            return False
+        try:
+            self.routes.match(scope["path"], method=scope["method"])
+        except HTTPException:
+            return False
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or (scope["type"] == "http" and self.is_async(scope)):
+            await self.async_app(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+async_app = create_async_app(flask_app)
+app = Dispatcher(async_app, flask_app)
@@ -0,0 +1,128 @@
+# async_recommendation.py
+
+import asyncio
+from flask import current_app
+from concurrency import submit, run_blocking
+from scoring import campsite_columns
+from services.weather_service import unavailable_weather
+from services.light_pollution_service import unavailable_light_pollution, lookup_many
+from services.gemini_service import summary_request_key
+from summary_jobs import start_summary
+from catalog import catalog_places, store_discovery
+from reviews import community_ratings
+from prewarm import record_origin
+from instrumentation import stage
+from recommendation import SEARCH_RADIUS, build_summary_prompt, match_trails, rank_campsites, store_candidates
+
+# The recommendation pipeline for the async serving mode (asgi.py).
+# Same stages and results as recommendation.py, but every upstream call is
+# awaited on the event loop through AsyncUpstreams instead of a thread pool.
+# Database and cache calls block, so they run on pools via run_blocking.
+
+async def find_candidates(upstreams, user_lat, user_lon):
+    """Campsites and hiking trails from the catalog, else from Google Maps"""
+    catalog = None
+    if current_app.config["CATALOG_ENABLED"]:
+        with stage("catalog"):
+            catalog = await run_blocking(catalog_places, user_lat, user_lon, SEARCH_RADIUS)
+    if catalog:
+        record_origin(user_lat, user_lon, catalog[0])
+        return catalog
+
+    with stage("discovery"):
+        campsites, hiking_trails = await upstreams.discover_places(user_lat, user_lon, radius=SEARCH_RADIUS)
+    if current_app.config["CATALOG_ENABLED"]:
+        submit("catalog", store_discovery, user_lat, user_lon, SEARCH_RADIUS, campsites, hiking_trails)
+    record_origin(user_lat, user_lon, campsites)
+    return campsites, hiking_trails
+
+async def _raster(coords):
+    return lookup_many(coords)
+
+async def _timed(name, awaitable):
+    with stage(name):
+        return await awaitable
+
+async def enrich_campsites(upstreams, campsites, timeout=None):
+    """
+    Weather and light pollution for every campsite, fetched concurrently.
+    Returns (weather, light_pollution) lists aligned with campsites; a
+    lookup still running at the deadline is cancelled and its campsites
+    get the fallback data.
+    """
+    if timeout is None:
+        timeout = current_app.config["ENRICHMENT_TIMEOUT"]
+    coords = [(site.lat, site.lng) for site in campsites]
+
+    if current_app.config["LIGHT_POLLUTION_BACKEND"] == "raster":
+        lookup = _raster(coords)  # local grid read, no network
+    else:
+        lookup = upstreams.light_pollution_many(coords)
+    weather = asyncio.ensure_future(_timed("weather", upstreams.weather_many(coords)))
+    light_pollution = asyncio.ensure_future(_timed("light_pollution", lookup))
+
+    _, pending = await asyncio.wait({weather, light_pollution}, timeout=timeout)
+    if pending:
+        current_app.logger.warning(f"Enrichment deadline reached with {len(pending)} lookups pending")
+        for task in pending:
+            task.cancel()
+
+    def outcome(task, fallback):
+        if task in pending:
+            return [fallback("timed out") for _ in campsites]
+        return task.result()
+
+    return (outcome(weather, unavailable_weather),
+            outcome(light_pollution, unavailable_light_pollution))
+
+async def recommend_campsites(upstreams, user_lat, user_lon, user_preferences, async_summary=False):
+    """Async recommendation.recommend_campsites"""
+    # 1) Get potential locations
+    campsites, hiking_trails = await find_candidates(upstreams, user_lat, user_lon)
+
+    # 2) Process each location; drive times are fetched alongside
+    timeout = current_app.config["ENRICHMENT_TIMEOUT"]
+    drive_times = asyncio.ensure_future(upstreams.drive_times(user_lat, user_lon, campsites))
+    with stage("enrichment"):
+        weather_data, lp_levels = await enrich_campsites(upstreams, campsites, timeout)
+    with stage("travel_times_wait"):
+        done, _ = await asyncio.wait({drive_times}, timeout=timeout)
+    if done:
+        drive_times = drive_times.result()
+    else:
+        drive_times.cancel()
+        drive_times = [None] * len(campsites)
+    nearest_trails, near_trail = match_trails(campsites, hiking_trails)
+
+    # 3) Score all campsites at once and sort by score
+    community = await run_blocking(community_ratings, [site.name for site in campsites])
+    columns = campsite_columns(campsites, weather_data, lp_levels, community)
+    results = rank_campsites(user_lat, user_lon, user_preferences, campsites, columns,
+                             weather_data, lp_levels, nearest_trails, near_trail, community,
+                             drive_times)
+    candidate_set = await run_blocking(store_candidates, user_lat, user_lon, user_preferences, campsites,
+                                       hiking_trails, weather_data, lp_levels, nearest_trails, near_trail,
+                                       community, drive_times, pool="cache")
+
+    # 4) Generate AI recommendation
+    top_spots = results[:5]
+    prompt = build_summary_prompt(top_spots, user_preferences)
+    request_key = summary_request_key(top_spots, user_preferences)
+    if async_summary:
+        return {
+            "results": results,
+            "ai_summary": None,
+            "ai_summary_job": await run_blocking(start_summary, prompt, request_key, pool="cache"),
+            "hiking_trails": hiking_trails,
+            "candidate_set": candidate_set
+        }
+
+    with stage("summary"):
+        ai_summary = await upstreams.ai_recommendation(prompt, request_key)
+
+    return {
+        "results": results,
+        "ai_summary": ai_summary,
+        "hiking_trails": hiking_trails,
+        "candidate_set": candidate_set
+    }
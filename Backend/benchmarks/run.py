@@ -0,0 +1,271 @@
+# benchmarks/run.py
+"""
+Offline benchmark for /api/recommendations.
+
+Every upstream is answered by the stand-ins in benchmarks/standins.py, so
+this needs no network access or API keys. Run from Backend/:
+
+    python -m benchmarks.run --counts 10 100 1000 --requests 50
+    python -m benchmarks.run --latency-ms 40 --fault weather=120,30,0.05
+    python -m benchmarks.run --json bench.json --baseline main.json
+    python -m benchmarks.run --server asgi --concurrency 200 --latency-ms 200
+
+Up to 60 campsites (one Google search) are discovered live through the
+Places stand-in; larger counts are served from a pre-seeded catalog,
+which is how dense regions are served in production.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+LIVE_DISCOVERY_LIMIT = 60
+
+def configure_environment(db_path):
+    """Point the app at a scratch database and stand-in credentials"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "GOOGLE_MAPS_API_KEY": "AIzaBenchmarkStandIn",
+        "WEATHER_API_KEY": "benchmark",
+        "LIGHT_POLLUTION_API_KEY": "benchmark",
+        "CAMPSITE_API_KEY": "benchmark",
+        "GEMINI_API_KEY": "benchmark",
+        "LIGHT_POLLUTION_BACKEND": "api",
+        "CACHE_BACKEND": "memory",
+        "CATALOG_SYNC_ENABLED": "false"
+    })
+
+def parse_faults(args, upstreams):
+    """Default fault for every upstream, overridden by --fault name=latency,jitter,error_rate"""
+    from benchmarks.standins import Fault
+    faults = {name: Fault(args.latency_ms, args.jitter_ms, args.error_rate) for name in upstreams}
+    for spec in args.fault:
+        name, _, values = spec.partition("=")
+        if name not in faults:
+            raise SystemExit(f"Unknown upstream in --fault: {name}")
+        latency, jitter, error_rate = (list(map(float, values.split(","))) + [0, 0, 0])[:3]
+        faults[name] = Fault(latency, jitter, error_rate)
+    return faults
+
+def seed_catalog(world):
+    """Store the world's places as a freshly synced catalog region"""
+    from catalog import store_discovery
+    from records import Place, Trail
+
+    def place(details, kind):
+        place = {
+            "place_id": details["place_id"],
+            "name": details["name"],
+            "address": details.get("formatted_address"),
+            "location": details["geometry"]["location"],
+            "rating": details.get("rating"),
+            "is_open": details.get("opening_hours", {}).get("open_now"),
+            "photos": details.get("photos", []),
+            "website": details.get("website"),
+            "phone": details.get("formatted_phone_number"),
+            "amenities": details.get("amenities", [])
+        }
+        if kind == "trail":
+            return Trail.from_dict(dict(place, reviews=details.get("reviews", [])))
+        return Place.from_dict(place)
+
+    lat, lon = world.center
+    store_discovery(lat, lon, 50000,
+                    [place(p, "campground") for p in world.campsites],
+                    [place(p, "trail") for p in world.trails])
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+def send_wsgi(app, body, n, concurrency, cache):
+    """n requests through the Flask app on a thread pool; (seconds, status, payload) each"""
+    from cache import get_cache
+
+    def one_request():
+        if cache == "cold":
+            with app.app_context():
+                get_cache().clear()
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post("/api/recommendations?debug=timing", json=body)
+        elapsed = time.perf_counter() - started
+        payload = response.get_json(silent=True) or {}
+        return elapsed, response.status_code, payload
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: one_request(), range(n)))
+
+def send_asgi(app, body, n, concurrency, cache):
+    """n requests through the async serving mode (asgi.py), concurrency at a time"""
+    import httpx
+    from asgi import app as asgi_app, async_app
+    from cache import get_cache
+
+    async def run():
+        limit = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=asgi_app)
+
+        async def one_request(client):
+            async with limit:
+                if cache == "cold":
+                    with app.app_context():
+                        get_cache().clear()
+                started = time.perf_counter()
+                response = await client.post("/api/recommendations?debug=timing", json=body)
+                elapsed = time.perf_counter() - started
+                return elapsed, response.status_code, response.json()
+
+        await async_app.startup()
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+                return await asyncio.gather(*(one_request(client) for _ in range(n)))
+        finally:
+            await async_app.shutdown()
+
+    return asyncio.run(run())
+
+def run_count(app, count, args, faults):
+    """Benchmark one campsite count; returns a summary dict"""
+    from benchmarks.standins import StandIns, World
+    from cache import get_cache
+    from database import db
+    from services import http_client
+
+    world = World.load(args.world) if args.world else World.synthetic(count, seed=args.seed)
+    source = args.source
+    if source == "auto":
+        source = "live" if len(world.campsites) <= LIVE_DISCOVERY_LIMIT else "catalog"
+
+    app.config["CATALOG_ENABLED"] = source == "catalog"
+    app.config["MAPS_PAGE_TOKEN_DELAY"] = args.page_token_delay
+    http_client._breakers.clear()
+
+    standins = StandIns(world, faults, seed=args.seed).install()
+    try:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            get_cache().clear()
+            if source == "catalog":
+                seed_catalog(world)
+
+        lat, lon = world.center
+        body = {
+            "lat": lat,
+            "lon": lon,
+            "summary": args.summary,
+            "preferences": {"prefers_hiking": True, "prefers_fishing": True}
+        }
+
+        send = send_asgi if args.server == "asgi" else send_wsgi
+        send(app, body, args.warmup, 1, args.cache)
+        standins.reset_counts()
+
+        started = time.perf_counter()
+        outcomes = send(app, body, args.requests, args.concurrency, args.cache)
+        wall = time.perf_counter() - started
+    finally:
+        standins.uninstall()
+
+    latencies = [elapsed * 1000 for elapsed, status, _ in outcomes if status == 200]
+    stages = {}
+    candidates = []
+    for _, status, payload in outcomes:
+        if status != 200:
+            continue
+        candidates.append(len(payload.get("results", [])))
+        for name, timing in payload.get("debug", {}).get("timing", {}).get("stages", {}).items():
+            stages[name] = stages.get(name, 0) + timing["ms"]
+
+    ok = len(latencies)
+    return {
+        "campsites": count,
+        "candidates": int(np.mean(candidates)) if candidates else 0,
+        "source": source,
+        "cache": args.cache,
+        "requests": args.requests,
+        "errors": args.requests - ok,
+        "throughput_rps": args.requests / wall if wall else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "stages_ms": {name: total / ok for name, total in sorted(stages.items())} if ok else {},
+        "upstream_calls": {name: calls / args.requests for name, calls in standins.calls.items()}
+    }
+
+def print_report(results):
+    print(f"{'sites':>6} {'source':>8} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in results:
+        print(f"{r['campsites']:>6} {r['source']:>8} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms'] or 0:>9.1f} {r['p95_ms'] or 0:>9.1f} {r['p99_ms'] or 0:>9.1f} {r['errors']:>7}")
+    for r in results:
+        stages = ", ".join(f"{name} {ms:.1f}" for name, ms in r["stages_ms"].items())
+        calls = ", ".join(f"{name} {n:.1f}" for name, n in r["upstream_calls"].items() if n)
+        print(f"\n{r['campsites']} sites ({r['candidates']} ranked)")
+        print(f"  stages ms/request: {stages}")
+        print(f"  upstream calls/request: {calls}")
+
+def check_baseline(results, path, max_regression):
+    """Names each count whose p95 is more than max_regression slower than the baseline"""
+    with open(path) as f:
+        baseline = {r["campsites"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        before = baseline.get(r["campsites"])
+        if before and before["p95_ms"] and r["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{r['campsites']} sites: p95 {before['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline /api/recommendations benchmark")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi",
+                        help="asgi drives the async serving mode in asgi.py")
+    parser.add_argument("--source", choices=["auto", "live", "catalog"], default="auto")
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold",
+                        help="cold clears the cache before every request")
+    parser.add_argument("--summary", choices=["async", "inline"], default="async")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every upstream call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="mean of extra exponential latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered 503")
+    parser.add_argument("--fault", action="append", default=[], metavar="UPSTREAM=LATENCY,JITTER,ERRORS",
+                        help="per-upstream override, e.g. weather=120,30,0.05")
+    parser.add_argument("--page-token-delay", type=float, default=0.01)
+    parser.add_argument("--world", help="replay a recorded world (JSON) instead of a synthetic one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if p95 regressed against this results file")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.TemporaryDirectory()
+    configure_environment(os.path.join(scratch.name, "benchmark.db"))
+    from app import app
+    from benchmarks.standins import StandIns
+    app.logger.disabled = True
+
+    faults = parse_faults(args, StandIns.HOSTS.values())
+    results = [run_count(app, count, args, faults) for count in args.counts]
+    print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = check_baseline(results, args.baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# benchmarks/standins.py
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # only used by the async serving mode
+except ImportError:
+    httpx = None
+
+# Google returns at most three pages of 20 per nearby search
+PAGE_SIZE = 20
+MAX_PAGES = 3
+
+# Details fields whose response key differs from the requested name
+FIELD_KEYS = {"photo": "photos", "review": "reviews"}
+
+class World:
+    """
+    The places, weather stations and sky quality the stand-ins serve.
+    Build one synthetically or load a recorded one from JSON.
+    """
+
+    def __init__(self, center, campsites, trails, stations):
+        self.center = tuple(center)
+        self.campsites = campsites
+        self.trails = trails
+        self.stations = stations
+        self.places = {p["place_id"]: p for p in campsites + trails}
+
+    @classmethod
+    def synthetic(cls, n_campsites, n_trails=None, center=(44.6, -110.5), radius_km=45, seed=0):
+        rng = random.Random(seed)
+        n_trails = n_campsites // 2 if n_trails is None else n_trails
+
+        def point():
+            # Uniform over the disc
+            distance = radius_km * math.sqrt(rng.random())
+            bearing = rng.uniform(0, 2 * math.pi)
+            lat = center[0] + distance * math.cos(bearing) / 111.2
+            lon = center[1] + distance * math.sin(bearing) / (111.2 * math.cos(math.radians(center[0])))
+            return {"lat": lat, "lng": lon}
+
+        def place(kind, i):
+            return {
+                "place_id": f"{kind}-{seed}-{i}",
+                "name": f"{kind.title()} {i}",
+                "formatted_address": f"{i} Forest Road",
+                "geometry": {"location": point()},
+                "rating": rng.choice([3.5, 4.0, 4.5, 5.0]),
+                "opening_hours": {"open_now": rng.random() < 0.8},
+                "photos": [{"photo_reference": f"photo-{kind}-{i}", "height": 800, "width": 1200}],
+                "website": None,
+                "formatted_phone_number": None,
+                "reviews": [{"rating": 5, "text": "Great views"}] if kind == "trail" else [],
+                "amenities": rng.sample(["fishing", "water", "toilets", "fire_pits"], 2)
+            }
+
+        campsites = [place("campground", i) for i in range(n_campsites)]
+        trails = [place("trail", i) for i in range(n_trails)]
+        stations = [
+            {
+                "coord": {"lat": p["lat"], "lon": p["lng"]},
+                "main": {"temp": rng.uniform(5, 30), "humidity": rng.randint(20, 90)},
+                "weather": [{"description": rng.choice(["clear sky", "few clouds", "light rain"])}],
+                "clouds": {"all": rng.randint(0, 100)},
+                "wind": {"speed": rng.uniform(0, 10)}
+            }
+            for p in (point() for _ in range(max(10, n_campsites // 5)))
+        ]
+        return cls(center, campsites, trails, stations)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["center"], data["campsites"], data["trails"], data["stations"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({
+                "center": self.center,
+                "campsites": self.campsites,
+                "trails": self.trails,
+                "stations": self.stations
+            }, f)
+
+    def nearest_station(self, lat, lon):
+        return min(self.stations, key=lambda s: (s["coord"]["lat"] - lat) ** 2 + (s["coord"]["lon"] - lon) ** 2)
+
+    def bortle(self, lat, lon):
+        """Deterministic sky quality that varies every ~1 km"""
+        return 1 + (round(lat * 100) * 31 + round(lon * 100) * 17) % 9
+
+class Fault:
+    """Latency and error injection for one upstream"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def sample(self, rng):
+        """(delay in seconds, whether this call should fail) for one call"""
+        delay = self.latency_ms + (rng.expovariate(1 / self.jitter_ms) if self.jitter_ms else 0)
+        return delay / 1000, rng.random() < self.error_rate
+
+class StandIns:
+    """
+    Local stand-ins for every upstream in services/.
+    While installed, all HTTP traffic sent through requests (including the
+    googlemaps client) and httpx's async transport is answered from the
+    world instead of the network.
+    """
+
+    # host -> upstream name used for faults and call counts
+    HOSTS = {
+        "maps.googleapis.com": "maps",
+        "api.openweathermap.org": "weather",
+        "api.lightpollutiondata.com": "light_pollution",
+        "api.campsite.com": "campsites",
+        "api.gemini.com": "gemini"
+    }
+
+    def __init__(self, world, faults=None, seed=0):
+        self.world = world
+        self.faults = faults or {}
+        self.rng = random.Random(seed)
+        self.calls = {name: 0 for name in self.HOSTS.values()}
+        self.lock = threading.Lock()
+        self._original_send = None
+        self._original_async_send = None
+
+    def install(self):
+        standins = self
+        self._original_send = HTTPAdapter.send
+
+        def send(adapter, request, **kwargs):
+            return standins.handle(request)
+
+        HTTPAdapter.send = send
+        if httpx is not None:
+            self._original_async_send = httpx.AsyncHTTPTransport.handle_async_request
+
+            async def handle_async_request(transport, request):
+                return await standins.handle_async(request)
+
+            httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+        return self
+
+    def uninstall(self):
+        if self._original_send is not None:
+            HTTPAdapter.send = self._original_send
+            self._original_send = None
+        if self._original_async_send is not None:
+            httpx.AsyncHTTPTransport.handle_async_request = self._original_async_send
+            self._original_async_send = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc):
+        self.uninstall()
+
+    def reset_counts(self):
+        with self.lock:
+            for name in self.calls:
+                self.calls[name] = 0
+
+    def _answer(self, url, body):
+        """(delay, status, payload) for a request to url with a JSON body"""
+        url = urlsplit(url)
+        upstream = self.HOSTS.get(url.hostname)
+        if upstream is None:
+            return 0, 404, {"error": f"no stand-in for {url.hostname}"}
+
+        with self.lock:
+            self.calls[upstream] += 1
+            rng = random.Random(self.rng.random())
+        delay, fail = self.faults.get(upstream, Fault()).sample(rng)
+        if fail:
+            return delay, 503, {"error": "injected failure"}
+
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if body:
+            params.update(json.loads(body))
+        handler = getattr(self, f"_{upstream}")
+        return delay, 200, handler(url.path, params)
+
+    def handle(self, request):
+        delay, status, payload = self._answer(request.url, request.body)
+        if delay:
+            time.sleep(delay)
+        return self._response(request, status, payload)
+
+    async def handle_async(self, request):
+        delay, status, payload = self._answer(str(request.url), request.content)
+        if delay:
+            await asyncio.sleep(delay)
+        return httpx.Response(status, json=payload, request=request)
+
+    def _response(self, request, status, payload):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(payload).encode()
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def _maps(self, path, params):
+        if path.endswith("/place/nearbysearch/json"):
+            places = self.world.trails if params.get("keyword") else self.world.campsites
+            page = int(params.get("pagetoken", 0))
+            chunk = places[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+            result = {"status": "OK" if chunk else "ZERO_RESULTS",
+                      "results": [{"place_id": p["place_id"]} for p in chunk]}
+            if page + 1 < MAX_PAGES and (page + 1) * PAGE_SIZE < len(places):
+                result["next_page_token"] = str(page + 1)
+            return result
+        if path.endswith("/place/details/json"):
+            place = self.world.places.get(params.get("placeid") or params.get("place_id"))
+            if place is None:
+                return {"status": "NOT_FOUND"}
+            fields = {FIELD_KEYS.get(f, f) for f in params.get("fields", "").split(",")}
+            return {"status": "OK", "result": {k: v for k, v in place.items() if k in fields}}
+        if path.endswith("/directions/json"):
+            return {"status": "OK", "routes": [{"legs": [{
+                "distance": {"text": "42 km", "value": 42000},
+                "duration": {"text": "38 mins", "value": 2280},
+                "steps": [{"html_instructions": "Head north"}, {"html_instructions": "Arrive"}]
+            }]}]}
+        if path.endswith("/distancematrix/json"):
+            origins = params["origins"].split("|")
+            destinations = params["destinations"].split("|")
+            return {"status": "OK", "rows": [
+                {"elements": [
+                    {"status": "OK", "distance": {"value": 1000 * (10 + j)}, "duration": {"value": 60 * (12 + j)}}
+                    for j in range(len(destinations))
+                ]}
+                for _ in origins
+            ]}
+        return {"status": "INVALID_REQUEST"}
+
+    def _weather(self, path, params):
+        lat, lon = float(params["lat"]), float(params["lon"])
+        if path.endswith("/find"):
+            stations = sorted(self.world.stations, key=lambda s: (
+                (s["coord"]["lat"] - lat) ** 2 + (s["coord"]["lon"] - lon) ** 2
+            ))
+            return {"list": stations[:int(params.get("cnt", 50))]}
+        return self.world.nearest_station(lat, lon)
+
+    def _light_pollution(self, path, params):
+        bortle = self.world.bortle(float(params["lat"]), float(params["lon"]))
+        return {"bortle_scale": bortle, "description": "Stand-in sky quality"}
+
+    def _campsites(self, path, params):
+        return {"campsites": [
+            {
+                "name": p["name"],
+                "lat": p["geometry"]["location"]["lat"],
+                "lon": p["geometry"]["location"]["lng"],
+                "amenities": p["amenities"],
+                "rating": p["rating"]
+            }
+            for p in self.world.campsites
+        ]}
+
+    def _gemini(self, path, params):
+        return {"choices": [{"text": "Stand-in summary: the first campsite has the darkest skies."}]}
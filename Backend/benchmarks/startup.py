@@ -0,0 +1,159 @@
+# benchmarks/startup.py
+"""
+Cold start benchmark: what a fresh worker pays to import the app and to
+serve its first requests. Every sample is a new interpreter, with the
+upstreams answered by the stand-ins. Run from Backend/:
+
+    python -m benchmarks.startup --samples 10
+    python -m benchmarks.startup --json startup.json --baseline main-startup.json
+
+Each endpoint is requested twice, clearing the cache in between, so the
+gap between the first and second request is the one-time cost (lazy
+imports, client setup) of the first.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules that should only load once a request needs them
+LAZY_MODULES = ["numpy", "requests", "googlemaps", "geopy", "httpx", "quart", "recommendation", "catalog"]
+
+def endpoints(center):
+    lat, lon = center
+    return {
+        "index": ("GET", "/", None),
+        "location": ("GET", "/api/location?address=Moab%2C%20UT", None),
+        "recommendations": ("POST", "/api/recommendations",
+                            {"lat": lat, "lon": lon, "preferences": {"prefers_hiking": True}})
+    }
+
+def child(names):
+    """One sample, in a fresh interpreter: prints import and request timings as JSON"""
+    started = time.perf_counter()
+    from app import app
+    import_ms = (time.perf_counter() - started) * 1000
+    loaded = [name for name in LAZY_MODULES if name in sys.modules]
+
+    from benchmarks.standins import StandIns, World
+    from cache import get_cache
+    world = World.synthetic(20)
+    StandIns(world).install()
+    app.config["MAPS_PAGE_TOKEN_DELAY"] = 0.01
+    app.logger.disabled = True
+    client = app.test_client()
+
+    timings = {}
+    for name in names:
+        method, path, body = endpoints(world.center)[name]
+        times = []
+        for _ in range(2):
+            with app.app_context():
+                get_cache().clear()
+            started = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            times.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise SystemExit(f"{method} {path} returned {response.status_code}")
+            # Let the background AI summary finish so it doesn't overlap the next request
+            job_id = (response.get_json(silent=True) or {}).get("ai_summary_job")
+            if job_id:
+                client.get(f"/api/recommendations/summary/{job_id}?wait=30")
+            # googlemaps throttles each client to 60 queries per second
+            time.sleep(1)
+        timings[name] = {"first_ms": times[0], "second_ms": times[1]}
+
+    print(json.dumps({"import_ms": import_ms, "loaded_at_import": loaded, "requests": timings}))
+
+def sample(names):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", *names],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples):
+    import numpy as np
+
+    def stats(values):
+        return {"median": float(np.median(values)), "p90": float(np.percentile(values, 90))}
+
+    summary = {
+        "samples": len(samples),
+        "import_ms": stats([s["import_ms"] for s in samples]),
+        "loaded_at_import": samples[0]["loaded_at_import"],
+        "requests": {}
+    }
+    for name in samples[0]["requests"]:
+        summary["requests"][name] = {
+            key: stats([s["requests"][name][key] for s in samples])
+            for key in ("first_ms", "second_ms")
+        }
+    return summary
+
+def print_report(summary):
+    print(f"{summary['samples']} cold starts")
+    print(f"  import app  median {summary['import_ms']['median']:8.1f} ms   p90 {summary['import_ms']['p90']:8.1f} ms")
+    print(f"  loaded at import: {', '.join(summary['loaded_at_import']) or 'none of ' + ', '.join(LAZY_MODULES)}")
+    print(f"\n{'endpoint':>16} {'first ms':>10} {'second ms':>10} {'one-time ms':>12}")
+    for name, timing in summary["requests"].items():
+        first, second = timing["first_ms"]["median"], timing["second_ms"]["median"]
+        print(f"{name:>16} {first:>10.1f} {second:>10.1f} {first - second:>12.1f}")
+
+def check_baseline(summary, path, max_regression):
+    """Names each median that is more than max_regression slower than the baseline"""
+    with open(path) as f:
+        baseline = json.load(f)["summary"]
+    measured = {"import": (baseline["import_ms"], summary["import_ms"])}
+    for name, timing in summary["requests"].items():
+        if name in baseline["requests"]:
+            measured[f"{name} first request"] = (baseline["requests"][name]["first_ms"], timing["first_ms"])
+    return [
+        f"{label}: {before['median']:.1f} -> {after['median']:.1f} ms"
+        for label, (before, after) in measured.items()
+        if after["median"] > before["median"] * (1 + max_regression)
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start (import and first request) benchmark")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--endpoints", nargs="+", choices=["index", "location", "recommendations"],
+                        default=["index", "location", "recommendations"])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="fail if import or first-request time regressed against this file")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    parser.add_argument("--child", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        child(args.child)
+        return 0
+
+    # Not at module level: the child process must start from a clean interpreter
+    from benchmarks.run import configure_environment
+    scratch = tempfile.TemporaryDirectory()
+    configure_environment(os.path.join(scratch.name, "startup.db"))
+    os.environ["CATALOG_ENABLED"] = "false"  # every sample discovers through the stand-ins
+    subprocess.run([sys.executable, "-m", "flask", "--app", "app", "init-db"],
+                   check=True, capture_output=True)
+
+    samples = [sample(args.endpoints) for _ in range(args.samples)]
+    summary = summarize(samples)
+    print_report(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "summary": summary, "samples": samples}, f, indent=2)
+    if args.baseline:
+        regressions = check_baseline(summary, args.baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
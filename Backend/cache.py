@@ -0,0 +1,383 @@
+# cache.py
+
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from flask import current_app
+from geo import snap_to_tile
+from instrumentation import record_cache
+import records
+
+class MemoryBackend:
+    """Per-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries, on_evict):
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self.entries[(namespace, key)]
+                self.on_evict(namespace, "expirations")
+                return False, None
+            self.entries.move_to_end((namespace, key))
+            return True, value
+
+    def ttl(self, namespace, key):
+        with self.lock:
+            entry = self.entries.get((namespace, key))
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[0] - time.time()
+
+    def set(self, namespace, key, value, timeout):
+        with self.lock:
+            self.entries[(namespace, key)] = (time.time() + timeout, value)
+            self.entries.move_to_end((namespace, key))
+            while len(self.entries) > self.max_entries:
+                (evicted, _), _ = self.entries.popitem(last=False)
+                self.on_evict(evicted, "evictions")
+
+    def delete(self, namespace, key):
+        with self.lock:
+            self.entries.pop((namespace, key), None)
+
+    def sizes(self):
+        """Entries and approximate bytes held per namespace"""
+        with self.lock:
+            entries = list(self.entries.items())
+        sizes = defaultdict(lambda: {"entries": 0, "bytes": 0})
+        seen = set()
+        for (namespace, _), (_, value) in entries:
+            sizes[namespace]["entries"] += 1
+            sizes[namespace]["bytes"] += records.deep_size(value, seen)
+        return sizes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class SQLiteBackend:
+    """
+    LRU cache in a SQLite file, shared by every worker process on the host.
+    Values are stored as JSON, records tagged so they load as records.
+    Reads don't write: hits are noted in memory and written back, with
+    the size limit enforced, at most every maintenance_interval seconds,
+    so concurrent readers don't queue for the database write lock. The
+    file can run over max_entries in between.
+    """
+
+    def __init__(self, path, max_entries, on_evict, maintenance_interval=5):
+        self.path = path
+        self.max_entries = max_entries
+        self.on_evict = on_evict
+        self.maintenance_interval = maintenance_interval
+        self.touched = {}  # (namespace, key) -> last hit, not yet written back
+        self.next_maintenance = time.time() + maintenance_interval
+        self.lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, namespace, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None:
+            return False, None
+        value, expires_at = row
+        if expires_at <= now:
+            return False, None  # removed, and counted, at the next maintenance
+        with self.lock:
+            self.touched[(namespace, key)] = now
+        self._maintain(now)
+        return True, records.loads(value)
+
+    def _maintain(self, now):
+        """Write back recent hits, drop expired rows and trim to max_entries, once per interval"""
+        with self.lock:
+            if now < self.next_maintenance:
+                return
+            self.next_maintenance = now + self.maintenance_interval
+            touched, self.touched = self.touched, {}
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE cache SET accessed_at = MAX(accessed_at, ?) WHERE namespace = ? AND key = ?",
+                [(at, namespace, key) for (namespace, key), at in touched.items()]
+            )
+            expired = conn.execute(
+                "SELECT namespace, COUNT(*) FROM cache WHERE expires_at <= ? GROUP BY namespace", (now,)
+            ).fetchall()
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            for expired_namespace, count in expired:
+                for _ in range(count):
+                    self.on_evict(expired_namespace, "expirations")
+            overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                evicted = conn.execute(
+                    "SELECT namespace, key FROM cache ORDER BY accessed_at LIMIT ?",
+                    (overflow,)
+                ).fetchall()
+                conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", evicted)
+                for evicted_namespace, _ in evicted:
+                    self.on_evict(evicted_namespace, "evictions")
+
+    def ttl(self, namespace, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None or row[0] <= time.time():
+            return None
+        return row[0] - time.time()
+
+    def set(self, namespace, key, value, timeout):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, records.dumps(value), now + timeout, now)
+            )
+        self._maintain(now)
+
+    def delete(self, namespace, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+class RedisBackend:
+    """
+    Cache in Redis (or any server speaking its protocol), shared by every
+    worker that points at the same URL. Expiry and eviction are left to the
+    server, so eviction counts are not tracked here.
+    """
+
+    def __init__(self, url, on_evict):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.on_evict = on_evict
+
+    def get(self, namespace, key):
+        value = self.client.get(f"{namespace}:{key}")
+        if value is None:
+            return False, None
+        return True, records.loads(value)
+
+    def ttl(self, namespace, key):
+        remaining = self.client.ttl(f"{namespace}:{key}")
+        return remaining if remaining >= 0 else None
+
+    def set(self, namespace, key, value, timeout):
+        self.client.setex(f"{namespace}:{key}", int(timeout), records.dumps(value))
+
+    def delete(self, namespace, key):
+        self.client.delete(f"{namespace}:{key}")
+
+    def clear(self):
+        self.client.flushdb()
+
+class Cache:
+    """Cache facade that keeps hit/miss/eviction counters per namespace"""
+
+    def __init__(self, config):
+        self.counters = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0}
+        )
+        self.lock = threading.Lock()
+
+        backend = config["CACHE_BACKEND"]
+        if backend == "memory":
+            self.backend = MemoryBackend(config["CACHE_MAX_ENTRIES"], self.count)
+        elif backend == "sqlite":
+            self.backend = SQLiteBackend(config["CACHE_URL"], config["CACHE_MAX_ENTRIES"], self.count,
+                                         config["CACHE_MAINTENANCE_INTERVAL"])
+        elif backend == "redis":
+            self.backend = RedisBackend(config["CACHE_URL"], self.count)
+        else:
+            raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+    def count(self, namespace, counter):
+        with self.lock:
+            self.counters[namespace][counter] += 1
+
+    def get(self, namespace, key):
+        hit, value = self.backend.get(namespace, key)
+        self.count(namespace, "hits" if hit else "misses")
+        record_cache(namespace, hit)
+        return hit, value
+
+    def ttl(self, namespace, key):
+        """Seconds until an entry expires, or None if it isn't cached; not counted as a lookup"""
+        return self.backend.ttl(namespace, key)
+
+    def set(self, namespace, key, value, timeout):
+        self.backend.set(namespace, key, value, timeout)
+
+    def delete(self, namespace, key):
+        self.backend.delete(namespace, key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self.lock:
+            stats = {namespace: dict(counts) for namespace, counts in self.counters.items()}
+        for counts in stats.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = counts["hits"] / lookups if lookups else None
+        # Memory held, where entries live in this process
+        if hasattr(self.backend, "sizes"):
+            for namespace, size in self.backend.sizes().items():
+                counts = stats.setdefault(namespace, {})
+                counts.update(size, bytes_per_entry=size["bytes"] // size["entries"])
+        return stats
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+    The first caller runs the function; callers arriving while it is in
+    flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """Return (result, shared) where shared is True for coalesced callers"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+        if not leader:
+            return call.result(), True
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the cache for the current app, creating it on first use"""
+    app = current_app._get_current_object()
+    cache = app.extensions.get("cache")
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.get("cache")
+            if cache is None:
+                cache = app.extensions["cache"] = Cache(app.config)
+    return cache
+
+def cache_timeout(namespace):
+    """Per-service TTL, falling back to CACHE_TIMEOUT"""
+    config = current_app.config
+    return config["CACHE_TIMEOUTS"].get(namespace, config["CACHE_TIMEOUT"])
+
+def tile_coordinates(namespace, lat, lon):
+    """Snap coordinates to the namespace's cache tile (CACHE_TILE_DEGREES)"""
+    tile_deg = current_app.config["CACHE_TILE_DEGREES"].get(namespace)
+    if not tile_deg:
+        return lat, lon
+    return snap_to_tile(lat, lon, tile_deg)
+
+def cached(namespace, unless=None, tiled=False, key=None, single_flight=False):
+    """
+    Cache a service function's results for its namespace's TTL.
+    Results for which unless(result) is true (error fallbacks) are returned
+    but never stored, so the next call retries the upstream.
+    With tiled=True the leading (lat, lon) arguments are snapped to the
+    namespace's geo tile before the lookup and the upstream call.
+    key(*args, **kwargs) replaces the default key built from all arguments.
+    With single_flight=True concurrent misses for one key share a single
+    upstream call.
+    The wrapper also exposes lookup(*args) and prime(value, *args) for
+    callers that fill the cache from bulk fetches, and ttl(*args) for
+    callers that refresh entries before they expire.
+    """
+    def decorator(fn):
+        flights = SingleFlight()
+
+        def make_key(args, kwargs):
+            if tiled:
+                args = tile_coordinates(namespace, *args[:2]) + tuple(args[2:])
+            if key is not None:
+                return args, key(*args, **kwargs)
+            return args, json.dumps([args, kwargs], sort_keys=True, default=str)
+
+        def fetch(cache, cache_key, args, kwargs):
+            value = fn(*args, **kwargs)
+            if unless is None or not unless(value):
+                cache.set(namespace, cache_key, value, cache_timeout(namespace))
+            return value
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            args, cache_key = make_key(args, kwargs)
+            cache = get_cache()
+            hit, value = cache.get(namespace, cache_key)
+            if hit:
+                return value
+            if not single_flight:
+                return fetch(cache, cache_key, args, kwargs)
+            value, shared = flights.do(cache_key, fetch, cache, cache_key, args, kwargs)
+            if shared:
+                cache.count(namespace, "coalesced")
+            return value
+
+        def lookup(*args, **kwargs):
+            """Return (hit, value) without calling the upstream"""
+            return get_cache().get(namespace, make_key(args, kwargs)[1])
+
+        def prime(value, *args, **kwargs):
+            """Store a value fetched elsewhere as the result for these arguments"""
+            if unless is None or not unless(value):
+                get_cache().set(namespace, make_key(args, kwargs)[1], value, cache_timeout(namespace))
+
+        def ttl(*args, **kwargs):
+            """Seconds until the cached result expires, or None if there isn't one"""
+            return get_cache().ttl(namespace, make_key(args, kwargs)[1])
+
+        wrapper.uncached = fn
+        wrapper.lookup = lookup
+        wrapper.prime = prime
+        wrapper.ttl = ttl
+        return wrapper
+    return decorator
@@ -0,0 +1,221 @@
+# catalog.py
+
+import json
+import math
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from database import db
+from models import Campsite, CatalogRegion
+from geo import EARTH_RADIUS_KM, haversine_distance, snap_to_tile
+from spatial_index import SpatialIndex
+from services.maps_service import discover_places
+from services.campsite_service import get_nearby_campsites
+from records import Place
+
+def region_tile(lat, lon):
+    """Catalog region containing a point, as (key, center_lat, center_lon)"""
+    center_lat, center_lon = snap_to_tile(lat, lon, current_app.config["CATALOG_REGION_DEGREES"])
+    return f"{center_lat},{center_lon}", center_lat, center_lon
+
+def is_region_fresh(lat, lon, ahead=0):
+    """
+    True if the region around a point was synced within CATALOG_MAX_AGE,
+    or within the first (1 - ahead) of it when refreshing ahead of expiry
+    """
+    key, _, _ = region_tile(lat, lon)
+    region = db.session.get(CatalogRegion, key)
+    max_age = timedelta(seconds=current_app.config["CATALOG_MAX_AGE"] * (1 - ahead))
+    return region is not None and datetime.utcnow() - region.synced_at < max_age
+
+def _columns(place, kind):
+    # Packed fields go in as their JSON text, without decoding them
+    columns = {
+        "source": place.source,
+        "name": place.name,
+        "address": place.address,
+        "lat": place.lat,
+        "lon": place.lng,
+        "rating": place.rating,
+        "is_open": place.is_open,
+        "website": place.website,
+        "phone": place.phone,
+        "photos": place.packed_photos.json(),
+        "reviews": place.packed_reviews.json() if kind == "trail" else None
+    }
+    # Google results carry no amenities; keep any the campsite API supplied
+    if place.amenities is not None:
+        columns["amenities"] = json.dumps(place.amenities)
+    return columns
+
+def upsert_places(places, kind):
+    """
+    Insert new places and update changed ones.
+    Unchanged rows keep their updated_at, so it records when the upstream
+    data last actually changed. Returns the number of rows written.
+    """
+    places = [p for p in places if p.place_id and p.lat is not None]
+    if not places:
+        return 0
+    existing = {
+        row.place_id: row
+        for row in Campsite.query.filter(
+            Campsite.kind == kind,
+            Campsite.place_id.in_([p.place_id for p in places])
+        )
+    }
+
+    now = datetime.utcnow()
+    written = 0
+    for place in places:
+        columns = _columns(place, kind)
+        row = existing.get(place.place_id)
+        if row is None:
+            row = Campsite(place_id=place.place_id, kind=kind, **columns)
+            db.session.add(row)
+            existing[place.place_id] = row
+        elif all(getattr(row, k) == v for k, v in columns.items()):
+            continue
+        else:
+            for k, v in columns.items():
+                setattr(row, k, v)
+        row.updated_at = now
+        written += 1
+    return written
+
+def store_discovery(lat, lon, radius, campsites, trails):
+    """Save a live discovery into the catalog and mark its region synced"""
+    if not campsites and not trails:
+        return  # nothing found, or the Maps API failed; don't mark fresh
+    try:
+        upsert_places(campsites, "campground")
+        upsert_places(trails, "trail")
+
+        key, center_lat, center_lon = region_tile(lat, lon)
+        region = db.session.get(CatalogRegion, key)
+        if region is None:
+            region = CatalogRegion(tile=key, lat=center_lat, lon=center_lon, radius=radius)
+            db.session.add(region)
+        region.place_count = len(campsites) + len(trails)
+        region.synced_at = datetime.utcnow()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Catalog update error: {str(e)}")
+
+def _merge_amenities(campsites, lat, lon, radius):
+    """
+    Attach amenities from the campsite reservation API.
+    Sites within 200 m of a Google campground enrich it; the rest are added
+    as campsite-API-only entries.
+    """
+    try:
+        api_sites = get_nearby_campsites(lat, lon, radius / 1000)
+    except ValueError as e:
+        current_app.logger.warning(f"Skipping campsite API during catalog sync: {str(e)}")
+        return campsites
+
+    index = SpatialIndex(campsites)
+    merged = list(campsites)
+    for site in api_sites:
+        match, _ = index.nearest(site["lat"], site["lon"], max_km=0.2)
+        if match:
+            match.amenities = site["amenities"]
+            continue
+        merged.append(Place(
+            place_id=f"campsite_api:{site['name']}@{site['lat']:.5f},{site['lon']:.5f}",
+            source="campsite_api",
+            name=site["name"],
+            lat=site["lat"],
+            lng=site["lon"],
+            rating=site.get("rating"),
+            amenities=site["amenities"]
+        ))
+    return merged
+
+# Most upstream calls one sync_region can make: two nearby searches of up
+# to three 20-result pages, a details lookup per hit and the campsite API
+SYNC_MAX_CALLS = 2 * (3 + 60) + 1
+
+def sync_region(lat, lon, radius=50000):
+    """Refresh one region of the catalog from the live APIs"""
+    campsites, trails = discover_places(lat, lon, radius)
+    campsites = _merge_amenities(campsites, lat, lon, radius)
+    store_discovery(lat, lon, radius, campsites, trails)
+    return len(campsites) + len(trails)
+
+def sync_stale_regions(limit=None):
+    """
+    Refresh the least recently synced regions older than
+    CATALOG_REFRESH_INTERVAL. Returns the number of regions refreshed.
+    """
+    config = current_app.config
+    cutoff = datetime.utcnow() - timedelta(seconds=config["CATALOG_REFRESH_INTERVAL"])
+    regions = (CatalogRegion.query
+               .filter(CatalogRegion.synced_at < cutoff)
+               .order_by(CatalogRegion.synced_at)
+               .limit(limit or config["CATALOG_SYNC_BATCH"])
+               .all())
+    for region in regions:
+        sync_region(region.lat, region.lon, region.radius)
+    return len(regions)
+
+def query_catalog(lat, lon, radius_km, kind="campground"):
+    """
+    Catalog places within radius_km of a point, nearest first.
+    A bounding box on the indexed lat/lon columns narrows the candidates
+    before the exact haversine check.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180 if cos_lat < 1e-6 else min(180, dlat / cos_lat)
+
+    query = Campsite.query.filter(
+        Campsite.kind == kind,
+        Campsite.lat.between(lat - dlat, lat + dlat)
+    )
+    if dlon < 180 and -180 <= lon - dlon and lon + dlon <= 180:
+        query = query.filter(Campsite.lon.between(lon - dlon, lon + dlon))
+
+    hits = []
+    for row in query:
+        distance = haversine_distance(lat, lon, row.lat, row.lon)
+        if distance <= radius_km:
+            hits.append((distance, row))
+    hits.sort(key=lambda hit: hit[0])
+    return [row.to_record() for _, row in hits]
+
+def catalog_places(lat, lon, radius):
+    """(campsites, trails) from the catalog, or None if the region is stale"""
+    if not is_region_fresh(lat, lon):
+        return None
+    radius_km = radius / 1000
+    return (query_catalog(lat, lon, radius_km, "campground"),
+            query_catalog(lat, lon, radius_km, "trail"))
+
+class CatalogSyncer(threading.Thread):
+    """Background thread that periodically refreshes stale catalog regions"""
+
+    def __init__(self, app):
+        super().__init__(name="catalog-sync", daemon=True)
+        self.app = app
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.app.config["CATALOG_SYNC_PERIOD"]):
+            with self.app.app_context():
+                try:
+                    synced = sync_stale_regions()
+                    if synced:
+                        self.app.logger.info(f"Catalog sync refreshed {synced} regions")
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Catalog sync error: {str(e)}")
+
+    def stop(self):
+        self.stopped.set()
+
+def start_catalog_sync(app):
+    syncer = CatalogSyncer(app)
+    syncer.start()
+    return syncer
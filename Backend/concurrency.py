@@ -0,0 +1,50 @@
+# concurrency.py
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(upstream, max_workers):
+    """
+    Return the shared thread pool for an upstream service.
+    One bounded pool per upstream caps how many calls we have in flight
+    against that provider across all requests in this process.
+    """
+    with _executors_lock:
+        executor = _executors.get(upstream)
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix=f"{upstream}-worker"
+            )
+            _executors[upstream] = executor
+        return executor
+
+def submit(upstream, fn, *args, **kwargs):
+    """
+    Run fn on the upstream's pool inside the current Flask app context.
+    The caller's context variables (e.g. the request trace) go with it.
+    """
+    app = current_app._get_current_object()
+    max_workers = app.config["UPSTREAM_MAX_CONCURRENCY"].get(upstream, 4)
+    context = contextvars.copy_context()
+
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return get_executor(upstream, max_workers).submit(context.run, run)
+
+async def run_blocking(fn, *args, pool="database"):
+    """
+    Await a blocking call (database query, cache read or write) run on a
+    pool, for the async serving mode. Each call gets its own app context,
+    so no session (and pooled connection) is held across awaits and the
+    event loop never blocks on I/O.
+    """
+    return await asyncio.wrap_future(submit(pool, fn, *args))
@@ -1,28 +1,145 @@
-# config.py
-
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-class Config:
-    SECRET_KEY = os.getenv('SECRET_KEY', 'dev')
-    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///camping.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
-    # API Keys
-    WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
-    LIGHT_POLLUTION_API_KEY = os.getenv('LIGHT_POLLUTION_API_KEY')
-    CAMPSITE_API_KEY = os.getenv('CAMPSITE_API_KEY')
-    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-    
-    # API Settings
-    WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
-    LIGHT_POLLUTION_API_URL = "https://api.lightpollutiondata.com/v1/data"
-    CAMPSITE_API_URL = "https://api.campsite.com/v1/campsites"
-    GEMINI_API_URL = "https://api.gemini.com/v1/complete"
-    
-    # Application Settings
-    MAX_RECOMMENDATION_DISTANCE = 50  # km
-    MAX_RECOMMENDATIONS = 10
-    CACHE_TIMEOUT = 3600  # 1 hour in seconds
+# config.py
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Bundled data files, found wherever the app is started from
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+class Config:
+    SECRET_KEY = os.getenv('SECRET_KEY', 'dev')
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///camping.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    
+    # API Keys
+    WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
+    LIGHT_POLLUTION_API_KEY = os.getenv('LIGHT_POLLUTION_API_KEY')
+    CAMPSITE_API_KEY = os.getenv('CAMPSITE_API_KEY')
+    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+    GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
+    
+    # API Settings
+    WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+    WEATHER_FIND_API_URL = "https://api.openweathermap.org/data/2.5/find"
+    LIGHT_POLLUTION_API_URL = "https://api.lightpollutiondata.com/v1/data"
+    CAMPSITE_API_URL = "https://api.campsite.com/v1/campsites"
+    GEMINI_API_URL = "https://api.gemini.com/v1/complete"
+
+    # Light pollution source: "api" or "raster" (local Bortle grid file)
+    LIGHT_POLLUTION_BACKEND = os.getenv('LIGHT_POLLUTION_BACKEND', 'api')
+    LIGHT_POLLUTION_RASTER_PATH = os.getenv('LIGHT_POLLUTION_RASTER_PATH', os.path.join(DATA_DIR, 'bortle.bgrid'))
+
+    # Geocoding: bundled place names answer common lookups offline (empty
+    # path disables), the rest go to Nominatim (1 request/second policy)
+    GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', os.path.join(DATA_DIR, 'gazetteer.tsv'))
+    GEOCODER_USER_AGENT = os.getenv('GEOCODER_USER_AGENT', 'camping_app')
+    GEOCODE_TIMEOUT = 5  # seconds per Nominatim request
+    GEOCODE_MIN_INTERVAL = 1.0  # seconds between Nominatim requests, per worker process
+    GEOCODE_QUEUE_TIMEOUT = 10  # seconds a request waits for its queued lookup
+    GEOCODE_CACHE_TTL = 30 * 24 * 3600  # geocoded addresses, in the database
+    GEOCODE_NEGATIVE_TTL = 24 * 3600  # addresses Nominatim couldn't find
+
+    # Weather lookup mode: "regional" fills a search area from one bulk
+    # station query, "point" fetches every weather tile separately
+    WEATHER_MODE = os.getenv('WEATHER_MODE', 'regional')
+    WEATHER_FIND_COUNT = 50  # stations per bulk query (API maximum)
+    WEATHER_STATION_MAX_KM = 10  # furthest station we'll use for a tile
+    
+    # Application Settings
+    MAX_RECOMMENDATION_DISTANCE = 50  # km
+    MAX_RECOMMENDATIONS = 10
+    CACHE_TIMEOUT = 3600  # 1 hour in seconds
+
+    # Cache Settings
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')  # memory, sqlite or redis
+    CACHE_URL = os.getenv('CACHE_URL', 'cache.db')  # SQLite file path or redis:// URL
+    CACHE_MAX_ENTRIES = 2048
+    CACHE_MAINTENANCE_INTERVAL = 5  # seconds between SQLite cache LRU write-backs and evictions
+    CACHE_TIMEOUTS = {  # per-service TTLs in seconds; others use CACHE_TIMEOUT
+        "weather": 1800,
+        "light_pollution": 7 * 24 * 3600,
+        "campsites": 3600,
+        "ai_recommendation": 3600,
+        "summary_jobs": 600,
+        "result_pages": 600,
+        "candidate_sets": 600,  # enriched candidates kept for re-ranking
+        "travel_times": 24 * 3600,  # drive times barely change day to day
+        "directions": 3600
+    }
+    CACHE_TILE_DEGREES = {  # geo tile size for coordinate cache keys
+        "weather": 0.05,  # ~5 km; weather is smooth at this scale
+        "light_pollution": 0.01,  # ~1 km
+        "campsites": 0.05,
+        "travel_times": 0.02  # ~2 km origin tiles
+    }
+
+    # Google Maps Settings
+    MAPS_MATRIX_BATCH = 25  # destinations per Distance Matrix call (API maximum)
+    MAPS_PAGE_TOKEN_DELAY = 0.5  # seconds before first next-page attempt
+    MAPS_PAGE_TOKEN_TIMEOUT = 10  # seconds to wait for a page token to activate
+    MAPS_RETRY_TIMEOUT = 10  # seconds googlemaps keeps retrying one call (its default is 60)
+
+    # HTTP Client Settings
+    HTTP_TIMEOUT = (3.05, 10)  # connect, read seconds
+    HTTP_RETRIES = 2
+    HTTP_BACKOFF_FACTOR = 0.3  # seconds; doubles each retry, plus jitter
+    HTTP_POOL_CONNECTIONS = 10  # hosts with a cached pool
+    HTTP_POOL_MAXSIZE = 16  # keep-alive connections per host
+    CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failures before failing fast
+    CIRCUIT_RESET_TIMEOUT = 30  # seconds before trying a tripped upstream again
+    ASYNC_MAX_CONNECTIONS = 100  # async serving mode: connections shared by all upstreams
+
+    # Concurrency Settings
+    ENRICHMENT_TIMEOUT = 20  # seconds per recommendation request
+    UPSTREAM_MAX_CONCURRENCY = {
+        "weather": 8,
+        "light_pollution": 8,
+        "maps": 8,
+        "discovery": 16,
+        "gemini": 4,
+        "catalog": 1,  # serializes catalog writes
+        "batch": 4,
+        "travel_times": 8,
+        "geocode": 1,  # the queue that keeps to Nominatim's rate limit
+        "database": 4,  # async serving mode's blocking queries; below the DB pool size
+        "cache": 8  # async serving mode's cache reads and writes (SQLite/Redis block)
+    }
+
+    RESULTS_PAGE_SIZE = 20  # results per page when paging with limit/cursor
+    RESULTS_MAX_PAGE_SIZE = 200
+    BATCH_MAX_ORIGINS = 25  # origins per /api/recommendations/batch request
+    RERANK_MAX_SHIFT_KM = 10  # furthest a re-rank may move the origin from the original search
+
+    # Background AI Summary Settings
+    SUMMARY_MAX_WAIT = 15  # longest long-poll, in seconds
+    SUMMARY_STREAM_TIMEOUT = 60  # seconds before an SSE stream gives up
+    SUMMARY_POLL_INTERVAL = 0.25  # seconds between shared-cache polls
+
+    # Campsite Catalog Settings
+    CATALOG_ENABLED = os.getenv('CATALOG_ENABLED', 'true').lower() == 'true'
+    CATALOG_REGION_DEGREES = 0.1  # size of a synced region
+    CATALOG_MAX_AGE = 24 * 3600  # serve a region from the catalog while younger than this
+    CATALOG_REFRESH_INTERVAL = 12 * 3600  # background sync refreshes regions older than this
+    CATALOG_SYNC_ENABLED = os.getenv('CATALOG_SYNC_ENABLED', 'false').lower() == 'true'
+    CATALOG_SYNC_PERIOD = 600  # seconds between background sync passes
+    CATALOG_SYNC_BATCH = 10  # regions refreshed per pass
+
+    # Hot Region Prewarm Settings
+    PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'false').lower() == 'true'
+    PREWARM_PERIOD = 300  # seconds between passes; keep below the shortest refresh-ahead window
+    PREWARM_CALL_BUDGET = int(os.getenv('PREWARM_CALL_BUDGET', '300'))  # upstream calls per pass
+    PREWARM_REFRESH_AHEAD = 0.2  # refresh entries in the last 20% of their TTL
+    PREWARM_HALF_LIFE = 3600  # seconds for a region's request count to halve
+    PREWARM_MIN_SCORE = 3  # decayed requests before a region counts as hot
+    PREWARM_MAX_REGIONS = 30  # hot regions refreshed per pass
+    PREWARM_TRACKED_REGIONS = 1000  # regions remembered per process
+
+    # Review Settings
+    REVIEWS_PAGE_SIZE = 20
+    REVIEWS_MAX_PAGE_SIZE = 100
+
+    # Instrumentation Settings
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))  # fraction of requests run under cProfile
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
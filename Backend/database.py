@@ -1,5 +1,5 @@
-# database.py
-
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
+# database.py
+
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
@@ -0,0 +1,25 @@
+# geo.py
+
+import math
+
+EARTH_RADIUS_KM = 6371
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM  # Earth radius in km
+    dLat = math.radians(lat2 - lat1)
+    dLon = math.radians(lon2 - lon1)
+    a = (math.sin(dLat/2)**2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon/2)**2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return R * c
+
+def snap_to_tile(lat, lon, tile_deg):
+    """
+    Snap coordinates to the centre of their fixed-degree grid tile.
+    Points in the same tile map to identical coordinates, so they share
+    cache entries and upstream fetches.
+    """
+    lon = ((lon + 180) % 360) - 180
+    lat = (math.floor(lat / tile_deg) + 0.5) * tile_deg
+    lon = (math.floor(lon / tile_deg) + 0.5) * tile_deg
+    return round(min(max(lat, -90), 90), 6), round(min(max(lon, -180), 180), 6)
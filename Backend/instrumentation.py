@@ -0,0 +1,235 @@
+# instrumentation.py
+
+import bisect
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from flask import g, request
+
+# Latency buckets in seconds, Prometheus style (each bucket counts <= bound)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    """Thread-safe latency histogram keyed by one label"""
+
+    def __init__(self, name, label, help_text):
+        self.name = name
+        self.label = label
+        self.help_text = help_text
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self.lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0}
+            index = bisect.bisect_left(BUCKETS, seconds)
+            if index < len(BUCKETS):
+                series["buckets"][index] += 1
+            series["count"] += 1
+            series["sum"] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for value, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, series["buckets"]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_count{{{self.label}="{value}"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {series["sum"]:.6f}')
+        return lines
+
+class Counter:
+    """Thread-safe counter keyed by a tuple of label values"""
+
+    def __init__(self, name, labels, help_text):
+        self.name = name
+        self.labels = labels
+        self.help_text = help_text
+        self.values = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self.lock:
+            self.values[label_values] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, count in sorted(self.values.items()):
+                labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+                lines.append(f"{self.name}_total{{{labels}}} {count}")
+        return lines
+
+REQUEST_SECONDS = Histogram("karavan_request_seconds", "endpoint", "Request latency")
+STAGE_SECONDS = Histogram("karavan_stage_seconds", "stage", "Recommendation pipeline stage latency")
+UPSTREAM_SECONDS = Histogram("karavan_upstream_seconds", "upstream", "Upstream call latency")
+UPSTREAM_ERRORS = Counter("karavan_upstream_errors", ("upstream",), "Failed upstream calls")
+CACHE_LOOKUPS = Counter("karavan_cache_lookups", ("namespace", "result"), "Cache lookups")
+METRICS = (REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_ERRORS, CACHE_LOOKUPS)
+
+class RequestTrace:
+    """
+    Timings gathered while serving one request.
+    Shared with the pool workers doing the request's upstream calls, so
+    every update takes the lock.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = defaultdict(lambda: {"count": 0, "ms": 0.0})
+        self.upstreams = defaultdict(lambda: {"count": 0, "errors": 0, "ms": 0.0})
+        self.cache = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self.lock = threading.Lock()
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name]["count"] += 1
+            self.stages[name]["ms"] += seconds * 1000
+
+    def add_upstream(self, upstream, seconds, ok):
+        with self.lock:
+            self.upstreams[upstream]["count"] += 1
+            self.upstreams[upstream]["ms"] += seconds * 1000
+            if not ok:
+                self.upstreams[upstream]["errors"] += 1
+
+    def add_cache(self, namespace, hit):
+        with self.lock:
+            self.cache[namespace]["hits" if hit else "misses"] += 1
+
+    def server_timing(self):
+        """Server-Timing header value: stages, then upstreams, then the total"""
+        with self.lock:
+            parts = [f"{name};dur={t['ms']:.1f}" for name, t in self.stages.items()]
+            parts += [
+                f"{name.replace(':', '-')};desc=\"{t['count']} calls\";dur={t['ms']:.1f}"
+                for name, t in self.upstreams.items()
+            ]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "total_ms": (time.perf_counter() - self.started) * 1000,
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "upstreams": {k: dict(v) for k, v in self.upstreams.items()},
+                "cache": {k: dict(v) for k, v in self.cache.items()}
+            }
+
+# The trace of the request being served; concurrency.submit copies the
+# context into pool workers so their calls land in the same trace.
+_trace = contextvars.ContextVar("trace", default=None)
+
+def current_trace():
+    return _trace.get()
+
+def begin_trace():
+    """Start tracing the current request; returns the token for end_trace"""
+    return _trace.set(RequestTrace())
+
+def end_trace(token):
+    _trace.reset(token)
+
+@contextmanager
+def stage(name):
+    """Time a block as a named pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(name, elapsed)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add_stage(name, elapsed)
+
+def record_upstream(upstream, seconds, ok=True):
+    UPSTREAM_SECONDS.observe(upstream, seconds)
+    if not ok:
+        UPSTREAM_ERRORS.inc(upstream)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add_upstream(upstream, seconds, ok)
+
+def record_cache(namespace, hit):
+    CACHE_LOOKUPS.inc(namespace, "hit" if hit else "miss")
+    trace = _trace.get()
+    if trace is not None:
+        trace.add_cache(namespace, hit)
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# cProfile can only run one profiler per process at a time
+_profile_lock = threading.Lock()
+
+def _start_profile(app):
+    if random.random() >= app.config["PROFILE_SAMPLE_RATE"] or not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is active
+        _profile_lock.release()
+        return None
+    return profiler
+
+def _finish_profile(app, profiler):
+    profiler.disable()
+    _profile_lock.release()
+    directory = app.config["PROFILE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    name = (request.endpoint or "unknown").replace(".", "_")
+    path = os.path.join(directory, f"{int(time.time() * 1000)}-{name}.prof")
+    profiler.dump_stats(path)
+    app.logger.info(f"Profiled {request.path} to {path}")
+
+def init_app(app):
+    """
+    Trace every request: stage, upstream and cache timings are reported in
+    a Server-Timing header, in the JSON body with ?debug=timing, and in the
+    /metrics histograms. A PROFILE_SAMPLE_RATE fraction of requests also
+    runs under cProfile (request thread only), saved to PROFILE_DIR.
+    """
+    @app.before_request
+    def start_trace():
+        g.trace_token = begin_trace()
+        g.profiler = _start_profile(app)
+
+    @app.after_request
+    def finish_trace(response):
+        trace = _trace.get()
+        if trace is None:
+            return response
+        REQUEST_SECONDS.observe(request.endpoint or "unknown", time.perf_counter() - trace.started)
+        response.headers["Server-Timing"] = trace.server_timing()
+        if request.args.get("debug") == "timing" and response.is_json and not response.is_streamed:
+            payload = response.get_json()
+            if isinstance(payload, dict):
+                payload["debug"] = {"timing": trace.to_dict()}
+                response.set_data(app.json.dumps(payload))
+        return response
+
+    @app.teardown_request
+    def clear_trace(exc):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            _finish_profile(app, profiler)
+        token = g.pop("trace_token", None)
+        if token is not None:
+            end_trace(token)
@@ -1,43 +1,134 @@
-# models.py
-
-from datetime import datetime
-from database import db
-
-# Example "User" model
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    # Basic user preferences
-    prefers_solitude = db.Column(db.Boolean, default=False)
-    prefers_fishing = db.Column(db.Boolean, default=False)
-    prefers_hiking = db.Column(db.Boolean, default=False)
-    # Additional fields as needed
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "email": self.email,
-            "prefers_solitude": self.prefers_solitude,
-            "prefers_fishing": self.prefers_fishing,
-            "prefers_hiking": self.prefers_hiking
-        }
-
-# Example "CampReview" model for user-generated content
-class CampReview(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    campsite_name = db.Column(db.String(200), nullable=False)
-    rating = db.Column(db.Integer, default=0)  # 1-5 star rating
-    review_text = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "user_id": self.user_id,
-            "campsite_name": self.campsite_name,
-            "rating": self.rating,
-            "review_text": self.review_text,
-            "created_at": self.created_at.isoformat()
-        }
+# models.py
+
+import json
+from datetime import datetime
+from database import db
+from records import Packed, Place, Trail
+
+# Example "User" model
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(128), nullable=False)
+    # Basic user preferences
+    prefers_solitude = db.Column(db.Boolean, default=False)
+    prefers_fishing = db.Column(db.Boolean, default=False)
+    prefers_hiking = db.Column(db.Boolean, default=False)
+    # Additional fields as needed
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "email": self.email,
+            "prefers_solitude": self.prefers_solitude,
+            "prefers_fishing": self.prefers_fishing,
+            "prefers_hiking": self.prefers_hiking
+        }
+
+# Example "CampReview" model for user-generated content
+class CampReview(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    campsite_name = db.Column(db.String(200), nullable=False)
+    rating = db.Column(db.Integer, default=0)  # 1-5 star rating
+    review_text = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Reviews for a campsite are paged by id
+    __table_args__ = (db.Index("ix_camp_review_campsite_id", "campsite_name", "id"),)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "campsite_name": self.campsite_name,
+            "rating": self.rating,
+            "review_text": self.review_text,
+            "created_at": self.created_at.isoformat()
+        }
+
+# Running review totals per campsite, maintained as reviews are posted
+class ReviewAggregate(db.Model):
+    campsite_name = db.Column(db.String(200), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    recent_rating = db.Column(db.Float, nullable=True)  # exponentially weighted, newest reviews count most
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def mean_rating(self):
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    def to_dict(self):
+        return {
+            "campsite_name": self.campsite_name,
+            "count": self.review_count,
+            "mean": self.mean_rating,
+            "recent": self.recent_rating
+        }
+
+# Local catalog of campsites and trails, refreshed from the live APIs
+class Campsite(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    place_id = db.Column(db.String(255), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default="campground")  # campground or trail
+    source = db.Column(db.String(50), nullable=False, default="google_places")
+    name = db.Column(db.String(200), nullable=False)
+    address = db.Column(db.String(300), nullable=True)
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    rating = db.Column(db.Float, nullable=True)
+    is_open = db.Column(db.Boolean, nullable=True)
+    website = db.Column(db.String(300), nullable=True)
+    phone = db.Column(db.String(50), nullable=True)
+    amenities = db.Column(db.Text, nullable=True)  # JSON list
+    photos = db.Column(db.Text, nullable=True)  # JSON list
+    reviews = db.Column(db.Text, nullable=True)  # JSON list, trails only
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    # Bounding-box queries filter on lat first, then lon
+    __table_args__ = (
+        db.UniqueConstraint("place_id", "kind"),
+        db.Index("ix_campsite_lat_lon", "lat", "lon"),
+    )
+
+    def to_record(self):
+        """A Place (or Trail); photos and reviews are packed from their JSON text unparsed"""
+        fields = dict(
+            place_id=self.place_id,
+            name=self.name,
+            address=self.address,
+            lat=self.lat,
+            lng=self.lon,
+            rating=self.rating,
+            is_open=self.is_open,
+            photos=Packed.from_json(self.photos),
+            website=self.website,
+            phone=self.phone,
+            amenities=json.loads(self.amenities or "[]"),
+            source=self.source
+        )
+        if self.kind == "trail":
+            return Trail(reviews=Packed.from_json(self.reviews), **fields)
+        return Place(**fields)
+
+# Regions of the catalog and when they were last refreshed
+class CatalogRegion(db.Model):
+    tile = db.Column(db.String(40), primary_key=True)
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    radius = db.Column(db.Integer, nullable=False)  # meters
+    place_count = db.Column(db.Integer, default=0)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# Persistent geocoder answers by normalized address; lat/lon are null for
+# addresses the geocoder couldn't find
+class GeocodeEntry(db.Model):
+    normalized_address = db.Column(db.String(300), primary_key=True)  # normalize_address() of the lookup
+    lat = db.Column(db.Float, nullable=True)
+    lon = db.Column(db.Float, nullable=True)
+    address = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {"lat": self.lat, "lon": self.lon, "address": self.address}
@@ -0,0 +1,151 @@
+# prewarm.py
+
+import threading
+import time
+from flask import current_app
+from database import db
+from cache import cache_timeout, tile_coordinates
+from catalog import SYNC_MAX_CALLS, region_tile, is_region_fresh, sync_region
+from instrumentation import begin_trace, end_trace, current_trace
+from services.weather_service import get_weather, refresh_weather
+from services.light_pollution_service import fetch_light_pollution_level
+
+class HotRegions:
+    """
+    Request origins counted per catalog region, decaying with
+    PREWARM_HALF_LIFE, plus the weather and light pollution cache tiles of
+    the campsites last recommended there. Per process; with a shared cache
+    backend the workers' prewarm passes skip tiles another worker refreshed.
+    """
+
+    def __init__(self):
+        self.regions = {}
+        self.lock = threading.Lock()
+
+    def _decayed(self, region, now, half_life):
+        return region["score"] * 0.5 ** ((now - region["seen_at"]) / half_life)
+
+    def record(self, lat, lon, campsites):
+        config = current_app.config
+        key, center_lat, center_lon = region_tile(lat, lon)
+        coords = [(site.lat, site.lng) for site in campsites]
+        tiles = {
+            namespace: {tile_coordinates(namespace, *c) for c in coords}
+            for namespace in ("weather", "light_pollution")
+        }
+        now = time.time()
+        with self.lock:
+            region = self.regions.get(key)
+            if region is None:
+                region = self.regions[key] = {"key": key, "lat": center_lat, "lon": center_lon, "score": 0.0}
+            else:
+                region["score"] = self._decayed(region, now, config["PREWARM_HALF_LIFE"])
+            region.update(score=region["score"] + 1, seen_at=now, tiles=tiles)
+
+            if len(self.regions) > config["PREWARM_TRACKED_REGIONS"]:
+                coldest = min(self.regions.values(),
+                              key=lambda r: self._decayed(r, now, config["PREWARM_HALF_LIFE"]))
+                del self.regions[coldest["key"]]
+
+    def hottest(self):
+        """Regions with at least PREWARM_MIN_SCORE decayed requests, hottest first"""
+        config = current_app.config
+        now = time.time()
+        with self.lock:
+            scored = [(self._decayed(r, now, config["PREWARM_HALF_LIFE"]), r) for r in self.regions.values()]
+        scored = [(score, r) for score, r in scored if score >= config["PREWARM_MIN_SCORE"]]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [dict(r, score=score) for score, r in scored[:config["PREWARM_MAX_REGIONS"]]]
+
+    def clear(self):
+        with self.lock:
+            self.regions.clear()
+
+hot_regions = HotRegions()
+
+def record_origin(lat, lon, campsites):
+    """Note a recommendation request and the campsites it was served"""
+    hot_regions.record(lat, lon, campsites)
+
+def _due(fn, namespace, tiles):
+    """Tiles whose cached entry is missing or in the last PREWARM_REFRESH_AHEAD of its TTL"""
+    ahead = current_app.config["PREWARM_REFRESH_AHEAD"] * cache_timeout(namespace)
+    due = []
+    for tile in tiles:
+        remaining = fn.ttl(*tile)
+        if remaining is None or remaining < ahead:
+            due.append(tile)
+    return due
+
+def _calls():
+    return sum(upstream["count"] for upstream in current_trace().upstreams.values())
+
+def prewarm_region(region, budget):
+    """
+    Refresh one hot region's campsite catalog, weather and light pollution
+    tiles ahead of expiry, spending at most budget upstream calls. The
+    catalog sync only runs when the budget left covers its worst case.
+    Returns the upstream calls made.
+    """
+    config = current_app.config
+    token = begin_trace()
+    try:
+        if (config["CATALOG_ENABLED"] and budget - _calls() >= SYNC_MAX_CALLS
+                and not is_region_fresh(region["lat"], region["lon"], ahead=config["PREWARM_REFRESH_AHEAD"])):
+            sync_region(region["lat"], region["lon"])
+
+        weather = _due(get_weather, "weather", region["tiles"]["weather"])
+        if weather and _calls() < budget:
+            refresh_weather(weather, max_calls=budget - _calls())
+
+        if config["LIGHT_POLLUTION_BACKEND"] != "raster":
+            light_pollution = _due(fetch_light_pollution_level, "light_pollution",
+                                   region["tiles"]["light_pollution"])
+            for tile in light_pollution[:max(0, budget - _calls())]:
+                fetch_light_pollution_level.prime(fetch_light_pollution_level.uncached(*tile), *tile)
+        return _calls()
+    finally:
+        end_trace(token)
+
+def prewarm_pass(budget=None):
+    """
+    Refresh the hottest regions, hottest first, until the pass has spent
+    its PREWARM_CALL_BUDGET of upstream calls. Returns (regions, calls).
+    """
+    if budget is None:
+        budget = current_app.config["PREWARM_CALL_BUDGET"]
+    regions = calls = 0
+    for region in hot_regions.hottest():
+        if calls >= budget:
+            break
+        spent = prewarm_region(region, budget - calls)
+        calls += spent
+        regions += bool(spent)
+    return regions, calls
+
+class Prewarmer(threading.Thread):
+    """Background thread that runs a prewarm pass every PREWARM_PERIOD seconds"""
+
+    def __init__(self, app):
+        super().__init__(name="prewarm", daemon=True)
+        self.app = app
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.app.config["PREWARM_PERIOD"]):
+            with self.app.app_context():
+                try:
+                    regions, calls = prewarm_pass()
+                    if regions:
+                        self.app.logger.info(f"Prewarm refreshed {regions} regions with {calls} upstream calls")
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f"Prewarm error: {str(e)}")
+
+    def stop(self):
+        self.stopped.set()
+
+def start_prewarm(app):
+    prewarmer = Prewarmer(app)
+    prewarmer.start()
+    return prewarmer
@@ -1,125 +1,384 @@
-# recommendation.py
-
-import math
-from services.weather_service import get_weather
-from services.light_pollution_service import get_light_pollution_level
-from services.maps_service import get_nearby_places, get_hiking_trails
-from services.gemini_service import get_ai_recommendation
-
-def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
-    dLat = math.radians(lat2 - lat1)
-    dLon = math.radians(lon2 - lon1)
-    a = (math.sin(dLat/2)**2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dLon/2)**2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def recommend_campsites(user_lat, user_lon, user_preferences):
-    """
-    1) Fetch nearby campsites and hiking trails using Google Maps
-    2) Get weather and light pollution data for each location
-    3) Filter and score based on user preferences
-    4) Generate AI recommendations
-    """
-    # 1) Get potential locations
-    campsites = get_nearby_places(user_lat, user_lon, radius=50000, place_type="campground")
-    hiking_trails = get_hiking_trails(user_lat, user_lon, radius=50000)
-    
-    # 2) Process each location
-    results = []
-    for site in campsites:
-        # Get weather and light pollution data
-        weather = get_weather(site["location"]["lat"], site["location"]["lng"])
-        lp_data = get_light_pollution_level(site["location"]["lat"], site["location"]["lng"])
-        
-        # Calculate distance
-        distance = haversine_distance(
-            user_lat, user_lon,
-            site["location"]["lat"], site["location"]["lng"]
-        )
-        
-        # Calculate base score
-        base_score = 10
-        
-        # Weather factors
-        if weather["temp"] and 15 <= weather["temp"] <= 25:  # Ideal temperature range
-            base_score += 2
-        if weather["clouds"] and weather["clouds"] < 30:  # Clear skies
-            base_score += 2
-        if not weather["rain"]:
-            base_score += 1
-            
-        # Light pollution factors
-        if lp_data["level"] >= 8:  # Excellent for stargazing
-            base_score += 3
-        elif lp_data["level"] >= 6:  # Good for stargazing
-            base_score += 2
-            
-        # Distance factor (penalize longer distances)
-        base_score -= (distance / 10)
-        
-        # User preference factors
-        if user_preferences.get("prefers_fishing") and "fishing" in site.get("amenities", []):
-            base_score += 2
-        if user_preferences.get("prefers_hiking"):
-            # Check for nearby hiking trails
-            nearby_trails = [t for t in hiking_trails 
-                           if haversine_distance(
-                               site["location"]["lat"], site["location"]["lng"],
-                               t["location"]["lat"], t["location"]["lng"]
-                           ) < 5]  # Within 5km
-            if nearby_trails:
-                base_score += 2
-        if user_preferences.get("prefers_solitude") and not site.get("is_open", True):
-            base_score += 1
-            
-        # Add location to results
-        results.append({
-            "name": site["name"],
-            "address": site["address"],
-            "location": site["location"],
-            "distance": distance,
-            "weather": weather,
-            "light_pollution": lp_data,
-            "rating": site.get("rating", 0),
-            "is_open": site.get("is_open", True),
-            "photos": site.get("photos", []),
-            "website": site.get("website"),
-            "phone": site.get("phone"),
-            "directions": site.get("directions"),
-            "score": base_score
-        })
-    
-    # Sort by score
-    results.sort(key=lambda x: x["score"], reverse=True)
-    
-    # Get top locations for AI recommendation
-    top_spots = results[:5]
-    top_spots_text = "\n".join([
-        f"{idx+1}. {spot['name']} (score: {spot['score']:.2f})\n"
-        f"   Weather: {spot['weather']['description']}, "
-        f"Temperature: {spot['weather']['temp']}°C\n"
-        f"   Light Pollution: {spot['light_pollution']['level']}/10\n"
-        f"   Distance: {spot['distance']:.1f}km"
-        for idx, spot in enumerate(top_spots)
-    ])
-    
-    # Generate AI recommendation
-    prompt = f"""User preferences: {user_preferences}
-Top camping spots:\n{top_spots_text}\n
-Based on the weather conditions, light pollution levels, and user preferences,
-which campsite would be the best choice and why? Consider:
-1. Weather conditions for camping and stargazing
-2. Light pollution levels for stargazing
-3. Distance and accessibility
-4. User preferences (fishing, hiking, solitude)
-Provide a detailed recommendation with specific reasons.
-"""
-    ai_summary = get_ai_recommendation(prompt)
-    
-    return {
-        "results": results,
-        "ai_summary": ai_summary,
-        "hiking_trails": hiking_trails
-    }
+# recommendation.py
+
+import time
+import uuid
+import numpy as np
+from concurrent.futures import wait, as_completed
+from flask import current_app
+from concurrency import submit
+from cache import get_cache, cache_timeout, tile_coordinates
+from geo import haversine_distance
+from spatial_index import SpatialIndex
+from scoring import campsite_columns, drive_minutes_column, score_batch, rank
+from services.weather_service import get_weather_many
+from services.light_pollution_service import get_light_pollution_level, unavailable_light_pollution, lookup_many
+from services.maps_service import DetailsRegistry, get_maps_client, discover_places
+from services.travel_time_service import get_drive_times, cached_drive_times
+from services.gemini_service import get_ai_recommendation, summary_request_key
+from summary_jobs import start_summary
+from catalog import catalog_places, store_discovery
+from reviews import community_ratings
+from prewarm import record_origin
+from instrumentation import stage
+
+SEARCH_RADIUS = 50000  # meters
+
+# Enriched candidate sets kept for re-ranking, by handle
+CANDIDATES = "candidate_sets"
+
+def _submit_by_tile(upstream, fn, campsites):
+    """Submit one lookup per cache tile; campsites in a tile share its future"""
+    futures = {}
+    site_futures = []
+    for site in campsites:
+        coords = tile_coordinates(upstream, site.lat, site.lng)
+        if coords not in futures:
+            futures[coords] = submit(upstream, fn, *coords)
+        site_futures.append(futures[coords])
+    return site_futures
+
+def enrich_campsites(campsites, timeout=None):
+    """
+    Fetch weather and light pollution data for every campsite concurrently.
+    Returns (weather, light_pollution) lists aligned with campsites.
+    Lookups still pending when the deadline passes get the fallback data.
+    """
+    if timeout is None:
+        timeout = current_app.config["ENRICHMENT_TIMEOUT"]
+    deadline = time.monotonic() + timeout
+    coords = [(site.lat, site.lng) for site in campsites]
+
+    use_raster = current_app.config["LIGHT_POLLUTION_BACKEND"] == "raster"
+    if use_raster:
+        # Local grid: one vectorized read, nothing to fan out
+        with stage("light_pollution"):
+            light_pollution = lookup_many(coords)
+    else:
+        lp_futures = _submit_by_tile("light_pollution", get_light_pollution_level, campsites)
+
+    # Weather runs in this thread while the light pollution lookups proceed
+    with stage("weather"):
+        weather = get_weather_many(coords, timeout=max(0, deadline - time.monotonic()))
+
+    if not use_raster:
+        # Time spent waiting after weather finished; the lookups overlap it
+        with stage("light_pollution_wait"):
+            _, pending = wait(set(lp_futures), timeout=max(0, deadline - time.monotonic()))
+        if pending:
+            current_app.logger.warning(
+                f"Enrichment deadline reached with {len(pending)} lookups pending"
+            )
+            for future in pending:
+                future.cancel()
+        light_pollution = [
+            f.result() if f not in pending else unavailable_light_pollution("timed out")
+            for f in lp_futures
+        ]
+    return weather, light_pollution
+
+def build_summary_prompt(top_spots, user_preferences):
+    """Gemini prompt describing the top scored spots"""
+    top_spots_text = "\n".join([
+        f"{idx+1}. {spot['name']} (score: {spot['score']:.2f})\n"
+        f"   Weather: {spot['weather'].description}, "
+        f"Temperature: {spot['weather'].temp}°C\n"
+        f"   Light Pollution: {spot['light_pollution'].level}/10\n"
+        f"   Distance: {spot['distance']:.1f}km"
+        for idx, spot in enumerate(top_spots)
+    ])
+    
+    return f"""User preferences: {user_preferences}
+Top camping spots:\n{top_spots_text}\n
+Based on the weather conditions, light pollution levels, and user preferences,
+which campsite would be the best choice and why? Consider:
+1. Weather conditions for camping and stargazing
+2. Light pollution levels for stargazing
+3. Distance and accessibility
+4. User preferences (fishing, hiking, solitude)
+Provide a detailed recommendation with specific reasons.
+"""
+
+def find_candidates(user_lat, user_lon, registry=None):
+    """
+    Campsites and hiking trails around a point: from the local catalog
+    when it covers this region, otherwise from Google Maps (sharing
+    Place Details lookups through registry, if given).
+    """
+    catalog = None
+    if current_app.config["CATALOG_ENABLED"]:
+        with stage("catalog"):
+            catalog = catalog_places(user_lat, user_lon, SEARCH_RADIUS)
+    if catalog:
+        record_origin(user_lat, user_lon, catalog[0])
+        return catalog
+
+    with stage("discovery"):
+        campsites, hiking_trails = discover_places(user_lat, user_lon, radius=SEARCH_RADIUS, registry=registry)
+    if current_app.config["CATALOG_ENABLED"]:
+        submit("catalog", store_discovery, user_lat, user_lon, SEARCH_RADIUS, campsites, hiking_trails)
+    record_origin(user_lat, user_lon, campsites)
+    return campsites, hiking_trails
+
+def match_trails(campsites, hiking_trails):
+    """Closest hiking trail to each campsite, and whether it is within 5km"""
+    with stage("trails"):
+        trail_index = SpatialIndex(hiking_trails)
+        nearest_trails = [
+            trail_index.nearest(site.lat, site.lng)
+            for site in campsites
+        ]
+        near_trail = np.array(
+            [trail is not None and distance < 5 for trail, distance in nearest_trails],  # Within 5km
+            dtype=bool
+        )
+    return nearest_trails, near_trail
+
+def rank_campsites(user_lat, user_lon, user_preferences, campsites, columns,
+                   weather_data, lp_levels, nearest_trails, near_trail, community, drive_times):
+    """
+    Score campsites for one user and return result dicts, best first.
+    Results share the sites' weather, light pollution and packed photos
+    rather than copying them; they are expanded when serialized.
+    """
+    with stage("scoring"):
+        scores, distances = score_batch(user_lat, user_lon, columns, near_trail, user_preferences,
+                                        drive_minutes_column(drive_times))
+        order = rank(scores)
+
+    results = []
+    for i in order:
+        site = campsites[i]
+        trail, trail_distance = nearest_trails[i]
+        results.append({
+            "place_id": site.place_id,
+            "name": site.name,
+            "address": site.address,
+            "location": site.location,
+            "distance": float(distances[i]),
+            "drive": drive_times[i],
+            "weather": weather_data[i],
+            "light_pollution": lp_levels[i],
+            "rating": site.rating,
+            "community_rating": community.get(site.name),
+            "is_open": site.is_open,
+            "photos": site.packed_photos,
+            "website": site.website,
+            "phone": site.phone,
+            "nearest_trail": {
+                "place_id": trail.place_id,
+                "name": trail.name,
+                "distance": trail_distance
+            } if trail else None,
+            "score": float(scores[i])
+        })
+    return results
+
+def finish_recommendation(user_lat, user_lon, user_preferences, results, hiking_trails, async_summary):
+    """
+    Attach (or queue) the AI summary. Turn-by-turn directions are left to
+    /api/directions, for the campsite the user picks.
+    """
+    # Get top locations for AI recommendation
+    top_spots = results[:5]
+    prompt = build_summary_prompt(top_spots, user_preferences)
+    request_key = summary_request_key(top_spots, user_preferences)
+    if async_summary:
+        return {
+            "results": results,
+            "ai_summary": None,
+            "ai_summary_job": start_summary(prompt, request_key),
+            "hiking_trails": hiking_trails
+        }
+
+    with stage("summary"):
+        ai_summary = get_ai_recommendation(prompt, request_key)
+
+    return {
+        "results": results,
+        "ai_summary": ai_summary,
+        "hiking_trails": hiking_trails
+    }
+
+def recommend_campsites(user_lat, user_lon, user_preferences, async_summary=False):
+    """
+    1) Fetch nearby campsites and hiking trails using Google Maps
+    2) Get weather, light pollution and drive time data for each location
+    3) Filter and score based on user preferences
+    4) Generate AI recommendations
+    With async_summary the AI summary is queued in the background and
+    the result carries its job id instead of the text.
+    """
+    # 1) Get potential locations
+    campsites, hiking_trails = find_candidates(user_lat, user_lon)
+
+    # 2) Process each location; drive times are fetched alongside
+    timeout = current_app.config["ENRICHMENT_TIMEOUT"]
+    drive_times = submit("travel_times", get_drive_times, user_lat, user_lon, campsites, timeout)
+    with stage("enrichment"):
+        weather_data, lp_levels = enrich_campsites(campsites, timeout)
+    with stage("travel_times_wait"):
+        drive_times = drive_times.result()
+    nearest_trails, near_trail = match_trails(campsites, hiking_trails)
+
+    # 3) Score all campsites at once and sort by score
+    community = community_ratings(site.name for site in campsites)
+    columns = campsite_columns(campsites, weather_data, lp_levels, community)
+    results = rank_campsites(user_lat, user_lon, user_preferences, campsites, columns,
+                             weather_data, lp_levels, nearest_trails, near_trail, community,
+                             drive_times)
+
+    # 4) Generate AI recommendation
+    recommendation = finish_recommendation(user_lat, user_lon, user_preferences, results,
+                                           hiking_trails, async_summary)
+    recommendation["candidate_set"] = store_candidates(
+        user_lat, user_lon, user_preferences, campsites, hiking_trails,
+        weather_data, lp_levels, nearest_trails, near_trail, community, drive_times
+    )
+    return recommendation
+
+def store_candidates(user_lat, user_lon, user_preferences, campsites, hiking_trails,
+                     weather_data, lp_levels, nearest_trails, near_trail, community, drive_times):
+    """
+    Keep a run's enriched candidates for rerank, for the candidate_sets
+    cache timeout. Returns the handle.
+    """
+    handle = uuid.uuid4().hex
+    get_cache().set(CANDIDATES, handle, {
+        "lat": user_lat,
+        "lon": user_lon,
+        "preferences": user_preferences,
+        "campsites": campsites,
+        "hiking_trails": hiking_trails,
+        "weather": weather_data,
+        "light_pollution": lp_levels,
+        "nearest_trails": nearest_trails,
+        "near_trail": near_trail.tolist(),
+        "community": community,
+        "drive_times": drive_times
+    }, cache_timeout(CANDIDATES))
+    return handle
+
+def rerank(handle, user_preferences, user_lat=None, user_lon=None):
+    """
+    Rescore a stored candidate set for new preferences (merged over the
+    original ones) or an origin near the original one, without any
+    upstream calls. Drive times come from the cache where the origin
+    moved to another tile. The AI summary is included only if one is
+    already cached for the new top spots.
+    Returns None once the set has expired; raises ValueError if the new
+    origin is more than RERANK_MAX_SHIFT_KM from the original.
+    """
+    hit, candidates = get_cache().get(CANDIDATES, handle)
+    if not hit:
+        return None
+
+    lat = candidates["lat"] if user_lat is None else user_lat
+    lon = candidates["lon"] if user_lon is None else user_lon
+    if haversine_distance(candidates["lat"], candidates["lon"], lat, lon) > current_app.config["RERANK_MAX_SHIFT_KM"]:
+        raise ValueError("Origin is too far from the original search")
+    preferences = {**candidates["preferences"], **user_preferences}
+
+    campsites = candidates["campsites"]
+    drive_times = candidates["drive_times"]
+    if tile_coordinates("travel_times", lat, lon) != tile_coordinates("travel_times", candidates["lat"], candidates["lon"]):
+        drive_times = cached_drive_times(lat, lon, campsites)
+
+    with stage("rerank"):
+        columns = campsite_columns(campsites, candidates["weather"], candidates["light_pollution"],
+                                   candidates["community"])
+        results = rank_campsites(lat, lon, preferences, campsites, columns,
+                                 candidates["weather"], candidates["light_pollution"],
+                                 candidates["nearest_trails"], np.array(candidates["near_trail"], dtype=bool),
+                                 candidates["community"], drive_times)
+
+    top_spots = results[:5]
+    _, ai_summary = get_ai_recommendation.lookup(build_summary_prompt(top_spots, preferences),
+                                                 summary_request_key(top_spots, preferences))
+    return {
+        "results": results,
+        "ai_summary": ai_summary,
+        "hiking_trails": candidates["hiking_trails"],
+        "candidate_set": handle
+    }
+
+def _place_key(place):
+    return place.place_id or (place.name, place.lat, place.lng)
+
+def _merge(place_lists):
+    """Union of several place lists; returns (places, index arrays into it per list)"""
+    places = []
+    positions = {}
+    members = []
+    for place_list in place_lists:
+        indices = []
+        for place in place_list:
+            key = _place_key(place)
+            if key not in positions:
+                positions[key] = len(places)
+                places.append(place)
+            indices.append(positions[key])
+        members.append(np.array(indices, dtype=int))
+    return places, members
+
+def recommend_batch(origins, async_summary=True):
+    """
+    Recommendations for many origins (e.g. the stops of a trip) at once.
+    Candidates are gathered for every origin, merged, and each unique
+    campsite is enriched a single time; each origin is then scored on its
+    own candidates. origins are dicts with lat, lon and preferences.
+    Yields (index, recommendation or error dict) as each origin completes.
+    """
+    # 1) Candidates per origin, gathered concurrently; places found from
+    # several origins are only looked up once
+    try:
+        registry = DetailsRegistry(get_maps_client())
+    except ValueError:
+        registry = None
+    searches = [submit("batch", find_candidates, o["lat"], o["lon"], registry) for o in origins]
+    found = []
+    for search in searches:
+        try:
+            found.append(search.result())
+        except Exception as e:
+            current_app.logger.error(f"Batch candidate search error: {str(e)}")
+            found.append(([], []))
+
+    # 2) Enrich the union once; the nearest trail to a site doesn't depend on the origin
+    campsites, members = _merge([candidates for candidates, _ in found])
+    all_trails, _ = _merge([trails for _, trails in found])
+    with stage("enrichment"):
+        weather_data, lp_levels = enrich_campsites(campsites)
+    nearest_trails, near_trail = match_trails(campsites, all_trails)
+    community = community_ratings(site.name for site in campsites)
+    columns = campsite_columns(campsites, weather_data, lp_levels, community)
+
+    # 3) Score, route and summarize each origin; stream them as they finish
+    def finish(i):
+        origin = origins[i]
+        idx = members[i]
+        sites = [campsites[j] for j in idx]
+        with stage("travel_times"):
+            drive_times = get_drive_times(origin["lat"], origin["lon"], sites,
+                                          current_app.config["ENRICHMENT_TIMEOUT"])
+        results = rank_campsites(
+            origin["lat"], origin["lon"], origin["preferences"],
+            sites,
+            {name: column[idx] for name, column in columns.items()},
+            [weather_data[j] for j in idx],
+            [lp_levels[j] for j in idx],
+            [nearest_trails[j] for j in idx],
+            near_trail[idx],
+            community,
+            drive_times
+        )
+        return finish_recommendation(origin["lat"], origin["lon"], origin["preferences"],
+                                     results, found[i][1], async_summary)
+
+    futures = {submit("batch", finish, i): i for i in range(len(origins))}
+    for future in as_completed(futures):
+        i = futures[future]
+        try:
+            yield i, future.result()
+        except Exception as e:
+            current_app.logger.error(f"Batch recommendation error for origin {i}: {str(e)}")
+            yield i, {"error": "Recommendation failed"}
@@ -0,0 +1,254 @@
+# records.py
+
+import json
+import sys
+import zlib
+
+class Packed:
+    """
+    A JSON value kept as compressed bytes and decoded only when read.
+    Places hold their photos and reviews this way, out of line from the
+    fields ranking touches, so cached places stay small.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def pack(cls, value):
+        if not value:
+            return EMPTY
+        return cls.from_json(json.dumps(value))  # same text the catalog stores
+
+    @classmethod
+    def from_json(cls, text):
+        """Pack JSON text as is, e.g. a catalog column, without parsing it"""
+        if not text or text == "[]":
+            return EMPTY
+        return cls(zlib.compress(text.encode(), 1))
+
+    def json(self):
+        return zlib.decompress(self.data).decode()
+
+    def unpack(self):
+        return json.loads(self.json())
+
+EMPTY = Packed(zlib.compress(b"[]", 1))  # shared by places without photos or reviews
+
+def unpack(value):
+    """A packed field's value; anything else as is"""
+    return value.unpack() if isinstance(value, Packed) else value
+
+class Record:
+    """
+    Base for the slotted records used instead of per-item dicts.
+    to_dict() gives the JSON shape, with the keys in KEYS; reading by
+    those keys (weather["temp"]) is kept for response shaping.
+    cache_dict() is what a shared cache stores, for from_dict to rebuild.
+    """
+    __slots__ = ()
+    KEYS = ()
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    def cache_dict(self):
+        return self.to_dict()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{key: data.get(key) for key in cls.KEYS})
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+class Weather(Record):
+    """Current conditions for a weather cache tile"""
+    __slots__ = ("temp", "description", "clouds", "rain", "humidity", "wind_speed", "timestamp")
+    KEYS = __slots__
+
+    def __init__(self, temp, description, clouds, rain, humidity, wind_speed, timestamp):
+        self.temp = temp
+        self.description = description
+        self.clouds = clouds
+        self.rain = rain
+        self.humidity = humidity
+        self.wind_speed = wind_speed
+        self.timestamp = timestamp
+
+class LightPollution(Record):
+    """Light pollution for a cache tile; level runs 1-10, 10 darkest"""
+    __slots__ = ("level", "bortle_scale", "description", "timestamp")
+    KEYS = __slots__
+
+    def __init__(self, level, bortle_scale, description, timestamp):
+        self.level = level
+        self.bortle_scale = bortle_scale
+        self.description = description
+        self.timestamp = timestamp
+
+class Place(Record):
+    """
+    A campground or other place, from Google Maps, the campsite API or
+    the catalog. Photos stay packed until serialized; amenities (campsite
+    API data) and drive (set by attach_drive_times) are only serialized
+    when present; source is kept in the cached form only.
+    """
+    __slots__ = ("place_id", "name", "address", "lat", "lng", "rating", "is_open",
+                 "website", "phone", "amenities", "source", "drive", "_photos")
+    KEYS = ("place_id", "name", "address", "location", "rating", "is_open", "photos", "website", "phone")
+    OPTIONAL = ("amenities", "drive")
+
+    def __init__(self, place_id, name, address=None, lat=None, lng=None, rating=None, is_open=None,
+                 photos=EMPTY, website=None, phone=None, amenities=None, source="google_places"):
+        self.place_id = place_id
+        self.name = name
+        self.address = address
+        self.lat = lat
+        self.lng = lng
+        self.rating = rating
+        self.is_open = is_open
+        self._photos = photos if isinstance(photos, Packed) else Packed.pack(photos)
+        self.website = website
+        self.phone = phone
+        self.amenities = amenities
+        self.source = source
+
+    @property
+    def location(self):
+        return {"lat": self.lat, "lng": self.lng} if self.lat is not None else None
+
+    @property
+    def photos(self):
+        return self._photos.unpack()
+
+    @property
+    def packed_photos(self):
+        return self._photos
+
+    def _has(self, key):
+        if key == "drive":
+            return hasattr(self, "drive")
+        return key == "amenities" and self.amenities is not None
+
+    def to_dict(self):
+        place = super().to_dict()
+        for key in self.OPTIONAL:
+            if self._has(key):
+                place[key] = getattr(self, key)
+        return place
+
+    def cache_dict(self):
+        return dict(self.to_dict(), source=self.source)
+
+    @classmethod
+    def _fields(cls, data):
+        location = data.get("location") or {}
+        return dict(
+            place_id=data.get("place_id"), name=data.get("name"), address=data.get("address"),
+            lat=location.get("lat"), lng=location.get("lng"), rating=data.get("rating"),
+            is_open=data.get("is_open"), photos=data.get("photos") or EMPTY,
+            website=data.get("website"), phone=data.get("phone"),
+            amenities=data.get("amenities"), source=data.get("source", "google_places")
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        place = cls(**cls._fields(data))
+        if "drive" in data:
+            place.drive = data["drive"]
+        return place
+
+    def __getitem__(self, key):
+        if self._has(key):
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key in self.KEYS or self._has(key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+class Trail(Place):
+    """A hiking trail; its Google reviews stay packed until serialized"""
+    __slots__ = ("_reviews",)
+    KEYS = Place.KEYS + ("reviews",)
+
+    def __init__(self, place_id, name, reviews=EMPTY, **fields):
+        super().__init__(place_id, name, **fields)
+        self._reviews = reviews if isinstance(reviews, Packed) else Packed.pack(reviews)
+
+    @property
+    def reviews(self):
+        return self._reviews.unpack()
+
+    @property
+    def packed_reviews(self):
+        return self._reviews
+
+    @classmethod
+    def _fields(cls, data):
+        return dict(super()._fields(data), reviews=data.get("reviews") or EMPTY)
+
+RECORD_TYPES = {cls.__name__: cls for cls in (Weather, LightPollution, Place, Trail)}
+
+def json_default(value):
+    """json.dumps default= that writes records and packed fields in their JSON shape"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, Packed):
+        return value.unpack()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(value):
+    """JSON for a cache entry; records are tagged so loads() rebuilds them"""
+    def tagged(value):
+        if isinstance(value, Record):
+            return {"__record__": type(value).__name__, **value.cache_dict()}
+        return json_default(value)
+    return json.dumps(value, default=tagged)
+
+def _rebuild(data):
+    name = data.pop("__record__", None)
+    return RECORD_TYPES[name].from_dict(data) if name else data
+
+def loads(text):
+    return json.loads(text, object_hook=_rebuild)
+
+def deep_size(value, seen=None):
+    """
+    Approximate bytes held by a value and everything it references.
+    Objects reached twice (e.g. weather records shared by cache entries)
+    are counted once per seen set.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif isinstance(value, (Record, Packed)):
+        for cls in type(value).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(value, slot):
+                    size += deep_size(getattr(value, slot), seen)
+    elif hasattr(value, "nbytes"):  # numpy arrays
+        size += value.nbytes
+    return size
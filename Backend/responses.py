@@ -0,0 +1,120 @@
+# responses.py
+
+import base64
+import json
+import uuid
+from cache import get_cache, cache_timeout
+from records import Record, json_default, unpack
+
+# Full result lists are kept here so later pages don't recompute them
+NAMESPACE = "result_pages"
+
+def parse_fields(value):
+    """fields= as a list or comma-separated string; None keeps every field"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return [field.strip() for field in value if field.strip()]
+
+def is_true(value):
+    return value is True or str(value).lower() in ("1", "true", "yes")
+
+def shape_options(source):
+    """(fields, compact) from request args or a JSON body"""
+    return parse_fields(source.get("fields")), is_true(source.get("compact"))
+
+def compact_directions(directions):
+    """Route totals without the per-step instructions and polylines"""
+    if not directions:
+        return directions
+    legs = directions.get("legs", [])
+    return {
+        "summary": directions.get("summary"),
+        "distance": sum(leg.get("distance", {}).get("value", 0) for leg in legs),  # meters
+        "duration": sum(leg.get("duration", {}).get("value", 0) for leg in legs)  # seconds
+    }
+
+def compact_place(place):
+    """Drop route steps, photo metadata and trail reviews"""
+    compact = place.to_dict() if isinstance(place, Record) else dict(place)
+    if "directions" in compact:
+        compact["directions"] = compact_directions(compact["directions"])
+    if "photos" in compact:
+        compact["photos"] = [p["photo_reference"] for p in unpack(compact["photos"]) or [] if p.get("photo_reference")]
+    if "reviews" in compact:
+        compact["review_count"] = len(compact.pop("reviews") or [])
+    return compact
+
+def select_fields(item, fields):
+    """Keep the requested keys; dotted paths like weather.temp pick nested values"""
+    selected = {}
+    for field in fields:
+        head, _, rest = field.partition(".")
+        if head not in item:
+            continue
+        if rest and isinstance(item[head], (dict, Record)):
+            selected.setdefault(head, {}).update(select_fields(item[head], [rest]))
+        else:
+            selected[head] = item[head]
+    return selected
+
+def shape_item(place, fields=None, compact=False):
+    """Apply compact mode, then field projection, to one place"""
+    if compact:
+        place = compact_place(place)
+    if fields:
+        place = select_fields(place, fields)
+    return place
+
+def shape(places, fields=None, compact=False):
+    """Lazily shape each place; wrap in list() for a JSON array"""
+    if not fields and not compact:
+        return iter(places)
+    return (shape_item(p, fields, compact) for p in places)
+
+def encode_cursor(page_set, offset):
+    return base64.urlsafe_b64encode(f"{page_set}:{offset}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """(page_set, offset) from a cursor; raises ValueError if malformed"""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    page_set, offset = raw.split(":")
+    return page_set, int(offset)
+
+def first_page(results, limit):
+    """
+    The first limit results and a cursor for the rest (None if they all fit).
+    The full list is cached for the result_pages timeout.
+    """
+    if len(results) <= limit:
+        return results, None
+    page_set = uuid.uuid4().hex
+    get_cache().set(NAMESPACE, page_set, results, cache_timeout(NAMESPACE))
+    return results[:limit], encode_cursor(page_set, limit)
+
+def next_page(cursor, limit):
+    """
+    (results, next_cursor) for a cursor from first_page, or (None, None)
+    once the cached result set has expired.
+    """
+    page_set, offset = decode_cursor(cursor)
+    hit, results = get_cache().get(NAMESPACE, page_set)
+    if not hit:
+        return None, None
+    end = offset + limit
+    return results[offset:end], encode_cursor(page_set, end) if end < len(results) else None
+
+def ndjson(meta, results=(), trails=()):
+    """
+    Stream a payload as newline-delimited JSON: one "meta" line, then one
+    line per result and per trail, so nothing is serialized all at once.
+    """
+    yield json.dumps({"type": "meta", **meta}, default=json_default) + "\n"
+    for item in results:
+        yield json.dumps({"type": "result", "item": item}, default=json_default) + "\n"
+    for item in trails:
+        yield json.dumps({"type": "trail", "item": item}, default=json_default) + "\n"
+
+def wants_ndjson(request, source):
+    return source.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson"
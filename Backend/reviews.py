@@ -0,0 +1,91 @@
+# reviews.py
+
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from database import db
+from models import CampReview, ReviewAggregate
+
+# Weight of the newest review in recent_rating
+RECENT_WEIGHT = 0.3
+
+def add_review(user_id, campsite_name, rating, review_text):
+    """
+    Save a review and fold it into its campsite's aggregate in the same
+    transaction. The aggregate is updated with SQL arithmetic, so concurrent
+    posts for one campsite don't lose counts; when two first reviews race
+    to create it, the loser folds its review into the winner's row.
+    """
+    review = CampReview(
+        user_id=user_id,
+        campsite_name=campsite_name,
+        rating=rating,
+        review_text=review_text
+    )
+    db.session.add(review)
+
+    if not _fold_rating(campsite_name, rating):
+        try:
+            with db.session.begin_nested():  # savepoint: a conflict keeps the review
+                db.session.add(ReviewAggregate(
+                    campsite_name=campsite_name,
+                    review_count=1,
+                    rating_sum=rating,
+                    recent_rating=float(rating)
+                ))
+        except IntegrityError:
+            _fold_rating(campsite_name, rating)
+    db.session.commit()
+    return review
+
+def _fold_rating(campsite_name, rating):
+    """Add a rating to an existing aggregate; returns the rows updated (0 if there is none yet)"""
+    return ReviewAggregate.query.filter_by(campsite_name=campsite_name).update({
+        ReviewAggregate.review_count: ReviewAggregate.review_count + 1,
+        ReviewAggregate.rating_sum: ReviewAggregate.rating_sum + rating,
+        ReviewAggregate.recent_rating: ReviewAggregate.recent_rating
+                                       + RECENT_WEIGHT * (rating - ReviewAggregate.recent_rating),
+        ReviewAggregate.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+
+def page_reviews(campsite_name, limit=None, after=None):
+    """
+    Reviews for a campsite in posting order.
+    Keyset pagination: pass the last id of the previous page as after.
+    """
+    query = CampReview.query.filter_by(campsite_name=campsite_name)
+    if after is not None:
+        query = query.filter(CampReview.id > after)
+    query = query.order_by(CampReview.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def community_ratings(campsite_names):
+    """Aggregates for the named campsites, as {name: aggregate dict}"""
+    names = list({name for name in campsite_names if name})
+    if not names:
+        return {}
+    rows = ReviewAggregate.query.filter(ReviewAggregate.campsite_name.in_(names))
+    return {row.campsite_name: row.to_dict() for row in rows}
+
+def rebuild_aggregates():
+    """Recompute every aggregate from the review table; returns the campsite count"""
+    ReviewAggregate.query.delete()
+    aggregates = {}
+    for review in CampReview.query.order_by(CampReview.id).yield_per(1000):
+        if review.rating is None:
+            continue
+        aggregate = aggregates.get(review.campsite_name)
+        if aggregate is None:
+            aggregate = aggregates[review.campsite_name] = ReviewAggregate(
+                campsite_name=review.campsite_name,
+                review_count=0,
+                rating_sum=0,
+                recent_rating=float(review.rating)
+            )
+        aggregate.review_count += 1
+        aggregate.rating_sum += review.rating
+        aggregate.recent_rating += RECENT_WEIGHT * (review.rating - aggregate.recent_rating)
+    db.session.add_all(aggregates.values())
+    db.session.commit()
+    return len(aggregates)
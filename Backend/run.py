@@ -1,4 +1,8 @@
 from app import app
+from database import db
 
 if __name__ == "__main__":
+    # The development server sets up its own tables; deployments run flask init-db
+    with app.app_context():
+        db.create_all()
     app.run(host="0.0.0.0", port=5000, debug=True) 
\ No newline at end of file
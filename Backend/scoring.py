@@ -0,0 +1,141 @@
+# scoring.py
+
+import numpy as np
+from geo import EARTH_RADIUS_KM
+
+# Community ratings move the score by COMMUNITY_WEIGHT per star away from
+# a neutral 3, once a campsite has enough of our own reviews
+COMMUNITY_MIN_REVIEWS = 3
+COMMUNITY_WEIGHT = 1.0
+
+# A point off per DRIVE_MINUTES_PER_POINT of driving; about the old point
+# per 10 km straight-line, which still applies where no drive time is known
+DRIVE_MINUTES_PER_POINT = 12
+
+def score_site(site, weather, lp_data, distance, near_trail, user_preferences, community=None,
+               drive_minutes=None):
+    """
+    Score a single campsite.
+    Reference implementation of the rules score_batch applies to arrays.
+    """
+    # Calculate base score
+    base_score = 10
+
+    # Weather factors
+    if weather.temp and 15 <= weather.temp <= 25:  # Ideal temperature range
+        base_score += 2
+    if weather.clouds and weather.clouds < 30:  # Clear skies
+        base_score += 2
+    if not weather.rain:
+        base_score += 1
+
+    # Light pollution factors
+    if lp_data.level >= 8:  # Excellent for stargazing
+        base_score += 3
+    elif lp_data.level >= 6:  # Good for stargazing
+        base_score += 2
+
+    # Distance factor (penalize longer drives)
+    if drive_minutes is not None:
+        base_score -= drive_minutes / DRIVE_MINUTES_PER_POINT
+    else:
+        base_score -= (distance / 10)
+
+    # User preference factors
+    if user_preferences.get("prefers_fishing") and "fishing" in (site.amenities or []):
+        base_score += 2
+    if user_preferences.get("prefers_hiking") and near_trail:
+        base_score += 2
+    if user_preferences.get("prefers_solitude") and not site.is_open:
+        base_score += 1
+
+    # Community rating from our own reviews
+    if community and community["count"] >= COMMUNITY_MIN_REVIEWS:
+        base_score += (community["mean"] - 3) * COMMUNITY_WEIGHT
+
+    return base_score
+
+def haversine_many(lat, lon, lats, lons):
+    """Distance in km from one point to arrays of points"""
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    dLat = np.radians(lats - lat)
+    dLon = np.radians(lons - lon)
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    a = np.sin(dLat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dLon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+def _column(values):
+    """Float column with missing values (None) as NaN"""
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+def campsite_columns(campsites, weather, light_pollution, community=None):
+    """
+    Pack campsite and enrichment records into the arrays score_batch expects.
+    community maps campsite names to review aggregates (see community_ratings).
+    """
+    community = community or {}
+    ratings = [community.get(s.name) for s in campsites]
+    return {
+        "lat": _column(s.lat for s in campsites),
+        "lon": _column(s.lng for s in campsites),
+        "temp": _column(w.temp for w in weather),
+        "clouds": _column(w.clouds for w in weather),
+        "rain": np.array([bool(w.rain) for w in weather], dtype=bool),
+        "lp_level": _column(lp.level for lp in light_pollution),
+        "fishing": np.array(["fishing" in (s.amenities or []) for s in campsites], dtype=bool),
+        "closed": np.array([not s.is_open for s in campsites], dtype=bool),
+        "community": _column(
+            r["mean"] if r and r["count"] >= COMMUNITY_MIN_REVIEWS else None for r in ratings
+        )
+    }
+
+def drive_minutes_column(drive_times):
+    """Drive minutes per campsite from get_drive_times, NaN where unknown"""
+    return _column(t["duration"] / 60 if t else None for t in drive_times)
+
+def score_batch(user_lat, user_lon, columns, near_trail, user_preferences, drive_minutes=None):
+    """
+    Score every campsite at once.
+    Applies the same rules as score_site to the arrays from campsite_columns
+    (and drive_minutes_column, if given) and returns (scores, distances).
+    """
+    distances = haversine_many(user_lat, user_lon, columns["lat"], columns["lon"])
+
+    temp = columns["temp"]
+    clouds = columns["clouds"]
+    lp_level = columns["lp_level"]
+
+    # NaN (missing data) fails every comparison, matching the falsy checks
+    scores = np.full(len(distances), 10.0)
+    scores += np.where((temp != 0) & (temp >= 15) & (temp <= 25), 2, 0)
+    scores += np.where((clouds != 0) & (clouds < 30), 2, 0)
+    scores += np.where(columns["rain"], 0, 1)
+    scores += np.select([lp_level >= 8, lp_level >= 6], [3, 2], 0)
+
+    penalty = distances / 10
+    if drive_minutes is not None:
+        penalty = np.where(np.isnan(drive_minutes), penalty, drive_minutes / DRIVE_MINUTES_PER_POINT)
+    scores -= penalty
+
+    if user_preferences.get("prefers_fishing"):
+        scores += np.where(columns["fishing"], 2, 0)
+    if user_preferences.get("prefers_hiking"):
+        scores += np.where(near_trail, 2, 0)
+    if user_preferences.get("prefers_solitude"):
+        scores += np.where(columns["closed"], 1, 0)
+
+    community = columns["community"]
+    scores += np.where(np.isnan(community), 0, (community - 3) * COMMUNITY_WEIGHT)
+
+    return scores, distances
+
+def rank(scores):
+    """
+    Indices of scores, highest first.
+    Ties keep their input order, like a stable sort with reverse=True.
+    Every result is ranked: later pages are served from the full order.
+    """
+    return np.argsort(-scores, kind="stable")
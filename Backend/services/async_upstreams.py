@@ -0,0 +1,378 @@
+# services/async_upstreams.py
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from flask import current_app
+from services.http_client import CircuitOpenError, get_breaker
+from services.weather_service import (
+    get_weather, unavailable_weather, _parse_weather, _find_params,
+    _parse_stations, _center, _match_stations
+)
+from services.light_pollution_service import (
+    fetch_light_pollution_level, unavailable_light_pollution, _parse_light_pollution
+)
+from services.maps_service import PLACE_FIELDS, TRAIL_FIELDS, _place_from_details, _trail_from_details
+from services.travel_time_service import get_drive_time, drive_time
+from services.gemini_service import (
+    get_ai_recommendation, fallback_recommendation, _request_args, _parse_recommendation,
+    UNAVAILABLE_TEXT, ERROR_TEXT
+)
+from cache import tile_coordinates
+from concurrency import run_blocking
+from instrumentation import record_upstream
+
+MAPS_URL = "https://maps.googleapis.com/maps/api"
+
+# What the async services treat as "upstream unavailable"
+UPSTREAM_ERRORS = (httpx.HTTPError, CircuitOpenError)
+
+def _lookup_many(fn, keys):
+    """{key: cached result} for the keys a cached service function has results for"""
+    found = {}
+    for key in keys:
+        hit, value = fn.lookup(*key)
+        if hit:
+            found[key] = value
+    return found
+
+def _prime_many(fn, results):
+    """Store {key: result} as a cached service function's results (fallbacks are skipped)"""
+    for key, value in results.items():
+        fn.prime(value, *key)
+
+def retry_after(response):
+    """
+    Seconds a 413/429/503 response's Retry-After header (delay or HTTP
+    date) asks us to wait, or None; the statuses urllib3 honours it for
+    """
+    value = response.headers.get("Retry-After")
+    if value is None or response.status_code not in (413, 429, 503):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class DetailsRegistry:
+    """
+    services.maps_service.DetailsRegistry for the event loop: Place Details
+    lookups shared by several nearby searches. Each place is looked up
+    once; a later search that needs extra fields only fetches those.
+    """
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.lookups = {}
+
+    def request(self, place_id, fields):
+        lookups = self.lookups.setdefault(place_id, [])
+        fetched = {f for requested, _ in lookups for f in requested}
+        missing = [f for f in fields if f not in fetched]
+        if missing:
+            lookups.append((missing, asyncio.ensure_future(self.fetch(place_id, missing))))
+
+    async def details(self, place_id):
+        merged = {}
+        for result in await asyncio.gather(*(task for _, task in self.lookups[place_id])):
+            merged.update(result)
+        return merged
+
+class MapsError(Exception):
+    """A Maps web service answered with an error status"""
+
+    def __init__(self, status):
+        super().__init__(f"Maps API status {status}")
+        self.status = status
+
+class AsyncUpstreams:
+    """
+    Non-blocking clients for every upstream, for the async serving mode.
+    One httpx connection pool is shared by all requests on the event loop.
+    Calls go through the same circuit breakers as the sync clients, retry
+    429/5xx and transport errors with jittered backoff, and are capped per
+    upstream by UPSTREAM_MAX_CONCURRENCY. Cache reads and writes block
+    with the SQLite and Redis backends, so they run on the "cache" pool,
+    lookups batched per step.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        connect, read = config["HTTP_TIMEOUT"]
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=config["ASYNC_MAX_CONNECTIONS"])
+        )
+        self.semaphores = {
+            upstream: asyncio.Semaphore(limit)
+            for upstream, limit in config["UPSTREAM_MAX_CONCURRENCY"].items()
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def request(self, upstream, method, url, **kwargs):
+        """
+        Send one request through the upstream's breaker, retrying failures
+        after Retry-After when the response gives one, else with backoff
+        """
+        breaker = get_breaker(upstream)
+        retries = self.config["HTTP_RETRIES"]
+        backoff = self.config["HTTP_BACKOFF_FACTOR"]
+        semaphore = self.semaphores.get(upstream) or asyncio.Semaphore(4)
+        for attempt in range(retries + 1):
+            delay = None
+            trial = breaker.before_call()
+            started = time.perf_counter()
+            try:
+                async with semaphore:
+                    response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                breaker.record_failure()
+                record_upstream(upstream, time.perf_counter() - started, ok=False)
+                if attempt == retries:
+                    raise
+            except asyncio.CancelledError:
+                # Cancelled at a deadline: says nothing about the upstream, but
+                # a half-open trial must not stay in flight
+                if trial:
+                    breaker.release_trial()
+                raise
+            except BaseException:
+                breaker.record_failure()
+                record_upstream(upstream, time.perf_counter() - started, ok=False)
+                raise
+            else:
+                failed = response.status_code == 429 or response.status_code >= 500
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                record_upstream(upstream, time.perf_counter() - started, ok=not failed)
+                if not failed or attempt == retries:
+                    return response
+                delay = retry_after(response)
+            if delay is None:
+                delay = backoff * (2 ** attempt) + random.uniform(0, backoff)
+            await asyncio.sleep(delay)
+
+    # Weather
+
+    async def _weather(self, lat, lon):
+        try:
+            response = await self.request("weather", "GET", self.config["WEATHER_API_URL"], params={
+                "lat": lat,
+                "lon": lon,
+                "appid": self.config["WEATHER_API_KEY"],
+                "units": "metric"
+            })
+            response.raise_for_status()
+            weather = _parse_weather(response.json())
+        except UPSTREAM_ERRORS as e:
+            current_app.logger.error(f"Weather API error: {str(e)}")
+            return unavailable_weather("unavailable")
+        except (KeyError, ValueError) as e:
+            current_app.logger.error(f"Weather data parsing error: {str(e)}")
+            return unavailable_weather("data error")
+        await run_blocking(get_weather.prime, weather, lat, lon, pool="cache")
+        return weather
+
+    async def _stations(self, tiles):
+        try:
+            response = await self.request("weather", "GET", self.config["WEATHER_FIND_API_URL"],
+                                          params=_find_params(*_center(tiles)))
+            response.raise_for_status()
+            stations = _parse_stations(response.json())
+        except UPSTREAM_ERRORS + (KeyError, ValueError) as e:
+            current_app.logger.error(f"Weather bulk API error: {str(e)}")
+            return {}
+        return await run_blocking(_match_stations, stations, tiles, pool="cache")  # primes the cache
+
+    async def weather_many(self, coords):
+        """Async get_weather_many: cache, then one regional query, then per-tile lookups"""
+        if not self.config["WEATHER_API_KEY"]:
+            raise ValueError("WEATHER_API_KEY is not configured")
+        tiles = [tile_coordinates("weather", lat, lon) for lat, lon in coords]
+        unique = list(dict.fromkeys(tiles))
+        weather = await run_blocking(_lookup_many, get_weather, unique, pool="cache")
+
+        missing = [tile for tile in unique if tile not in weather]
+        if missing and self.config["WEATHER_MODE"] == "regional" and len(missing) > 1:
+            weather.update(await self._stations(missing))
+            missing = [tile for tile in missing if tile not in weather]
+
+        fetched = await asyncio.gather(*(self._weather(*tile) for tile in missing))
+        weather.update(zip(missing, fetched))
+        return [weather[tile] for tile in tiles]
+
+    # Light pollution
+
+    async def _light_pollution(self, lat, lon):
+        try:
+            response = await self.request("light_pollution", "GET", self.config["LIGHT_POLLUTION_API_URL"],
+                                          params={"lat": lat, "lon": lon,
+                                                  "apikey": self.config["LIGHT_POLLUTION_API_KEY"]})
+            response.raise_for_status()
+            level = _parse_light_pollution(response.json())
+        except UPSTREAM_ERRORS as e:
+            current_app.logger.error(f"Light pollution API error: {str(e)}")
+            return unavailable_light_pollution("unavailable")
+        except (KeyError, ValueError) as e:
+            current_app.logger.error(f"Light pollution data parsing error: {str(e)}")
+            return unavailable_light_pollution("data error")
+        await run_blocking(fetch_light_pollution_level.prime, level, lat, lon, pool="cache")
+        return level
+
+    async def light_pollution_many(self, coords):
+        """Light pollution API lookups, one per cache tile, aligned with coords"""
+        if not self.config["LIGHT_POLLUTION_API_KEY"]:
+            raise ValueError("LIGHT_POLLUTION_API_KEY is not configured")
+        tiles = [tile_coordinates("light_pollution", lat, lon) for lat, lon in coords]
+        unique = list(dict.fromkeys(tiles))
+        levels = await run_blocking(_lookup_many, fetch_light_pollution_level, unique, pool="cache")
+        missing = [tile for tile in unique if tile not in levels]
+        levels.update(zip(missing, await asyncio.gather(*(self._light_pollution(*t) for t in missing))))
+        return [levels[tile] for tile in tiles]
+
+    # Google Maps web services
+
+    async def _maps(self, endpoint, **params):
+        if not self.config["GOOGLE_MAPS_API_KEY"]:
+            raise ValueError("GOOGLE_MAPS_API_KEY is not configured")
+        params["key"] = self.config["GOOGLE_MAPS_API_KEY"]
+        response = await self.request("maps", "GET", f"{MAPS_URL}/{endpoint}/json", params=params)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("status") not in ("OK", "ZERO_RESULTS"):
+            raise MapsError(data.get("status"))
+        return data
+
+    async def _details(self, place_id, fields):
+        data = await self._maps("place/details", place_id=place_id, fields=",".join(fields))
+        return data.get("result", {})
+
+    async def _search(self, lat, lon, radius, fields, registry=None, **query):
+        """
+        Page through a nearby search, fetching details while waiting for
+        page tokens. Returns the details dicts in search order; searches
+        sharing a registry look each place up once.
+        """
+        registry = registry or DetailsRegistry(self._details)
+        query = dict(location=f"{lat},{lon}", radius=radius, **query)
+        place_ids = []
+        data = await self._maps("place/nearbysearch", **query)
+        while data.get("results"):
+            for place in data["results"]:
+                place_ids.append(place["place_id"])
+                registry.request(place["place_id"], fields)
+            token = data.get("next_page_token")
+            if not token:
+                break
+            data = await self._next_page(token)
+        return await asyncio.gather(*(registry.details(place_id) for place_id in place_ids))
+
+    async def _next_page(self, page_token):
+        delay = self.config["MAPS_PAGE_TOKEN_DELAY"]
+        deadline = time.monotonic() + self.config["MAPS_PAGE_TOKEN_TIMEOUT"]
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                return await self._maps("place/nearbysearch", pagetoken=page_token)
+            except MapsError as e:
+                if e.status != "INVALID_REQUEST" or time.monotonic() + delay > deadline:
+                    raise
+                delay = min(delay * 2, 2)
+
+    async def discover_places(self, lat, lon, radius=50000):
+        """
+        Async discover_places: campgrounds and trails searched concurrently,
+        places returned by both looked up once
+        """
+        registry = DetailsRegistry(self._details)
+
+        async def search(build, fields, **query):
+            try:
+                return [build(d) for d in await self._search(lat, lon, radius, fields, registry, **query)]
+            except (MapsError, ValueError) + UPSTREAM_ERRORS as e:
+                current_app.logger.error(f"Google Maps API error: {str(e)}")
+                return []
+
+        return tuple(await asyncio.gather(
+            search(_place_from_details, PLACE_FIELDS, type="campground"),
+            search(_trail_from_details, TRAIL_FIELDS, type="park", keyword="hiking trail")
+        ))
+
+    async def find_places(self, lat, lon, radius, place_type="campground"):
+        try:
+            return [_place_from_details(d) for d in await self._search(lat, lon, radius, PLACE_FIELDS, type=place_type)]
+        except (MapsError, ValueError) + UPSTREAM_ERRORS as e:
+            current_app.logger.error(f"Google Maps API error: {str(e)}")
+            return []
+
+    async def find_trails(self, lat, lon, radius):
+        try:
+            details = await self._search(lat, lon, radius, TRAIL_FIELDS, type="park", keyword="hiking trail")
+            return [_trail_from_details(d) for d in details]
+        except (MapsError, ValueError) + UPSTREAM_ERRORS as e:
+            current_app.logger.error(f"Google Maps API error: {str(e)}")
+            return []
+
+    async def _drive_times(self, lat, lon, place_ids):
+        try:
+            data = await self._maps("distancematrix", origins=f"{lat},{lon}", mode="driving",
+                                    destinations="|".join(f"place_id:{p}" for p in place_ids))
+            elements = data["rows"][0]["elements"]
+        except (MapsError, KeyError, IndexError) + UPSTREAM_ERRORS as e:
+            current_app.logger.error(f"Google Maps distance matrix error: {str(e)}")
+            return {}
+        times = {place_id: drive_time(element) for place_id, element in zip(place_ids, elements)}
+        await run_blocking(_prime_many, get_drive_time,
+                           {(lat, lon, place_id): time for place_id, time in times.items()}, pool="cache")
+        return times
+
+    async def drive_times(self, lat, lon, places):
+        """Async get_drive_times: cached times, then concurrent matrix batches"""
+        origin = tile_coordinates("travel_times", lat, lon)
+        keys = [(*origin, place_id) for place_id in dict.fromkeys(p.place_id for p in places if p.place_id)]
+        cached = await run_blocking(_lookup_many, get_drive_time, keys, pool="cache")
+        times = {key[2]: value for key, value in cached.items()}
+        missing = [key[2] for key in keys if key not in cached]
+        size = self.config["MAPS_MATRIX_BATCH"]
+        for batch in await asyncio.gather(*(
+            self._drive_times(*origin, missing[i:i + size]) for i in range(0, len(missing), size)
+        )):
+            times.update(batch)
+        return [times.get(p.place_id) for p in places]
+
+    async def attach_drive_times(self, places, lat, lon):
+        for place, time in zip(places, await self.drive_times(lat, lon, places)):
+            place.drive = time
+        return places
+
+    # Gemini
+
+    async def ai_recommendation(self, prompt_text, request_key=None):
+        """Async get_ai_recommendation, sharing its cache"""
+        hit, value = await run_blocking(get_ai_recommendation.lookup, prompt_text, request_key, pool="cache")
+        if hit:
+            return value
+        headers, payload = _request_args(prompt_text)
+        try:
+            response = await self.request("gemini", "POST", self.config["GEMINI_API_URL"],
+                                          json=payload, headers=headers)
+            response.raise_for_status()
+            recommendation = _parse_recommendation(response.json())
+        except UPSTREAM_ERRORS as e:
+            current_app.logger.error(f"Gemini API error: {str(e)}")
+            return fallback_recommendation(UNAVAILABLE_TEXT)
+        except (KeyError, ValueError) as e:
+            current_app.logger.error(f"Gemini data parsing error: {str(e)}")
+            return fallback_recommendation(ERROR_TEXT)
+        await run_blocking(get_ai_recommendation.prime, recommendation, prompt_text, request_key, pool="cache")
+        return recommendation
@@ -1,56 +1,98 @@
-# services/gemini_service.py
-
-import requests
-from flask import current_app
-from functools import lru_cache
-import time
-
-@lru_cache(maxsize=50)
-def get_ai_recommendation(prompt_text):
-    """
-    Send prompt to Gemini API and retrieve structured recommendation.
-    Cached for 1 hour to avoid excessive API calls.
-    """
-    api_key = current_app.config["GEMINI_API_KEY"]
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY is not configured")
-    
-    try:
-        url = current_app.config["GEMINI_API_URL"]
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "prompt": prompt_text,
-            "max_tokens": 256,
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "frequency_penalty": 0.5,
-            "presence_penalty": 0.5
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract the recommendation text
-        recommendation = data.get("choices", [{}])[0].get("text", "").strip()
-        
-        return {
-            "text": recommendation,
-            "timestamp": int(time.time())
-        }
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Gemini API error: {str(e)}")
-        return {
-            "text": "AI recommendation service is currently unavailable.",
-            "timestamp": int(time.time())
-        }
-    except (KeyError, ValueError) as e:
-        current_app.logger.error(f"Gemini data parsing error: {str(e)}")
-        return {
-            "text": "Unable to generate AI recommendation at this time.",
-            "timestamp": int(time.time())
-        }
+# services/gemini_service.py
+
+import hashlib
+import json
+import requests
+from flask import current_app
+from services import http_client
+from cache import cached
+import time
+
+UNAVAILABLE_TEXT = "AI recommendation service is currently unavailable."
+ERROR_TEXT = "Unable to generate AI recommendation at this time."
+
+def _bucket(value, size):
+    return None if value is None else int(value // size)
+
+def summary_request_key(top_spots, user_preferences):
+    """
+    Canonical cache key for a recommendation summary request.
+    Built from what the answer actually depends on: campsite ids in rank
+    order, distances rounded to the km, weather buckets, light pollution
+    levels and the enabled preferences in sorted order. Users in the same
+    area with the same preferences therefore share one cached summary.
+    """
+    spots = [
+        [
+            spot.get("place_id") or spot["name"],
+            round(spot["distance"]),
+            _bucket(spot["weather"].temp, 5),  # 5°C bands
+            _bucket(spot["weather"].clouds, 25),  # cloud cover quartiles
+            bool(spot["weather"].rain),
+            spot["light_pollution"].level
+        ]
+        for spot in top_spots
+    ]
+    preferences = sorted(k for k, v in user_preferences.items() if v)
+    canonical = json.dumps({"spots": spots, "preferences": preferences}, sort_keys=True)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def _request_args(prompt_text):
+    """Headers and JSON body for a Gemini completion request"""
+    api_key = current_app.config["GEMINI_API_KEY"]
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY is not configured")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "prompt": prompt_text,
+        "max_tokens": 256,
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "frequency_penalty": 0.5,
+        "presence_penalty": 0.5
+    }
+    return headers, payload
+
+def _parse_recommendation(data):
+    # Extract the recommendation text
+    recommendation = data.get("choices", [{}])[0].get("text", "").strip()
+    return {
+        "text": recommendation,
+        "timestamp": int(time.time())
+    }
+
+def fallback_recommendation(text):
+    return {
+        "text": text,
+        "timestamp": int(time.time())
+    }
+
+@cached(
+    "ai_recommendation",
+    unless=lambda rec: rec["text"] in (UNAVAILABLE_TEXT, ERROR_TEXT),
+    key=lambda prompt_text, request_key=None: request_key or prompt_text,
+    single_flight=True
+)
+def get_ai_recommendation(prompt_text, request_key=None):
+    """
+    Send prompt to Gemini API and retrieve structured recommendation.
+    Cached for the "ai_recommendation" cache timeout to avoid excessive API calls,
+    keyed on request_key (see summary_request_key) when given, otherwise on
+    the prompt. Identical requests in flight share one API call.
+    """
+    headers, payload = _request_args(prompt_text)
+    
+    try:
+        url = current_app.config["GEMINI_API_URL"]
+        response = http_client.post("gemini", url, json=payload, headers=headers)
+        response.raise_for_status()
+        return _parse_recommendation(response.json())
+    except requests.exceptions.RequestException as e:
+        current_app.logger.error(f"Gemini API error: {str(e)}")
+        return fallback_recommendation(UNAVAILABLE_TEXT)
+    except (KeyError, ValueError) as e:
+        current_app.logger.error(f"Gemini data parsing error: {str(e)}")
+        return fallback_recommendation(ERROR_TEXT)
@@ -0,0 +1,211 @@
+# services/geocode_service.py
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import TimeoutError as QueueTimeout
+from datetime import datetime, timedelta
+from flask import current_app
+from database import db
+from models import GeocodeEntry
+from concurrency import submit
+from instrumentation import record_upstream
+
+def normalize_address(address):
+    """Cache key for an address: accents, punctuation, case and spacing folded away"""
+    text = unicodedata.normalize("NFKD", address).encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+class Gazetteer:
+    """
+    Place names to coordinates from a tab-separated file (name, lat, lon,
+    address), indexed in a character trie on normalized names. "Moab, UT"
+    is also indexed as "moab".
+    """
+
+    def __init__(self, path):
+        self.root = {}
+        self.size = 0
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                name, lat, lon, address = line.rstrip("\n").split("\t")
+                place = {"lat": float(lat), "lon": float(lon), "address": address}
+                self.insert(normalize_address(name), place)
+                if "," in name:
+                    self.insert(normalize_address(name.split(",")[0]), place)
+                self.size += 1
+
+    def insert(self, key, place):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault("", place)  # "" marks the end of a name; the first entry wins
+
+    def _node(self, key):
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, address):
+        """The place named exactly address (after normalization), or None"""
+        node = self._node(normalize_address(address))
+        return node.get("") if node else None
+
+    def complete(self, prefix, limit=10):
+        """Up to limit places whose normalized name starts with prefix, shortest names first"""
+        node = self._node(normalize_address(prefix))
+        if node is None:
+            return []
+        found = []
+        level = [node]
+        while level and len(found) < limit:
+            following = []
+            for node in level:
+                for char, child in sorted(node.items()):
+                    if char == "":
+                        if child not in found:
+                            found.append(child)
+                    else:
+                        following.append(child)
+            level = following
+        return found[:limit]
+
+_gazetteers = {}
+_gazetteers_lock = threading.Lock()
+
+def get_gazetteer():
+    """
+    The configured gazetteer, loaded on first use; None when disabled or
+    when the file is missing, so lookups go to the cache and geocoder.
+    """
+    path = current_app.config["GAZETTEER_PATH"]
+    if not path:
+        return None
+    with _gazetteers_lock:
+        if path not in _gazetteers:
+            if os.path.exists(path):
+                _gazetteers[path] = Gazetteer(path)
+            else:
+                current_app.logger.warning(f"Gazetteer {path} not found; geocoding without it")
+                _gazetteers[path] = None
+        return _gazetteers[path]
+
+class RateLimiter:
+    """
+    Spaces calls at least interval seconds apart across threads. The
+    limit is per process: with several workers, Nominatim sees up to one
+    request per interval from each.
+    """
+
+    def __init__(self):
+        self.next_call = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self, interval):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_call)
+            self.next_call = start + interval
+        time.sleep(start - now)
+
+_geolocators = {}
+_nominatim_limit = RateLimiter()
+
+def _geocode(address):
+    """One Nominatim lookup, no sooner than GEOCODE_MIN_INTERVAL after the last"""
+    config = current_app.config
+    user_agent = config["GEOCODER_USER_AGENT"]
+    geolocator = _geolocators.get(user_agent)
+    if geolocator is None:
+        from geopy.geocoders import Nominatim
+        geolocator = _geolocators[user_agent] = Nominatim(user_agent=user_agent, timeout=config["GEOCODE_TIMEOUT"])
+
+    _nominatim_limit.wait(config["GEOCODE_MIN_INTERVAL"])
+    started = time.perf_counter()
+    ok = False
+    try:
+        location = geolocator.geocode(address)
+        ok = True
+    finally:
+        record_upstream("geocode", time.perf_counter() - started, ok)
+    if location is None:
+        return None
+    return {"lat": location.latitude, "lon": location.longitude, "address": location.address}
+
+def _cached(normalized):
+    """(hit, location) from the geocode table; expired rows are misses"""
+    entry = db.session.get(GeocodeEntry, normalized)
+    if entry is None:
+        return False, None
+    found = entry.lat is not None
+    ttl = current_app.config["GEOCODE_CACHE_TTL" if found else "GEOCODE_NEGATIVE_TTL"]
+    if datetime.utcnow() - entry.created_at > timedelta(seconds=ttl):
+        return False, None
+    return True, entry.to_dict() if found else None
+
+def _store(normalized, location):
+    try:
+        entry = db.session.get(GeocodeEntry, normalized) or GeocodeEntry(normalized_address=normalized)
+        entry.lat = location["lat"] if location else None
+        entry.lon = location["lon"] if location else None
+        entry.address = location["address"] if location else None
+        entry.created_at = datetime.utcnow()
+        db.session.merge(entry)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Geocode cache error: {str(e)}")
+
+def _lookup(normalized, address):
+    """
+    Queue job: geocode an address and cache the answer, unless a job
+    ahead of it already did. The "geocode" pool has one worker, so a
+    repeated address waits for the first lookup and then reads its answer.
+    """
+    hit, location = _cached(normalized)
+    if hit:
+        return location
+    location = _geocode(address)
+    _store(normalized, location)
+    return location
+
+def get_location_details(address):
+    """
+    Coordinates for an address: from the bundled gazetteer, then the
+    persistent geocode cache, then Nominatim. Live lookups wait in a queue
+    that keeps to Nominatim's one request per second (per process);
+    identical queued addresses share one lookup. Answers (including
+    "not found") are cached by normalized address. Returns None if the address can't be
+    found or the queue doesn't get to it within GEOCODE_QUEUE_TIMEOUT;
+    the lookup still completes and is cached for the next request.
+    """
+    gazetteer = get_gazetteer()
+    if gazetteer is not None:
+        place = gazetteer.lookup(address)
+        if place:
+            return dict(place)
+
+    normalized = normalize_address(address)
+    if not normalized:
+        return None
+    hit, location = _cached(normalized)
+    if hit:
+        return location
+
+    from geopy.exc import GeopyError  # only needed once a lookup goes to Nominatim
+    lookup = submit("geocode", _lookup, normalized, address)
+    try:
+        return lookup.result(timeout=current_app.config["GEOCODE_QUEUE_TIMEOUT"])
+    except QueueTimeout:
+        current_app.logger.warning(f"Geocode queue timed out for {address!r}")
+        return None
+    except GeopyError as e:
+        current_app.logger.error(f"Geocoder error: {str(e)}")
+        return None
@@ -0,0 +1,163 @@
+# services/http_client.py
+
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app
+from instrumentation import record_upstream
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures.
+    After `threshold` consecutive failures the circuit opens and calls are
+    rejected for `reset_timeout` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError or let the call through; returns True if it is the half-open trial"""
+        with self.lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self.trial_in_flight):
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            if state == "half-open":
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        """End a trial call that neither succeeded nor failed, e.g. one cancelled at a deadline"""
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def call(self, fn, *args, failure_types=(Exception,), **kwargs):
+        """Run fn through the breaker; only failure_types count as failures"""
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except failure_types:
+            self.record_failure()
+            raise
+        except Exception:
+            self.record_success()
+            raise
+        self.record_success()
+        return result
+
+_breakers = {}
+_session = None
+_lock = threading.Lock()
+
+def get_breaker(upstream):
+    """Return the circuit breaker for an upstream service"""
+    with _lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            config = current_app.config
+            breaker = _breakers[upstream] = CircuitBreaker(
+                upstream,
+                config["CIRCUIT_FAILURE_THRESHOLD"],
+                config["CIRCUIT_RESET_TIMEOUT"]
+            )
+        return breaker
+
+def make_adapter(retries=True):
+    """
+    Keep-alive adapter sized for our upstream concurrency.
+    Retries 429/5xx responses and connection errors with jittered
+    exponential backoff, honouring Retry-After.
+    """
+    config = current_app.config
+    max_retries = 0
+    if retries:
+        max_retries = Retry(
+            total=config["HTTP_RETRIES"],
+            backoff_factor=config["HTTP_BACKOFF_FACTOR"],
+            backoff_jitter=config["HTTP_BACKOFF_FACTOR"],
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True
+        )
+    return HTTPAdapter(
+        pool_connections=config["HTTP_POOL_CONNECTIONS"],
+        pool_maxsize=config["HTTP_POOL_MAXSIZE"],
+        max_retries=max_retries
+    )
+
+def get_session():
+    """Return the shared HTTP session, one connection pool per host"""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = make_adapter()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def request(upstream, method, url, **kwargs):
+    """
+    Send a request to an upstream through its circuit breaker.
+    Raises CircuitOpenError (a RequestException) while the circuit is open,
+    so callers' existing error handling returns their fallback data.
+    """
+    kwargs.setdefault("timeout", current_app.config["HTTP_TIMEOUT"])
+    breaker = get_breaker(upstream)
+    breaker.before_call()
+    started = time.perf_counter()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except Exception:
+        # Any exception ends the call, so a half-open trial is never left in flight
+        breaker.record_failure()
+        record_upstream(upstream, time.perf_counter() - started, ok=False)
+        raise
+    failed = response.status_code == 429 or response.status_code >= 500
+    if failed:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    record_upstream(upstream, time.perf_counter() - started, ok=not failed)
+    return response
+
+def get(upstream, url, **kwargs):
+    return request(upstream, "GET", url, **kwargs)
+
+def post(upstream, url, **kwargs):
+    return request(upstream, "POST", url, **kwargs)
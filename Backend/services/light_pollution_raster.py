@@ -0,0 +1,80 @@
+# services/light_pollution_raster.py
+
+import struct
+import threading
+import numpy as np
+
+# Binary grid layout: fixed header followed by rows * cols uint8 Bortle
+# values (0 = no data), row 0 at the northern edge.
+MAGIC = b"BGRD"
+HEADER = struct.Struct("<4sHxxIIdddd")  # magic, version, rows, cols,
+                                        # lat_north, lon_west, cell_lat, cell_lon
+VERSION = 1
+
+BORTLE_DESCRIPTIONS = {
+    1: "Excellent dark-sky site",
+    2: "Typical truly dark site",
+    3: "Rural sky",
+    4: "Rural/suburban transition",
+    5: "Suburban sky",
+    6: "Bright suburban sky",
+    7: "Suburban/urban transition",
+    8: "City sky",
+    9: "Inner-city sky"
+}
+
+class BortleRaster:
+    """
+    Memory-mapped Bortle grid.
+    Only the header is read up front; cells are paged in by the OS as
+    lookups touch them, so opening even a global grid is instant.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        magic, version, rows, cols, lat_north, lon_west, cell_lat, cell_lon = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a Bortle grid file")
+
+        self.lat_north = lat_north
+        self.lon_west = lon_west
+        self.cell_lat = cell_lat
+        self.cell_lon = cell_lon
+        self.grid = np.memmap(path, dtype=np.uint8, mode="r",
+                              offset=HEADER.size, shape=(rows, cols))
+
+    def lookup_many(self, lats, lons):
+        """Bortle class for each point, 0 where the grid has no data"""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        rows = np.floor((self.lat_north - lats) / self.cell_lat).astype(np.int64)
+        cols = np.floor((lons - self.lon_west) / self.cell_lon).astype(np.int64)
+
+        n_rows, n_cols = self.grid.shape
+        inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+        bortle = np.zeros(len(lats), dtype=np.uint8)
+        bortle[inside] = self.grid[rows[inside], cols[inside]]
+        return bortle
+
+    def lookup(self, lat, lon):
+        return int(self.lookup_many([lat], [lon])[0])
+
+def write_raster(path, bortle, lat_north, lon_west, cell_lat, cell_lon):
+    """Write a 2-D array of Bortle classes in the binary grid format"""
+    bortle = np.ascontiguousarray(bortle, dtype=np.uint8)
+    rows, cols = bortle.shape
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rows, cols, lat_north, lon_west, cell_lat, cell_lon))
+        f.write(bortle.tobytes())
+
+_rasters = {}
+_rasters_lock = threading.Lock()
+
+def get_raster(path):
+    """Return the shared raster for path, mapping it on first use"""
+    with _rasters_lock:
+        raster = _rasters.get(path)
+        if raster is None:
+            raster = _rasters[path] = BortleRaster(path)
+        return raster
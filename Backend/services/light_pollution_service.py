@@ -1,64 +1,109 @@
-# services/light_pollution_service.py
-
-import requests
-from flask import current_app
-from functools import lru_cache
-import time
-
-@lru_cache(maxsize=100)
-def get_light_pollution_level(lat, lon):
-    """
-    Retrieve light pollution level for the given coordinates.
-    Uses the Light Pollution Map API to get Bortle scale data.
-    Cached for 1 hour to avoid excessive API calls.
-    """
-    api_key = current_app.config["LIGHT_POLLUTION_API_KEY"]
-    if not api_key:
-        raise ValueError("LIGHT_POLLUTION_API_KEY is not configured")
-
-    # Validate coordinates
-    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-        raise ValueError("Invalid latitude or longitude")
-
-    try:
-        url = current_app.config["LIGHT_POLLUTION_API_URL"]
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "apikey": api_key
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        # Extract Bortle scale (1-9, where 1 is darkest)
-        bortle_scale = data.get("bortle_scale", 5)
-        
-        # Convert to our scale (1-10, where 10 is darkest)
-        # Bortle 1 (darkest) -> 10
-        # Bortle 9 (brightest) -> 2
-        our_scale = 11 - bortle_scale
-        
-        return {
-            "level": our_scale,
-            "bortle_scale": bortle_scale,
-            "description": data.get("description", "Unknown"),
-            "timestamp": int(time.time())
-        }
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Light pollution API error: {str(e)}")
-        return {
-            "level": 5,  # Default to middle value
-            "bortle_scale": 5,
-            "description": "unavailable",
-            "timestamp": int(time.time())
-        }
-    except (KeyError, ValueError) as e:
-        current_app.logger.error(f"Light pollution data parsing error: {str(e)}")
-        return {
-            "level": 5,  # Default to middle value
-            "bortle_scale": 5,
-            "description": "data error",
-            "timestamp": int(time.time())
-        }
+# services/light_pollution_service.py
+
+import requests
+from flask import current_app
+from services import http_client
+from cache import cached
+from services.light_pollution_raster import get_raster, BORTLE_DESCRIPTIONS
+from records import LightPollution
+import time
+
+UNAVAILABLE_DESCRIPTIONS = ("unavailable", "data error", "timed out")
+
+def unavailable_light_pollution(description):
+    """Fallback light pollution used when no real data could be fetched"""
+    return LightPollution(
+        level=5,  # Default to middle value
+        bortle_scale=5,
+        description=description,
+        timestamp=int(time.time())
+    )
+
+def is_unavailable(lp_data):
+    """True for the fallbacks built by unavailable_light_pollution"""
+    return lp_data.description in UNAVAILABLE_DESCRIPTIONS
+
+def get_light_pollution_level(lat, lon):
+    """
+    Retrieve light pollution level for the given coordinates.
+    Reads the local raster when LIGHT_POLLUTION_BACKEND is "raster",
+    otherwise asks the Light Pollution Map API.
+    """
+    if current_app.config["LIGHT_POLLUTION_BACKEND"] == "raster":
+        # Validate coordinates
+        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            raise ValueError("Invalid latitude or longitude")
+        return lookup_many([(lat, lon)])[0]
+    return fetch_light_pollution_level(lat, lon)
+
+def lookup_many(coords):
+    """
+    Light pollution for a list of (lat, lon) points from the local raster.
+    One vectorized grid read, no network; results align with coords.
+    """
+    raster = get_raster(current_app.config["LIGHT_POLLUTION_RASTER_PATH"])
+    lats = [lat for lat, _ in coords]
+    lons = [lon for _, lon in coords]
+    timestamp = int(time.time())
+
+    levels = []
+    for bortle_scale in raster.lookup_many(lats, lons).tolist():
+        if not bortle_scale:
+            levels.append(unavailable_light_pollution("no data"))
+            continue
+        levels.append(LightPollution(
+            level=11 - bortle_scale,
+            bortle_scale=bortle_scale,
+            description=BORTLE_DESCRIPTIONS.get(bortle_scale, "Unknown"),
+            timestamp=timestamp
+        ))
+    return levels
+
+def _parse_light_pollution(data):
+    # Extract Bortle scale (1-9, where 1 is darkest)
+    bortle_scale = data.get("bortle_scale", 5)
+    
+    # Convert to our scale (1-10, where 10 is darkest)
+    # Bortle 1 (darkest) -> 10
+    # Bortle 9 (brightest) -> 2
+    our_scale = 11 - bortle_scale
+    
+    return LightPollution(
+        level=our_scale,
+        bortle_scale=bortle_scale,
+        description=data.get("description", "Unknown"),
+        timestamp=int(time.time())
+    )
+
+@cached("light_pollution", unless=is_unavailable, tiled=True)
+def fetch_light_pollution_level(lat, lon):
+    """
+    Retrieve light pollution level from the Light Pollution Map API.
+    Uses the Bortle scale data for the given coordinates.
+    Cached for the "light_pollution" cache timeout to avoid excessive API calls.
+    """
+    api_key = current_app.config["LIGHT_POLLUTION_API_KEY"]
+    if not api_key:
+        raise ValueError("LIGHT_POLLUTION_API_KEY is not configured")
+
+    # Validate coordinates
+    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        raise ValueError("Invalid latitude or longitude")
+
+    try:
+        url = current_app.config["LIGHT_POLLUTION_API_URL"]
+        params = {
+            "lat": lat,
+            "lon": lon,
+            "apikey": api_key
+        }
+        
+        response = http_client.get("light_pollution", url, params=params)
+        response.raise_for_status()
+        return _parse_light_pollution(response.json())
+    except requests.exceptions.RequestException as e:
+        current_app.logger.error(f"Light pollution API error: {str(e)}")
+        return unavailable_light_pollution("unavailable")
+    except (KeyError, ValueError) as e:
+        current_app.logger.error(f"Light pollution data parsing error: {str(e)}")
+        return unavailable_light_pollution("data error")
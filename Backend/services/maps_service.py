@@ -1,141 +1,246 @@
-import googlemaps
+import requests
+import threading
 from flask import current_app
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
+from services.http_client import get_breaker, make_adapter
+from concurrency import submit
+from cache import cached
+from instrumentation import record_upstream
+from records import Place, Trail
 import time
 
+# Details field names; the client rejects 'photos' (the response key) as a field
+PLACE_FIELDS = [
+    'place_id', 'name', 'rating', 'formatted_address', 'geometry',
+    'opening_hours', 'photo', 'website', 'formatted_phone_number'
+]
+TRAIL_FIELDS = PLACE_FIELDS + ['reviews']
+
+_clients = {}
+_clients_lock = threading.Lock()
+
 def get_maps_client():
-    """Initialize Google Maps client"""
+    """
+    Return the shared Google Maps client.
+    One client per key means every search and details lookup reuses the
+    same keep-alive connection pool instead of opening a new one.
+    """
     api_key = current_app.config["GOOGLE_MAPS_API_KEY"]
     if not api_key:
         raise ValueError("GOOGLE_MAPS_API_KEY is not configured")
-    return googlemaps.Client(key=api_key)
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            import googlemaps  # imported on first use rather than at worker boot
+            # googlemaps retries failed calls itself, so the adapter doesn't
+            session = requests.Session()
+            session.mount("https://", make_adapter(retries=False))
+            connect_timeout, read_timeout = current_app.config["HTTP_TIMEOUT"]
+            client = googlemaps.Client(key=api_key, requests_session=session,
+                                       connect_timeout=connect_timeout, read_timeout=read_timeout,
+                                       retry_timeout=current_app.config["MAPS_RETRY_TIMEOUT"])
+            _clients[api_key] = client
+        return client
+
+def _call(fn, *args, **kwargs):
+    """Call a googlemaps client method through the Maps circuit breaker"""
+    import googlemaps
 
-def get_location_details(address):
-    """Get coordinates from address using Geopy"""
+    # Only transport-level problems count against the Maps circuit breaker;
+    # API statuses like INVALID_REQUEST or ZERO_RESULTS are normal answers
+    failures = (googlemaps.exceptions.TransportError, googlemaps.exceptions.Timeout)
+    started = time.perf_counter()
+    ok = False
     try:
-        geolocator = Nominatim(user_agent="camping_app")
-        location = geolocator.geocode(address)
-        if location:
-            return {
-                "lat": location.latitude,
-                "lon": location.longitude,
-                "address": location.address
-            }
-        return None
-    except GeocoderTimedOut:
-        return None
+        result = get_breaker("maps").call(fn, *args, failure_types=failures, **kwargs)
+        ok = True
+        return result
+    finally:
+        record_upstream(f"maps:{fn.__name__}", time.perf_counter() - started, ok)
 
-def get_nearby_places(lat, lon, radius=50000, place_type="campground"):
-    """Get nearby places using Google Places API"""
+def _next_page(gmaps, page_token, **query):
+    """
+    Fetch the next page of a nearby search.
+    Google rejects a fresh page token with INVALID_REQUEST until it becomes
+    active, so poll with exponential backoff instead of a fixed sleep.
+    """
+    import googlemaps
+
+    delay = current_app.config["MAPS_PAGE_TOKEN_DELAY"]
+    deadline = time.monotonic() + current_app.config["MAPS_PAGE_TOKEN_TIMEOUT"]
+    while True:
+        time.sleep(delay)
+        try:
+            return _call(gmaps.places_nearby, page_token=page_token, **query)
+        except googlemaps.exceptions.ApiError as e:
+            if e.status != "INVALID_REQUEST" or time.monotonic() + delay > deadline:
+                raise
+            delay = min(delay * 2, 2)
+
+def _get_details(gmaps, place_id, fields):
+    return _call(gmaps.place, place_id, fields=fields)['result']
+
+class DetailsRegistry:
+    """
+    Tracks Place Details lookups shared by several nearby searches.
+    Each place is looked up once; a later search that needs extra fields
+    only fetches the fields that are still missing.
+    """
+
+    def __init__(self, gmaps):
+        self.gmaps = gmaps
+        self.lookups = {}
+        self.lock = threading.Lock()
+
+    def request(self, place_id, fields):
+        with self.lock:
+            lookups = self.lookups.setdefault(place_id, [])
+            fetched = {f for requested, _ in lookups for f in requested}
+            missing = [f for f in fields if f not in fetched]
+            if missing:
+                future = submit("maps", _get_details, self.gmaps, place_id, missing)
+                lookups.append((missing, future))
+
+    def details(self, place_id):
+        merged = {}
+        for _, future in self.lookups[place_id]:
+            merged.update(future.result())
+        return merged
+
+def _collect(gmaps, registry, fields, query):
+    """Page through one nearby search, requesting details for each hit"""
+    place_ids = []
+    result = _call(gmaps.places_nearby, **query)
+    while result.get('results'):
+        for place in result['results']:
+            place_ids.append(place['place_id'])
+            registry.request(place['place_id'], fields)
+
+        # Check if there are more results
+        if 'next_page_token' not in result:
+            break
+        result = _next_page(gmaps, result['next_page_token'], **query)
+    return place_ids
+
+def search_places(lat, lon, radius, fields=PLACE_FIELDS, **query):
+    """
+    Run a paged nearby search and fetch details for every hit.
+    Details are fetched concurrently, overlapping with the wait for the
+    next page token. Returns the raw details dicts in search order.
+    """
+    gmaps = get_maps_client()
+    registry = DetailsRegistry(gmaps)
+    query = dict(location=(lat, lon), radius=radius, **query)
+    place_ids = _collect(gmaps, registry, fields, query)
+    return [registry.details(place_id) for place_id in place_ids]
+
+@cached("directions", unless=lambda route: route is None)
+def get_directions(lat, lon, place_id):
+    """
+    Turn-by-turn driving directions from a point to a place, or None.
+    Only fetched on demand for the place a user picks; rankings use the
+    batched drive times from travel_time_service.
+    """
     try:
-        gmaps = get_maps_client()
-        places_result = gmaps.places_nearby(
-            location=(lat, lon),
-            radius=radius,
-            type=place_type
+        directions = _call(
+            get_maps_client().directions,
+            origin=f"{lat},{lon}",
+            destination=f"place_id:{place_id}",
+            mode="driving"
         )
-        
-        places = []
-        while places_result.get('results'):
-            for place in places_result['results']:
-                # Get detailed place information
-                place_details = gmaps.place(place['place_id'], fields=[
-                    'name', 'rating', 'formatted_address', 'geometry',
-                    'opening_hours', 'photos', 'website', 'formatted_phone_number'
-                ])['result']
-                
-                # Get directions to the place
-                directions = gmaps.directions(
-                    origin=f"{lat},{lon}",
-                    destination=place['place_id'],
-                    mode="driving"
-                )
-                
-                places.append({
-                    "name": place_details.get('name'),
-                    "address": place_details.get('formatted_address'),
-                    "location": place_details.get('geometry', {}).get('location'),
-                    "rating": place_details.get('rating'),
-                    "is_open": place_details.get('opening_hours', {}).get('open_now'),
-                    "photos": place_details.get('photos', []),
-                    "website": place_details.get('website'),
-                    "phone": place_details.get('formatted_phone_number'),
-                    "directions": directions[0] if directions else None
-                })
-            
-            # Check if there are more results
-            if 'next_page_token' in places_result:
-                time.sleep(2)  # Wait before requesting next page
-                places_result = gmaps.places_nearby(
-                    location=(lat, lon),
-                    radius=radius,
-                    type=place_type,
-                    page_token=places_result['next_page_token']
-                )
-            else:
-                break
-                
-        return places
+    except Exception as e:
+        current_app.logger.error(f"Google Maps directions error: {str(e)}")
+        return None
+    return directions[0] if directions else None
+
+def distance_matrix(lat, lon, place_ids):
+    """
+    Driving distance and duration from a point to each place, in one
+    Distance Matrix call (at most MAPS_MATRIX_BATCH places). Returns the
+    raw matrix elements, aligned with place_ids.
+    """
+    matrix = _call(
+        get_maps_client().distance_matrix,
+        origins=[(lat, lon)],
+        destinations=[f"place_id:{place_id}" for place_id in place_ids],
+        mode="driving"
+    )
+    return matrix["rows"][0]["elements"]
+
+def _place_fields(details):
+    location = details.get('geometry', {}).get('location') or {}
+    return dict(
+        place_id=details.get('place_id'),
+        name=details.get('name'),
+        address=details.get('formatted_address'),
+        lat=location.get('lat'),
+        lng=location.get('lng'),
+        rating=details.get('rating'),
+        is_open=details.get('opening_hours', {}).get('open_now'),
+        photos=details.get('photos', []),
+        website=details.get('website'),
+        phone=details.get('formatted_phone_number')
+    )
+
+def _place_from_details(details):
+    return Place(**_place_fields(details))
+
+def _trail_from_details(details):
+    return Trail(reviews=details.get('reviews', []), **_place_fields(details))
+
+def _find_nearby_places(lat, lon, radius, place_type):
+    try:
+        details = search_places(lat, lon, radius, fields=PLACE_FIELDS, type=place_type)
+        return [_place_from_details(d) for d in details]
+    except Exception as e:
+        current_app.logger.error(f"Google Maps API error: {str(e)}")
+        return []
+
+def _find_hiking_trails(lat, lon, radius):
+    try:
+        details = search_places(lat, lon, radius, fields=TRAIL_FIELDS,
+                                type="park", keyword="hiking trail")
+        return [_trail_from_details(d) for d in details]
     except Exception as e:
         current_app.logger.error(f"Google Maps API error: {str(e)}")
         return []
 
+def get_nearby_places(lat, lon, radius=50000, place_type="campground"):
+    """Get nearby places, each with its drive time from (lat, lon)"""
+    from services.travel_time_service import attach_drive_times  # imports this module
+    return attach_drive_times(_find_nearby_places(lat, lon, radius, place_type), lat, lon)
+
 def get_hiking_trails(lat, lon, radius=50000):
-    """Get nearby hiking trails"""
+    """Get nearby hiking trails, each with its drive time from (lat, lon)"""
+    from services.travel_time_service import attach_drive_times
+    return attach_drive_times(_find_hiking_trails(lat, lon, radius), lat, lon)
+
+def discover_places(lat, lon, radius=50000, registry=None):
+    """
+    Search campgrounds and hiking trails around a point in one pass.
+    Both nearby searches page concurrently on the shared client, and places
+    returned by both are only looked up once. Pass a DetailsRegistry to
+    share lookups with other searches too.
+    Returns (campsites, trails) without drive times.
+    """
     try:
         gmaps = get_maps_client()
-        trails_result = gmaps.places_nearby(
-            location=(lat, lon),
-            radius=radius,
-            type="park",
-            keyword="hiking trail"
-        )
-        
-        trails = []
-        while trails_result.get('results'):
-            for trail in trails_result['results']:
-                # Get detailed trail information
-                trail_details = gmaps.place(trail['place_id'], fields=[
-                    'name', 'rating', 'formatted_address', 'geometry',
-                    'opening_hours', 'photos', 'website', 'formatted_phone_number',
-                    'reviews'
-                ])['result']
-                
-                # Get directions to the trail
-                directions = gmaps.directions(
-                    origin=f"{lat},{lon}",
-                    destination=trail['place_id'],
-                    mode="driving"
-                )
-                
-                trails.append({
-                    "name": trail_details.get('name'),
-                    "address": trail_details.get('formatted_address'),
-                    "location": trail_details.get('geometry', {}).get('location'),
-                    "rating": trail_details.get('rating'),
-                    "reviews": trail_details.get('reviews', []),
-                    "is_open": trail_details.get('opening_hours', {}).get('open_now'),
-                    "photos": trail_details.get('photos', []),
-                    "website": trail_details.get('website'),
-                    "phone": trail_details.get('formatted_phone_number'),
-                    "directions": directions[0] if directions else None
-                })
-            
-            # Check if there are more results
-            if 'next_page_token' in trails_result:
-                time.sleep(2)  # Wait before requesting next page
-                trails_result = gmaps.places_nearby(
-                    location=(lat, lon),
-                    radius=radius,
-                    type="park",
-                    keyword="hiking trail",
-                    page_token=trails_result['next_page_token']
-                )
-            else:
-                break
-                
-        return trails
     except Exception as e:
         current_app.logger.error(f"Google Maps API error: {str(e)}")
-        return [] 
\ No newline at end of file
+        return [], []
+
+    registry = registry or DetailsRegistry(gmaps)
+    location = dict(location=(lat, lon), radius=radius)
+    campsite_search = submit("discovery", _collect, gmaps, registry, PLACE_FIELDS,
+                             dict(type="campground", **location))
+    trail_search = submit("discovery", _collect, gmaps, registry, TRAIL_FIELDS,
+                          dict(type="park", keyword="hiking trail", **location))
+
+    def resolve(search, build):
+        try:
+            return [build(registry.details(place_id)) for place_id in search.result()]
+        except Exception as e:
+            current_app.logger.error(f"Google Maps API error: {str(e)}")
+            return []
+
+    return (resolve(campsite_search, _place_from_details),
+            resolve(trail_search, _trail_from_details))
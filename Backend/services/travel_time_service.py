@@ -0,0 +1,82 @@
+# services/travel_time_service.py
+
+from concurrent.futures import wait
+from flask import current_app
+from cache import cached, tile_coordinates
+from concurrency import submit
+from services.maps_service import distance_matrix
+
+def drive_time(element):
+    """{"distance": meters, "duration": seconds} from a matrix element, or None"""
+    if element.get("status") != "OK":
+        return None
+    return {
+        "distance": element["distance"]["value"],
+        "duration": element["duration"]["value"]
+    }
+
+@cached("travel_times", unless=lambda time: time is None, tiled=True)
+def get_drive_time(lat, lon, place_id):
+    """
+    Drive time from a point to one place.
+    Cached per (origin tile, place_id) for the "travel_times" cache timeout;
+    get_drive_times fills the same entries in batches.
+    """
+    return drive_time(distance_matrix(lat, lon, [place_id])[0])
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def get_drive_times(lat, lon, places, timeout=None):
+    """
+    Drive times from a point to every place, aligned with places; None
+    where unknown. Cached times are used first and the rest are fetched in
+    Distance Matrix calls of MAPS_MATRIX_BATCH destinations, concurrently.
+    Batches still pending after timeout seconds are left unknown.
+    """
+    origin = tile_coordinates("travel_times", lat, lon)
+    times = {}
+    missing = []
+    for place_id in dict.fromkeys(p.place_id for p in places if p.place_id):
+        hit, value = get_drive_time.lookup(*origin, place_id)
+        if hit:
+            times[place_id] = value
+        else:
+            missing.append(place_id)
+
+    batches = {
+        submit("maps", distance_matrix, *origin, chunk): chunk
+        for chunk in _chunks(missing, current_app.config["MAPS_MATRIX_BATCH"])
+    }
+    _, pending = wait(batches, timeout=timeout)
+    if pending:
+        current_app.logger.warning(f"Drive time deadline reached with {len(pending)} batches pending")
+    for future, chunk in batches.items():
+        if future in pending:
+            future.cancel()
+            continue
+        try:
+            elements = future.result()
+        except Exception as e:
+            current_app.logger.error(f"Google Maps distance matrix error: {str(e)}")
+            continue
+        for place_id, element in zip(chunk, elements):
+            times[place_id] = drive_time(element)
+            get_drive_time.prime(times[place_id], *origin, place_id)
+
+    return [times.get(p.place_id) for p in places]
+
+def cached_drive_times(lat, lon, places):
+    """Drive times already in the cache, aligned with places; None elsewhere"""
+    origin = tile_coordinates("travel_times", lat, lon)
+    times = []
+    for place in places:
+        hit, value = get_drive_time.lookup(*origin, place.place_id) if place.place_id else (False, None)
+        times.append(value if hit else None)
+    return times
+
+def attach_drive_times(places, lat, lon, timeout=None):
+    """Set each place's drive to its drive time from a point"""
+    for place, time in zip(places, get_drive_times(lat, lon, places, timeout)):
+        place.drive = time
+    return places
@@ -1,69 +1,201 @@
-# services/weather_service.py
-
-import os
-import requests
-from flask import current_app
-from functools import lru_cache
-import time
-
-@lru_cache(maxsize=100)
-def get_weather(lat, lon):
-    """
-    Fetch weather data from OpenWeatherMap API.
-    Cached for 1 hour to avoid excessive API calls.
-    """
-    api_key = current_app.config["WEATHER_API_KEY"]
-    if not api_key:
-        raise ValueError("WEATHER_API_KEY is not configured")
-
-    # Validate coordinates
-    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-        raise ValueError("Invalid latitude or longitude")
-
-    try:
-        url = current_app.config["WEATHER_API_URL"]
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": api_key,
-            "units": "metric"
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        # Extract relevant weather data
-        weather = {
-            "temp": data["main"]["temp"],
-            "description": data["weather"][0]["description"],
-            "clouds": data["clouds"]["all"],
-            "rain": "rain" in data if "rain" in data else False,
-            "humidity": data["main"]["humidity"],
-            "wind_speed": data["wind"]["speed"],
-            "timestamp": int(time.time())
-        }
-        
-        return weather
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Weather API error: {str(e)}")
-        return {
-            "temp": None,
-            "description": "unavailable",
-            "clouds": None,
-            "rain": None,
-            "humidity": None,
-            "wind_speed": None,
-            "timestamp": int(time.time())
-        }
-    except (KeyError, ValueError) as e:
-        current_app.logger.error(f"Weather data parsing error: {str(e)}")
-        return {
-            "temp": None,
-            "description": "data error",
-            "clouds": None,
-            "rain": None,
-            "humidity": None,
-            "wind_speed": None,
-            "timestamp": int(time.time())
-        }
+# services/weather_service.py
+
+import os
+import requests
+from concurrent.futures import wait
+from flask import current_app
+from services import http_client
+from cache import cached, tile_coordinates
+from concurrency import submit
+from spatial_index import SpatialIndex
+from records import Weather
+import time
+
+UNAVAILABLE_DESCRIPTIONS = ("unavailable", "data error", "timed out")
+
+def unavailable_weather(description):
+    """Fallback weather used when no real data could be fetched"""
+    return Weather(
+        temp=None,
+        description=description,
+        clouds=None,
+        rain=None,
+        humidity=None,
+        wind_speed=None,
+        timestamp=int(time.time())
+    )
+
+def is_unavailable(weather):
+    """True for the fallbacks built by unavailable_weather"""
+    return weather.temp is None and weather.description in UNAVAILABLE_DESCRIPTIONS
+
+def _parse_weather(data):
+    """Extract relevant weather data from an OpenWeatherMap conditions payload"""
+    return Weather(
+        temp=data["main"]["temp"],
+        description=data["weather"][0]["description"],
+        clouds=data["clouds"]["all"],
+        rain="rain" in data if "rain" in data else False,
+        humidity=data["main"]["humidity"],
+        wind_speed=data["wind"]["speed"],
+        timestamp=int(time.time())
+    )
+
+@cached("weather", unless=is_unavailable, tiled=True)
+def get_weather(lat, lon):
+    """
+    Fetch weather data from OpenWeatherMap API.
+    Cached for the "weather" cache timeout to avoid excessive API calls.
+    """
+    api_key = current_app.config["WEATHER_API_KEY"]
+    if not api_key:
+        raise ValueError("WEATHER_API_KEY is not configured")
+
+    # Validate coordinates
+    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        raise ValueError("Invalid latitude or longitude")
+
+    try:
+        url = current_app.config["WEATHER_API_URL"]
+        params = {
+            "lat": lat,
+            "lon": lon,
+            "appid": api_key,
+            "units": "metric"
+        }
+        
+        response = http_client.get("weather", url, params=params)
+        response.raise_for_status()
+        data = response.json()
+
+        return _parse_weather(data)
+    except requests.exceptions.RequestException as e:
+        current_app.logger.error(f"Weather API error: {str(e)}")
+        return unavailable_weather("unavailable")
+    except (KeyError, ValueError) as e:
+        current_app.logger.error(f"Weather data parsing error: {str(e)}")
+        return unavailable_weather("data error")
+
+def _fetch_stations(lat, lon):
+    """
+    Current conditions for the stations nearest a point, in one call.
+    Uses OpenWeatherMap's "find" endpoint, which returns up to
+    WEATHER_FIND_COUNT stations in the same shape as a single lookup.
+    """
+    params = _find_params(lat, lon)
+    response = http_client.get("weather", current_app.config["WEATHER_FIND_API_URL"], params=params)
+    response.raise_for_status()
+    return _parse_stations(response.json())
+
+def _find_params(lat, lon):
+    return {
+        "lat": lat,
+        "lon": lon,
+        "cnt": current_app.config["WEATHER_FIND_COUNT"],
+        "appid": current_app.config["WEATHER_API_KEY"],
+        "units": "metric"
+    }
+
+def _parse_stations(data):
+    return [
+        {
+            "location": {"lat": station["coord"]["lat"], "lng": station["coord"]["lon"]},
+            "weather": _parse_weather(station)
+        }
+        for station in data.get("list", [])
+    ]
+
+def _assign_stations(tiles):
+    """
+    Fill as many tiles as possible from one bulk station query.
+    Each tile gets the nearest station within WEATHER_STATION_MAX_KM.
+    """
+    try:
+        stations = _fetch_stations(*_center(tiles))
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        current_app.logger.error(f"Weather bulk API error: {str(e)}")
+        return {}
+    return _match_stations(stations, tiles)
+
+def _center(tiles):
+    return (sum(lat for lat, _ in tiles) / len(tiles),
+            sum(lon for _, lon in tiles) / len(tiles))
+
+def _match_stations(stations, tiles):
+    """Give each tile its nearest station's weather, priming the cache"""
+    index = SpatialIndex(stations)
+    max_km = current_app.config["WEATHER_STATION_MAX_KM"]
+    assigned = {}
+    for tile in tiles:
+        station, _ = index.nearest(*tile, max_km=max_km)
+        if station:
+            assigned[tile] = station["weather"]
+            get_weather.prime(station["weather"], *tile)
+    return assigned
+
+def refresh_weather(tiles, max_calls=None):
+    """
+    Fetch current weather for weather cache tiles and store it, whatever is
+    cached now; used to refresh hot tiles before their entries expire.
+    With max_calls, at most that many upstream calls are made: tiles
+    beyond it are left for the next refresh.
+    """
+    if not current_app.config["WEATHER_API_KEY"]:
+        raise ValueError("WEATHER_API_KEY is not configured")
+    missing = list(tiles)
+    calls = 0
+    if current_app.config["WEATHER_MODE"] == "regional" and len(missing) > 1 and max_calls != 0:
+        assigned = _assign_stations(missing)
+        missing = [tile for tile in missing if tile not in assigned]
+        calls = 1
+    if max_calls is not None:
+        missing = missing[:max(0, max_calls - calls)]
+    for tile in missing:
+        get_weather.prime(get_weather.uncached(*tile), *tile)
+
+def get_weather_many(coords, timeout=None):
+    """
+    Fetch weather for many (lat, lon) points, aligned with coords.
+    Points are grouped by weather cache tile so each tile is fetched once.
+    In "regional" WEATHER_MODE a single bulk station query covers the area
+    first and only tiles without a nearby station are looked up one by one;
+    if it is not back within half the timeout every tile is looked up that way.
+    Tiles still pending after timeout seconds get the fallback data.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    tiles = [tile_coordinates("weather", lat, lon) for lat, lon in coords]
+
+    weather = {}
+    for tile in dict.fromkeys(tiles):
+        hit, value = get_weather.lookup(*tile)
+        if hit:
+            weather[tile] = value
+
+    missing = [tile for tile in dict.fromkeys(tiles) if tile not in weather]
+    if missing and current_app.config["WEATHER_MODE"] == "regional" and len(missing) > 1:
+        if not current_app.config["WEATHER_API_KEY"]:
+            raise ValueError("WEATHER_API_KEY is not configured")
+        # Leave the per-tile fallback half the time that is left
+        bulk = submit("weather", _assign_stations, missing)
+        done, _ = wait([bulk], timeout=_remaining(deadline, share=0.5))
+        if done:
+            weather.update(bulk.result())
+            missing = [tile for tile in missing if tile not in weather]
+        else:
+            current_app.logger.warning("Weather deadline reached during the bulk station lookup")
+            bulk.cancel()
+
+    futures = {tile: submit("weather", get_weather, *tile) for tile in missing}
+    _, pending = wait(futures.values(), timeout=_remaining(deadline))
+    if pending:
+        current_app.logger.warning(f"Weather deadline reached with {len(pending)} lookups pending")
+        for future in pending:
+            future.cancel()
+    for tile, future in futures.items():
+        weather[tile] = future.result() if future not in pending else unavailable_weather("timed out")
+
+    return [weather[tile] for tile in tiles]
+
+def _remaining(deadline, share=1.0):
+    """Seconds (or the given share of them) until deadline; None for no deadline"""
+    return max(0, deadline - time.monotonic()) * share if deadline is not None else None
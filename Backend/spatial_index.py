@@ -0,0 +1,98 @@
+# spatial_index.py
+
+import math
+from geo import EARTH_RADIUS_KM, haversine_distance
+
+class SpatialIndex:
+    """
+    Fixed-degree grid over lat/lon for radius and nearest-neighbour queries.
+    Items are bucketed into square cells once; a query only scans the cells
+    overlapping the circle's bounding box, then filters by haversine distance.
+    """
+
+    def __init__(self, items, cell_km=5.0, location=lambda item: item["location"]):
+        self.cell_km = cell_km
+        self.cell_deg = math.degrees(cell_km / EARTH_RADIUS_KM)
+        self.lon_cells = int(math.ceil(360 / self.cell_deg))
+        self.location = location
+        self.cells = {}
+        for item in items:
+            loc = location(item)
+            if not loc:
+                continue
+            key = self._cell(loc["lat"], loc["lng"])
+            self.cells.setdefault(key, []).append(item)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.cells.values())
+
+    def _cell(self, lat, lon):
+        return (int(math.floor((lat + 90) / self.cell_deg)),
+                int(math.floor((lon + 180) / self.cell_deg)) % self.lon_cells)
+
+    def _candidates(self, lat, lon, radius_km):
+        """Yield items in the cells covering the bounding box of the circle"""
+        delta = radius_km / EARTH_RADIUS_KM
+        lat_min = max(lat - math.degrees(delta), -90)
+        lat_max = min(lat + math.degrees(delta), 90)
+        rows = range(self._cell(lat_min, 0)[0], self._cell(lat_max, 0)[0] + 1)
+
+        # Longitude span of the circle; the whole ring near the poles
+        cos_lat = math.cos(math.radians(lat))
+        if lat_min <= -90 or lat_max >= 90 or math.sin(delta) >= cos_lat:
+            cols = range(self.lon_cells)
+        else:
+            dlon = math.degrees(math.asin(math.sin(delta) / cos_lat))
+            first = int(math.floor((lon - dlon + 180) / self.cell_deg))
+            last = int(math.floor((lon + dlon + 180) / self.cell_deg))
+            if last - first + 1 >= self.lon_cells:
+                cols = range(self.lon_cells)
+            else:
+                cols = [col % self.lon_cells for col in range(first, last + 1)]
+
+        # Large radii: walking the occupied cells is cheaper than the grid
+        if len(rows) * len(cols) > len(self.cells):
+            for bucket in self.cells.values():
+                yield from bucket
+            return
+
+        for row in rows:
+            for col in cols:
+                yield from self.cells.get((row, col), ())
+
+    def within(self, lat, lon, radius_km):
+        """Return (distance_km, item) pairs within radius_km, nearest first"""
+        hits = []
+        for item in self._candidates(lat, lon, radius_km):
+            loc = self.location(item)
+            distance = haversine_distance(lat, lon, loc["lat"], loc["lng"])
+            if distance < radius_km:
+                hits.append((distance, item))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def any_within(self, lat, lon, radius_km):
+        """True if at least one item lies within radius_km"""
+        for item in self._candidates(lat, lon, radius_km):
+            loc = self.location(item)
+            if haversine_distance(lat, lon, loc["lat"], loc["lng"]) < radius_km:
+                return True
+        return False
+
+    def nearest(self, lat, lon, max_km=None):
+        """
+        Return (item, distance_km) for the closest item, or (None, None).
+        Searches outward in doubling radii so dense areas stay cheap.
+        """
+        if not self.cells:
+            return None, None
+        limit = max_km if max_km is not None else math.pi * EARTH_RADIUS_KM
+        radius = self.cell_km
+        while True:
+            radius = min(radius, limit)
+            hits = self.within(lat, lon, radius)
+            if hits:
+                return hits[0][1], hits[0][0]
+            if radius >= limit:
+                return None, None
+            radius *= 2
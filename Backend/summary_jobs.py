@@ -0,0 +1,58 @@
+# summary_jobs.py
+
+import threading
+import time
+import uuid
+from flask import current_app
+from cache import get_cache, cache_timeout
+from concurrency import submit
+from services.gemini_service import get_ai_recommendation
+
+# Job state lives in the shared cache so any worker can answer a poll;
+# the events only let waiters in the submitting process wake up early.
+NAMESPACE = "summary_jobs"
+_events = {}
+_events_lock = threading.Lock()
+
+def _run(job_id, prompt_text, request_key):
+    try:
+        state = {"status": "done", "ai_summary": get_ai_recommendation(prompt_text, request_key)}
+    except Exception as e:
+        current_app.logger.error(f"AI summary job {job_id} failed: {str(e)}")
+        state = {"status": "failed", "error": str(e)}
+    get_cache().set(NAMESPACE, job_id, state, cache_timeout(NAMESPACE))
+    with _events_lock:
+        event = _events.pop(job_id, None)
+    if event:
+        event.set()
+
+def start_summary(prompt_text, request_key=None):
+    """Queue an AI summary on the background Gemini pool and return its job id"""
+    job_id = uuid.uuid4().hex
+    with _events_lock:
+        _events[job_id] = threading.Event()
+    get_cache().set(NAMESPACE, job_id, {"status": "pending"}, cache_timeout(NAMESPACE))
+    submit("gemini", _run, job_id, prompt_text, request_key)
+    return job_id
+
+def get_summary(job_id, wait=0):
+    """
+    Return the job state: {"status": "pending" | "done" | "failed", ...},
+    or None for an unknown or expired job. With wait > 0 this long-polls
+    for up to wait seconds while the job is pending.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        hit, state = get_cache().get(NAMESPACE, job_id)
+        if not hit:
+            return None
+        remaining = deadline - time.monotonic()
+        if state["status"] != "pending" or remaining <= 0:
+            return state
+        with _events_lock:
+            event = _events.get(job_id)
+        if event:
+            event.wait(remaining)
+        else:
+            # Submitted by another worker; poll the shared cache
+            time.sleep(min(current_app.config["SUMMARY_POLL_INTERVAL"], remaining))
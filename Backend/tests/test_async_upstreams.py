@@ -0,0 +1,64 @@
+# tests/test_async_upstreams.py
+
+import asyncio
+import httpx
+import pytest
+from flask import Flask
+from config import Config
+from services.async_upstreams import AsyncUpstreams
+from services.http_client import get_breaker
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    with app.app_context():
+        yield app
+
+def half_open(upstream):
+    breaker = get_breaker(upstream)
+    breaker.failures = breaker.threshold
+    breaker.opened_at = -breaker.reset_timeout  # opened long ago: the next call is the trial
+    breaker.trial_in_flight = False
+    assert breaker.state == "half-open"
+    return breaker
+
+def upstreams(app, handler):
+    upstreams = AsyncUpstreams(app.config)
+    upstreams.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return upstreams
+
+def test_cancelled_trial_frees_the_half_open_breaker(app):
+    breaker = half_open("test-cancelled")
+
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    async def cancel_at_deadline():
+        call = asyncio.ensure_future(upstreams(app, slow).request("test-cancelled", "GET", "http://upstream"))
+        await asyncio.sleep(0.01)
+        assert breaker.trial_in_flight
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+    asyncio.run(cancel_at_deadline())
+    assert not breaker.trial_in_flight
+    assert breaker.state == "half-open"  # the next call gets to be the trial
+
+    ok = lambda request: httpx.Response(200)
+    response = asyncio.run(upstreams(app, ok).request("test-cancelled", "GET", "http://upstream"))
+    assert response.status_code == 200
+    assert breaker.state == "closed"
+
+def test_unexpected_error_in_trial_reopens_the_breaker(app):
+    breaker = half_open("test-error")
+
+    def broken(request):
+        raise httpx.DecodingError("bad body")
+
+    with pytest.raises(httpx.DecodingError):
+        asyncio.run(upstreams(app, broken).request("test-error", "GET", "http://upstream"))
+    assert not breaker.trial_in_flight
+    assert breaker.state == "open"
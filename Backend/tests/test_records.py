@@ -0,0 +1,48 @@
+# tests/test_records.py
+
+import pytest
+from records import Packed, Place, Trail, Weather, dumps, loads
+
+PHOTOS = [{"photo_reference": "abc", "width": 800}]
+REVIEWS = [{"author_name": "A", "rating": 5, "text": "Great views"}]
+
+def assert_same(rebuilt, place):
+    assert type(rebuilt) is type(place)
+    assert rebuilt.to_dict() == place.to_dict()
+    assert rebuilt.source == place.source
+    assert hasattr(rebuilt, "drive") == hasattr(place, "drive")
+
+@pytest.mark.parametrize("source", ["google_places", "campsite_api"])
+def test_place_round_trip(source):
+    place = Place("p1", "Lake Camp", address="1 Shore Rd", lat=38.5, lng=-109.5, rating=4.5,
+                  is_open=True, photos=PHOTOS, website="https://example.com", phone="555",
+                  amenities=["fishing"], source=source)
+    place.drive = {"distance": 12000, "duration": 900}
+    rebuilt = loads(dumps(place))
+    assert_same(rebuilt, place)
+    assert rebuilt.photos == PHOTOS
+    assert rebuilt.amenities == ["fishing"] and rebuilt.drive == place.drive
+
+def test_place_without_optional_fields_round_trip():
+    place = Place("p2", "Dry Camp", source="catalog")
+    rebuilt = loads(dumps(place))
+    assert_same(rebuilt, place)
+    assert "amenities" not in rebuilt and "drive" not in rebuilt
+
+def test_trail_round_trip():
+    trail = Trail("t1", "Ridge Trail", reviews=REVIEWS, lat=38.6, lng=-109.4, photos=PHOTOS,
+                  source="catalog")
+    rebuilt = loads(dumps(trail))
+    assert_same(rebuilt, trail)
+    assert rebuilt.reviews == REVIEWS
+    assert isinstance(rebuilt.packed_reviews, Packed)
+
+def test_records_nested_in_cache_values_round_trip():
+    weather = Weather(temp=20, description="clear", clouds=0, rain=0, humidity=30, wind_speed=2, timestamp=1)
+    value = {"campsites": [Place("p3", "Camp", source="campsite_api")], "weather": [weather]}
+    rebuilt = loads(dumps(value))
+    assert rebuilt["campsites"][0].source == "campsite_api"
+    assert rebuilt["weather"][0].to_dict() == weather.to_dict()
+
+def test_source_stays_out_of_the_json_shape():
+    assert "source" not in Place("p4", "Camp", source="campsite_api").to_dict()
@@ -0,0 +1,97 @@
+# tests/test_scoring.py
+
+import itertools
+import numpy as np
+import pytest
+from geo import haversine_distance
+from records import LightPollution, Place, Weather
+from scoring import campsite_columns, drive_minutes_column, rank, score_batch, score_site
+
+ORIGIN = (38.57, -109.55)
+
+# Boundary and missing values for every input score_site looks at
+TEMPS = [None, 0, 14.9, 15, 25, 25.1]
+CLOUDS = [None, 0, 29, 30]
+RAIN = [None, 0, 1.5]
+LEVELS = [5, 6, 7, 8, 10]
+OFFSETS = [0.0, 0.3]  # degrees from the origin; 0 is a zero distance
+DRIVES = [None, 0, 1800]  # seconds
+TRAILS = [False, True]
+AMENITIES = [None, ["fishing"]]
+OPEN = [None, True, False]
+COMMUNITY = [None, {"count": 2, "mean": 5.0}, {"count": 3, "mean": 4.5}, {"count": 10, "mean": 1.0}]
+
+PREFERENCES = [
+    {},
+    {"prefers_fishing": True, "prefers_hiking": True, "prefers_solitude": True}
+]
+
+def make_cases():
+    """One campsite per combination, each varying a few inputs at a time"""
+    cases = []
+    for i, (temp, clouds, rain) in enumerate(itertools.product(TEMPS, CLOUDS, RAIN)):
+        cases.append(dict(
+            temp=temp, clouds=clouds, rain=rain,
+            level=LEVELS[i % len(LEVELS)],
+            offset=OFFSETS[i % len(OFFSETS)],
+            drive=DRIVES[i % len(DRIVES)],
+            near_trail=TRAILS[i % len(TRAILS)],
+            amenities=AMENITIES[i % len(AMENITIES)],
+            is_open=OPEN[i % len(OPEN)],
+            community=COMMUNITY[i % len(COMMUNITY)]
+        ))
+    return cases
+
+def build(cases):
+    campsites, weather, light_pollution, drive_times, community = [], [], [], [], {}
+    for i, case in enumerate(cases):
+        name = f"site-{i}"
+        campsites.append(Place(
+            place_id=name, name=name,
+            lat=ORIGIN[0] + case["offset"], lng=ORIGIN[1] + case["offset"],
+            is_open=case["is_open"], amenities=case["amenities"]
+        ))
+        weather.append(Weather(temp=case["temp"], description="", clouds=case["clouds"], rain=case["rain"],
+                               humidity=None, wind_speed=None, timestamp=0))
+        light_pollution.append(LightPollution(level=case["level"], bortle_scale=None, description="", timestamp=0))
+        drive_times.append({"distance": 0, "duration": case["drive"]} if case["drive"] is not None else None)
+        if case["community"] is not None:
+            community[name] = case["community"]
+    return campsites, weather, light_pollution, drive_times, community
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+def test_score_batch_matches_score_site(preferences):
+    cases = make_cases()
+    campsites, weather, light_pollution, drive_times, community = build(cases)
+    near_trail = np.array([case["near_trail"] for case in cases], dtype=bool)
+
+    columns = campsite_columns(campsites, weather, light_pollution, community)
+    scores, distances = score_batch(*ORIGIN, columns, near_trail, preferences,
+                                    drive_minutes_column(drive_times))
+
+    for i, case in enumerate(cases):
+        site = campsites[i]
+        distance = haversine_distance(*ORIGIN, site.lat, site.lng)
+        drive_minutes = case["drive"] / 60 if case["drive"] is not None else None
+        expected = score_site(site, weather[i], light_pollution[i], distance, case["near_trail"],
+                              preferences, community.get(site.name), drive_minutes)
+        assert distances[i] == pytest.approx(distance, abs=1e-9)
+        assert scores[i] == pytest.approx(expected, abs=1e-9), case
+
+def test_zero_distance_without_drive_time_costs_nothing():
+    campsites, weather, light_pollution, drive_times, community = build([dict(
+        temp=None, clouds=None, rain=None, level=5, offset=0.0, drive=None,
+        near_trail=False, amenities=None, is_open=True, community=None
+    )])
+    columns = campsite_columns(campsites, weather, light_pollution, community)
+    scores, distances = score_batch(*ORIGIN, columns, np.array([False]), {}, drive_minutes_column(drive_times))
+    assert distances[0] == 0
+    assert scores[0] == 11  # base 10, plus 1 for no rain
+
+def test_rank_orders_best_first_and_keeps_ties_in_input_order():
+    scores = np.array([3.0, 7.5, 3.0, -1.0, 7.5, 9.0, 3.0])
+    expected = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    assert list(rank(scores)) == expected == [5, 1, 4, 0, 2, 6, 3]
+
+def test_rank_empty():
+    assert list(rank(np.array([]))) == []
@@ -78,6 +78,35 @@ export const getRecommendations = async (userId) => {
       user_id: userId,
       lat: position.coords.latitude,
       lon: position.coords.longitude,
+      compact: true,
+    });
+    return response;
+  } catch (error) {
+    throw error;
+  }
+};
+
+// Rescore the candidates of an earlier recommendations response for new
+// preferences (or a nearby origin) without refetching anything
+export const rerankRecommendations = async (candidateSet, userId, preferences = {}) => {
+  try {
+    const response = await api.post("/recommendations/rerank", {
+      candidate_set: candidateSet,
+      user_id: userId,
+      preferences,
+      compact: true,
+    });
+    return response;
+  } catch (error) {
+    throw error;
+  }
+};
+
+// Long-poll the background AI summary for a recommendations request
+export const getRecommendationSummary = async (jobId, wait = 15) => {
+  try {
+    const response = await api.get(`/recommendations/summary/${jobId}`, {
+      params: { wait },
     });
     return response;
   } catch (error) {
@@ -5,6 +5,9 @@ import Profile from "./Profile";
 
 function Dashboard({ user, setUser }) {
   const [view, setView] = useState("recommendations");
+  // The last recommendations' candidates, re-ranked when preferences change
+  const [candidateSet, setCandidateSet] = useState(null);
+  const [preferences, setPreferences] = useState(null);
 
   const handleLogout = () => {
     setUser(null);
@@ -34,8 +37,15 @@ function Dashboard({ user, setUser }) {
       </nav>
 
       <main className="dashboard-content">
-        {view === "recommendations" && <RecommendationsList user={user} />}
-        {view === "profile" && <Profile user={user} />}
+        {view === "recommendations" && (
+          <RecommendationsList
+            user={user}
+            candidateSet={candidateSet}
+            preferences={preferences}
+            onCandidateSet={setCandidateSet}
+          />
+        )}
+        {view === "profile" && <Profile user={user} onPreferencesSaved={setPreferences} />}
       </main>
     </div>
   );
@@ -2,7 +2,7 @@
 import React, { useState } from "react";
 import { updatePreferences } from "../api";
 
-function Profile({ user }) {
+function Profile({ user, onPreferencesSaved }) {
   const [fishing, setFishing] = useState(user.prefers_fishing);
   const [hiking, setHiking] = useState(user.prefers_hiking);
   const [solitude, setSolitude] = useState(user.prefers_solitude);
@@ -13,11 +13,13 @@ function Profile({ user }) {
     setIsLoading(true);
     setMessage("");
     try {
-      const res = await updatePreferences(user.id, {
+      const preferences = {
         prefers_fishing: fishing,
         prefers_hiking: hiking,
         prefers_solitude: solitude
-      });
+      };
+      await updatePreferences(user.id, preferences);
+      if (onPreferencesSaved) onPreferencesSaved(preferences);
       setMessage("Preferences updated successfully!");
     } catch (err) {
       setMessage("Error updating preferences. Please try again.");
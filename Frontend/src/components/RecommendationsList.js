@@ -1,31 +1,81 @@
-import React, { useState, useEffect } from "react";
-import { getRecommendations } from "../api";
+import React, { useState, useEffect, useRef } from "react";
+import { getRecommendations, getRecommendationSummary, rerankRecommendations } from "../api";
 
-function RecommendationsList({ user }) {
+// Each poll long-polls for up to 15s, so this gives the summary about 2 minutes
+const MAX_SUMMARY_POLLS = 8;
+
+function RecommendationsList({ user, candidateSet, preferences, onCandidateSet }) {
   const [recommendations, setRecommendations] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
   const [aiSummary, setAiSummary] = useState("");
+  // Aborted when the component unmounts (or the user changes) so that
+  // pending requests and summary polling stop touching its state
+  const run = useRef({ aborted: false });
 
   useEffect(() => {
+    const current = { aborted: false };
+    run.current = current;
     fetchRecommendations();
+    return () => {
+      current.aborted = true;
+    };
   }, [user]);
 
   const fetchRecommendations = async () => {
+    const current = run.current;
     try {
       setIsLoading(true);
       setError(null);
-      const response = await getRecommendations(user.id);
+      const response = await loadRecommendations();
+      if (current.aborted) return;
+      if (onCandidateSet) onCandidateSet(response.data.candidate_set);
       setRecommendations(response.data.results);
-      setAiSummary(response.data.ai_summary);
+      if (response.data.ai_summary) {
+        setAiSummary(response.data.ai_summary.text);
+      } else if (response.data.ai_summary_job) {
+        fetchSummary(response.data.ai_summary_job, current);
+      }
     } catch (err) {
+      if (current.aborted) return;
       if (err.message === "User denied geolocation") {
         setError("Please enable location access to get personalized recommendations.");
       } else {
         setError("Failed to load recommendations. Please try again later.");
       }
     } finally {
-      setIsLoading(false);
+      if (!current.aborted) setIsLoading(false);
+    }
+  };
+
+  // Preferences saved since the last fetch only rescore its candidates;
+  // fetch afresh once they have expired or the rerank fails otherwise
+  const loadRecommendations = async () => {
+    if (candidateSet && preferences) {
+      try {
+        return await rerankRecommendations(candidateSet, user.id, preferences);
+      } catch (err) {
+        // fall through to a full request
+      }
+    }
+    return getRecommendations(user.id);
+  };
+
+  // The AI summary arrives after the ranked results; keep polling until it is
+  // done, the component goes away or MAX_SUMMARY_POLLS runs out
+  const fetchSummary = async (jobId, current) => {
+    try {
+      let response = await getRecommendationSummary(jobId);
+      let polls = 1;
+      while (response.data.status === "pending" && polls < MAX_SUMMARY_POLLS && !current.aborted) {
+        response = await getRecommendationSummary(jobId);
+        polls += 1;
+      }
+      if (!current.aborted && response.data.status === "done") {
+        setAiSummary(response.data.ai_summary.text);
+      }
+    } catch (err) {
+      if (!current.aborted) setAiSummary("");
     }
   };
 